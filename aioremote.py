@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import asyncio
+import shlex
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+# ncluster 的 task.run 是阻塞调用, 全部放到这个线程池里执行
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='aioremote')
+
+REMOTE_DIR = "/tmp/fastmr-aio"
+_SEP = "__fastmr_aio_sep__"
+
+
+class RemoteCommandError(RuntimeError):
+    def __init__(self, task_name, cmd, returncode, detail):
+        self.task_name = task_name
+        self.cmd = cmd
+        self.returncode = returncode
+        super().__init__(f"{task_name}: '{cmd}' {detail}")
+
+
+class RemoteTimeout(RemoteCommandError):
+    def __init__(self, task_name, cmd, timeout):
+        self.timeout = timeout
+        super().__init__(task_name, cmd, None, f"timed out after {timeout} s")
+
+
+class RemoteResult:
+    def __init__(self, task_name, cmd, returncode, stdout, stderr, seconds, attempts):
+        self.task_name = task_name
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"RemoteResult({self.task_name}, rc={self.returncode}, {self.seconds:.1f} s)"
+
+
+async def _call(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+def _complete_lines(text, final):
+    """split off whole lines, keep a trailing partial line unless the command has finished"""
+    if not text:
+        return []
+    lines = text.split('\n')
+    if text.endswith('\n'):
+        lines = lines[:-1]
+    elif not final and lines:
+        lines = lines[:-1]
+    return lines
+
+
+async def _run_once(task, cmd, timeout, poll_interval, stream, printer):
+    # 轮询不单独记 span, 整条命令在 run() 里记一个
+    task_run = tracing.raw(task.run)
+    work = f"{REMOTE_DIR}/{uuid.uuid4().hex}"
+    wrapped = f"( {cmd} ) > {work}/out 2> {work}/err; echo $? > {work}/rc"
+    # setsid 让命令自成进程组, 超时/取消时整组杀掉
+    await _call(task_run, f"mkdir -p {work} && (nohup setsid sh -c {shlex.quote(wrapped)} > /dev/null 2>&1 & "
+                          f"echo $! > {work}/pid)")
+    out_lines, err_lines = [], []
+    start_time = time.time()
+    try:
+        while True:
+            probe = await _call(task_run, f"cat {work}/rc 2>/dev/null; echo {_SEP}; "
+                                          f"tail -n +{len(out_lines) + 1} {work}/out 2>/dev/null; echo {_SEP}; "
+                                          f"tail -n +{len(err_lines) + 1} {work}/err 2>/dev/null")
+            rc_text, out_text, err_text = (probe.split(f"{_SEP}\n") + ['', ''])[:3]
+            finished = rc_text.strip() != ''
+            for target, text, tag in ((out_lines, out_text, ''), (err_lines, err_text, ':err')):
+                for line in _complete_lines(text, finished):
+                    target.append(line)
+                    if stream:
+                        printer(f"[{task.name}{tag}] {line}")
+            if finished:
+                return int(rc_text.strip().split()[0]), "\n".join(out_lines), "\n".join(err_lines)
+            if timeout is not None and time.time() - start_time > timeout:
+                raise RemoteTimeout(task.name, cmd, timeout)
+            await asyncio.sleep(poll_interval)
+    except (asyncio.CancelledError, RemoteTimeout):
+        await _call(task_run, f"kill -TERM -- -$(cat {work}/pid) 2>/dev/null; sleep 1; "
+                              f"kill -KILL -- -$(cat {work}/pid) 2>/dev/null; true")
+        raise
+    finally:
+        try:
+            await _call(task_run, f"rm -rf {work}")
+        except Exception:
+            pass
+
+
+async def run(task, cmd, timeout=None, retries=0, retry_delay=5.0, poll_interval=1.0, stream=True,
+              check=True, printer=print):
+    """
+    Run cmd on one ncluster task without blocking the event loop. stdout/stderr are streamed
+    line by line with a [task] / [task:err] prefix. A command that exceeds timeout seconds is
+    killed with its whole process group; failed or timed out commands are retried `retries`
+    times. Cancelling the coroutine kills the remote command.
+    """
+    with tracing.span("run " + " ".join(cmd.split())[:76], cat='remote', lane=task.name, task=task.name, cmd=cmd[:500]) as tags:
+        result = await _run_retried(task, cmd, timeout, retries, retry_delay, poll_interval, stream, check, printer)
+        tags['attempts'] = result.attempts
+        return result
+
+
+async def _run_retried(task, cmd, timeout, retries, retry_delay, poll_interval, stream, check, printer):
+    attempt = 0
+    start_time = time.time()
+    while True:
+        attempt += 1
+        try:
+            rc, out, err = await _run_once(task, cmd, timeout, poll_interval, stream, printer)
+            if rc != 0 and check:
+                raise RemoteCommandError(task.name, cmd, rc,
+                                         f"exited with {rc}: " + " | ".join(err.splitlines()[-5:]))
+            return RemoteResult(task.name, cmd, rc, out, err, time.time() - start_time, attempt)
+        except RemoteCommandError as e:
+            if attempt > retries:
+                raise
+            printer(f"[{task.name}] attempt {attempt} failed ({e}), retry in {retry_delay} s")
+            await asyncio.sleep(retry_delay)
+
+
+async def run_all(tasks, cmd, return_exceptions=False, **kwargs):
+    """run the same command on every task concurrently"""
+    return await asyncio.gather(*[run(task, cmd, **kwargs) for task in tasks], return_exceptions=return_exceptions)
+
+
+async def run_many(commands, return_exceptions=False, **kwargs):
+    """commands: list of (task, cmd), run concurrently"""
+    return await asyncio.gather(*[run(task, cmd, **kwargs) for task, cmd in commands],
+                                return_exceptions=return_exceptions)
+
+
+def run_sync(coro):
+    """drive a coroutine from the blocking mracc code"""
+    return asyncio.run(coro)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import itertools
+import math
+import random
+import re
+
+# 默认搜索空间, 每个维度都是 size_spark 的参数
+DEFAULT_SPACE = {
+    'executor_cores': [3, 4, 5, 6, 8],
+    'mem_fraction': [0.6, 0.8, 1.0],
+    'overhead_fraction': [0.10, 0.15, 0.20, 0.30],
+    'tasks_per_core': [1, 2, 3],
+    'shuffle_partitions_per_core': [1, 2, 4, 8],
+}
+
+
+def sample_space(space, n, seed=0):
+    """n distinct points of the grid, sampled uniformly without replacement"""
+    keys = sorted(space)
+    grid = list(itertools.product(*[space[k] for k in keys]))
+    rng = random.Random(seed)
+    points = grid if len(grid) <= n else rng.sample(grid, n)
+    return [dict(zip(keys, p)) for p in points]
+
+
+def halving_budgets(max_budget, n_candidates, eta):
+    """budgets of every rung, the last rung uses max_budget"""
+    rungs = max(1, int(math.floor(math.log(max(n_candidates, 1), eta))) + 1)
+    return [max(1, int(round(max_budget * eta ** (r - rungs + 1)))) for r in range(rungs)]
+
+
+def successive_halving(candidates, evaluate, max_budget, eta=2):
+    """
+    Evaluate every candidate on a small budget, keep the best 1/eta and grow the budget
+    by eta until the last rung uses max_budget.
+    evaluate(candidate, budget) returns a cost, lower is better; failures should return inf.
+    Returns:
+    (best candidate, history list of (rung, budget, candidate, cost))
+    """
+    history = []
+    survivors = list(candidates)
+    for rung, budget in enumerate(halving_budgets(max_budget, len(candidates), eta)):
+        scored = []
+        for candidate in survivors:
+            cost = evaluate(candidate, budget)
+            history.append((rung, budget, candidate, cost))
+            scored.append((cost, candidate))
+            print(f"[autotune] rung {rung} budget {budget}: {format_candidate(candidate)} -> {cost:.1f}")
+        scored.sort(key=lambda x: x[0])
+        survivors = [c for _, c in scored[:max(1, len(scored) // eta)]]
+    return survivors[0], history
+
+
+def format_candidate(candidate):
+    return " ".join(f"{k}={v}" for k, v in sorted(candidate.items()))
+
+
+def set_ini_options(path, section, values):
+    """
+    Set keys of one ini section in place, keeping comments, order and every other section.
+    Missing keys are appended at the end of the section, a missing section at the end of the file.
+    """
+    with open(path, encoding='UTF-8') as f:
+        lines = f.read().splitlines()
+    pending = dict(values)
+    out = []
+    in_section = False
+    for line in lines:
+        header = re.match(r'^\s*\[([^\]]+)\]', line)
+        if header:
+            if in_section:
+                blank = 0
+                while out and not out[-1].strip():
+                    out.pop()
+                    blank += 1
+                out.extend(f"{k} = {v}" for k, v in pending.items())
+                out.extend([''] * blank)
+                pending = {}
+            in_section = header.group(1).strip() == section
+        elif in_section:
+            key = re.match(r'^\s*([^=:#;\s]+)\s*[=:]', line)
+            if key and key.group(1) in pending:
+                out.append(f"{key.group(1)} = {pending.pop(key.group(1))}")
+                continue
+        out.append(line)
+    if pending:
+        if not in_section:
+            out.extend(['', f"[{section}]"])
+        out.extend(f"{k} = {v}" for k, v in pending.items())
+    with open(path, 'w', encoding='UTF-8') as f:
+        f.write("\n".join(out) + "\n")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import re
+from dataclasses import dataclass, field
+
+
+def parse_properties(text):
+    """spark properties file -> ordered dict, `key value`, `key=value` and `key: value` lines"""
+    props = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', '!')):
+            continue
+        match = re.match(r'([^\s=:]+)\s*[=:]?\s*(.*)$', line)
+        props[match.group(1)] = match.group(2).strip()
+    return props
+
+
+@dataclass
+class PropertiesFile:
+    """
+    A spark properties file rendered from its template with named layers on top, later layers
+    win and a None value removes the key. Rendering never reads the previous output, so the
+    same model always gives the same file and any key can be added.
+    """
+    template: dict
+    layers: list = field(default_factory=list)
+
+    def with_layer(self, name, props):
+        return PropertiesFile(self.template, self.layers + [(name, dict(props or {}))])
+
+    def properties(self):
+        props = dict(self.template)
+        for _, layer in self.layers:
+            for key, value in layer.items():
+                if value is None:
+                    props.pop(key, None)
+                else:
+                    props[key] = str(value)
+        return props
+
+    def render(self):
+        names = ", ".join(name for name, layer in self.layers if layer)
+        lines = ["# generated by fastmr from the template" + (f" with {names}" if names else "")]
+        lines += [f"{key} {value}" for key, value in self.properties().items()]
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class ShellScript:
+    """template text (shebang, environment) followed by the commands of this run"""
+    header: str
+    commands: list
+
+    def render(self):
+        header = self.header if not self.header or self.header.endswith('\n') else self.header + '\n'
+        return header + "".join(f"{cmd}\n" for cmd in self.commands)
+
+
+def set_shell_var(text, name, value):
+    """replace the assignment of name in a sourced shell file, append it when missing"""
+    pattern = re.compile(rf'^\s*(export\s+)?{re.escape(name)}=.*$', re.M)
+    line = f'{name}="{value}"'
+    if pattern.search(text):
+        return pattern.sub(lambda m: (m.group(1) or '') + line, text)
+    return text + ('' if not text or text.endswith('\n') else '\n') + line + '\n'
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import json
+import math
+
+
+def parse_sparksql_perf(text):
+    """
+    Parse the json lines that spark-sql-perf writes to its result location, one line per
+    experiment iteration.
+    Returns:
+    list of (query name, elapsed seconds or None when the query failed)
+    """
+    samples = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        try:
+            run = json.loads(line)
+        except ValueError:
+            continue
+        for result in run.get('results', []):
+            name = result.get('name')
+            if name is None:
+                continue
+            # q1-v2.4 -> q1
+            name = name.split('-v')[0]
+            if result.get('failure'):
+                samples.append((name, None))
+                continue
+            millis = sum(result.get(k) or 0 for k in ('parsingTime', 'analysisTime', 'optimizationTime',
+                                                      'planningTime', 'executionTime'))
+            samples.append((name, millis / 1000.0))
+    return samples
+
+
+def percentile(values, pct):
+    """nearest-rank percentile of a non empty list"""
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def geomean(values):
+    values = [v for v in values if v > 0]
+    if not values:
+        return None
+    return math.exp(sum(math.log(v) for v in values) / len(values))
+
+
+def summarize(samples):
+    """
+    samples: list of (query, seconds or None)
+    Returns:
+    dict with per query median/p95/min/max/runs/failures and the geometric mean and sum of
+    the per query medians
+    """
+    by_query = {}
+    failures = {}
+    for name, seconds in samples:
+        if seconds is None:
+            failures[name] = failures.get(name, 0) + 1
+        else:
+            by_query.setdefault(name, []).append(seconds)
+    queries = {}
+    for name in sorted(set(by_query) | set(failures), key=query_sort_key):
+        times = by_query.get(name, [])
+        queries[name] = {
+            'runs': len(times),
+            'failures': failures.get(name, 0),
+            'median': median(times) if times else None,
+            'p95': percentile(times, 95) if times else None,
+            'min': min(times) if times else None,
+            'max': max(times) if times else None,
+            'samples': times,
+        }
+    medians = [q['median'] for q in queries.values() if q['median'] is not None]
+    return {
+        'queries': queries,
+        'geomean': geomean(medians),
+        'total_median': sum(medians),
+        'failed_queries': sorted((n for n, q in queries.items() if q['median'] is None), key=query_sort_key),
+    }
+
+
+def query_sort_key(name):
+    # q2 < q10 < q14a < q14b
+    digits = ''.join(c for c in name if c.isdigit())
+    return (int(digits) if digits else 0, name)
+
+
+def format_summary(summary):
+    lines = [f"{'query':<10}{'runs':>6}{'median':>10}{'p95':>10}{'min':>10}{'max':>10}"]
+    for name, q in summary['queries'].items():
+        if q['median'] is None:
+            lines.append(f"{name:<10}{q['runs']:>6}{'FAILED':>10}")
+            continue
+        lines.append(f"{name:<10}{q['runs']:>6}{q['median']:>10.2f}{q['p95']:>10.2f}{q['min']:>10.2f}{q['max']:>10.2f}")
+    if summary['geomean'] is not None:
+        lines.append(f"geomean of medians {summary['geomean']:.2f} s, sum of medians {summary['total_median']:.1f} s")
+    return "\n".join(lines) + "\n"
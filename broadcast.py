@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from uploadcache import file_hash
+
+SSH_OPTS = "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR"
+
+
+def remote_hash(task, path):
+    out = task.run(f"sha256sum {path} 2>/dev/null || true").split()
+    return out[0] if out else None
+
+
+def peer_copy(src, dst, path):
+    """copy path from task src to the same path on task dst over the private network"""
+    ip = dst.instance.private_ip()
+    src.run(f"ssh {SSH_OPTS} {ip} mkdir -p {os.path.dirname(path)} && "
+            f"scp -q {SSH_OPTS} {path} {ip}:{path}")
+
+
+def broadcast_file(tasks, local_path, remote_path, mode='tree', checksum=None, max_workers=32):
+    """
+    Upload local_path once to tasks[0] and fan it out to the other tasks.
+    mode 'tree': binomial tree, every node that holds a verified copy forwards it in the
+                 next round, so N nodes are covered in ceil(log2(N)) rounds.
+    mode 'star': tasks[0] pushes to every node (needs ssh from the master only).
+    Every copy is verified with sha256; a copy that fails is retried once from tasks[0].
+    Returns:
+    dict task name -> exception for every task that did not end up with a verified copy
+    """
+    assert mode in ('tree', 'star'), f"unknown broadcast mode {mode}"
+    checksum = checksum or file_hash(local_path)
+    root = tasks[0]
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))))
+    failures = {}
+    try:
+        # 已经有正确副本的节点直接跳过, 重复部署时不会再传
+        hashes = list(pool.map(lambda t: remote_hash(t, remote_path), tasks))
+        if hashes[0] != checksum:
+            root.run(f"mkdir -p {os.path.dirname(remote_path)}")
+            root.upload(local_path, remote_path)
+            if remote_hash(root, remote_path) != checksum:
+                raise IOError(f"checksum mismatch for {remote_path} on {root.name}")
+        holders = [root] + [t for t, h in zip(tasks[1:], hashes[1:]) if h == checksum]
+        missing = [t for t, h in zip(tasks[1:], hashes[1:]) if h != checksum]
+
+        def send(pair):
+            src, dst = pair
+            try:
+                peer_copy(src, dst, remote_path)
+                if remote_hash(dst, remote_path) == checksum:
+                    return None
+            except Exception:
+                if src is root:
+                    raise
+            # 失败的节点再从 master 传一次
+            peer_copy(root, dst, remote_path)
+            if remote_hash(dst, remote_path) != checksum:
+                raise IOError(f"checksum mismatch for {remote_path} on {dst.name}")
+            return None
+
+        while missing:
+            if mode == 'tree':
+                batch, missing = missing[:len(holders)], missing[len(holders):]
+                pairs = list(zip(holders, batch))
+            else:
+                batch, missing = missing, []
+                pairs = [(root, dst) for dst in batch]
+            futures = [(dst, pool.submit(send, pair)) for dst, pair in zip(batch, pairs)]
+            for dst, future in futures:
+                try:
+                    future.result()
+                    holders.append(dst)
+                except Exception as e:
+                    failures[dst.name] = e
+    finally:
+        pool.shutdown()
+    print(f"broadcast {os.path.basename(local_path)} to {len(tasks) - len(failures)}/{len(tasks)} tasks ({mode})")
+    return failures
+
+
+def install_cmd(remote_path, pkg_format, path):
+    if pkg_format == '.rpm':
+        return f"rpm -ivh --replacepkgs {remote_path}"
+    if pkg_format in ('.tar.gz', '.tgz'):
+        return f"mkdir -p {path} && tar -xzf {remote_path} -C {path}"
+    raise ValueError(f"unsupported package format {pkg_format}")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import csv
+import os
+import re
+
+PRICES_CSV = "ecsprices.csv"
+RESOURCES_CSV = "ecsresource.csv"
+HOURS_PER_MONTH = 730
+
+# 列名去掉空格/下划线/括号并转小写后匹配, 控制台导出的表头中英文都有
+_ALIASES = {
+    'instance_type': ('instancetype', 'instancetypeid', 'type', 'instance', '实例规格', '规格'),
+    'family': ('instancetypefamily', 'family', '规格族'),
+    'vcpu': ('vcpu', 'vcpus', 'cpu', 'cpucorecount', 'cores', 'cpu核数'),
+    'memory_gb': ('memory', 'memorygb', 'memorygib', 'memorysize', 'mem', '内存', '内存gib', '内存gb'),
+    'price_hour': ('price', 'hourprice', 'pricehour', 'priceperhour', 'tradeprice', 'hourly', '按量价格', '价格'),
+    'price_month': ('monthprice', 'pricemonth', 'pricepermonth', 'monthly', '包月价格'),
+    'region': ('region', 'regionid', '地域'),
+}
+_NUMBER = re.compile(r'-?\d+(\.\d+)?')
+
+
+def _normalize(header):
+    return re.sub(r'[\s_\-()（）/]', '', header or '').lower()
+
+
+def _columns(headers):
+    """
+    csv header -> field, exact alias matches first, then headers that start with an alias
+    (Price(CNY/hour), 内存(GiB)); a monthly column is never taken for the hourly price
+    """
+    found = {}
+    for exact in (True, False):
+        for header in headers:
+            name = _normalize(header)
+            if header in found.values():
+                continue
+            for field, aliases in _ALIASES.items():
+                if field in found or (field == 'price_hour' and ('month' in name or '月' in name)):
+                    continue
+                if name in aliases if exact else any(name.startswith(a) for a in aliases if len(a) > 2):
+                    found[field] = header
+                    break
+    return found
+
+
+def _number(value):
+    match = _NUMBER.search(str(value or '').replace(',', ''))
+    return float(match.group(0)) if match else None
+
+
+def read_csv(path):
+    """rows of a price or resource export with the known columns as fields, the raw row under 'raw'"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = _columns(reader.fieldnames or [])
+        assert 'instance_type' in columns, f"{path}: no instance type column in {reader.fieldnames}"
+        rows = []
+        for raw in reader:
+            row = {'raw': {k: v for k, v in raw.items() if k}}
+            for field, header in columns.items():
+                value = (raw.get(header) or '').strip()
+                row[field] = value if field in ('instance_type', 'family', 'region') else _number(value)
+            if row['instance_type']:
+                rows.append(row)
+        return rows
+
+
+class Catalog:
+    """instance type -> merged resource and price entry, indexed by family and by vcpu"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.by_family = {}
+        for entry in entries.values():
+            self.by_family.setdefault(entry['family'], []).append(entry)
+        for members in self.by_family.values():
+            members.sort(key=lambda e: (e['vcpu'] or 0, e['memory_gb'] or 0))
+        self.by_vcpu = sorted(entries.values(),
+                              key=lambda e: (e['vcpu'] or 0, e['memory_gb'] or 0, e['instance_type']))
+
+    @classmethod
+    def load(cls, resource_dir, region=None):
+        """
+        Merge ecsresource.csv and ecsprices.csv of resource_dir. Prices are per node and hour, a
+        monthly price is spread over HOURS_PER_MONTH. Rows of other regions are skipped when
+        region is given, otherwise the cheapest region counts.
+        """
+        entries = {}
+
+        def entry(instance_type):
+            return entries.setdefault(instance_type, {'instance_type': instance_type,
+                                                      'family': instance_type.rsplit('.', 1)[0],
+                                                      'vcpu': None, 'memory_gb': None, 'price_hour': None,
+                                                      'region': None, 'resource': {}, 'price': {}})
+
+        for name, kind in ((RESOURCES_CSV, 'resource'), (PRICES_CSV, 'price')):
+            path = os.path.join(resource_dir, name)
+            if not os.path.exists(path):
+                continue
+            for row in read_csv(path):
+                if region and row.get('region') and row['region'] != region:
+                    continue
+                e = entry(row['instance_type'])
+                if row.get('family'):
+                    e['family'] = row['family']
+                for field in ('vcpu', 'memory_gb'):
+                    if row.get(field) is not None and e[field] is None:
+                        e[field] = int(row[field]) if field == 'vcpu' else row[field]
+                price = row.get('price_hour')
+                if price is None and row.get('price_month') is not None:
+                    price = row['price_month'] / HOURS_PER_MONTH
+                if kind == 'price' and price is not None and (e['price_hour'] is None or price < e['price_hour']):
+                    e['price_hour'] = price
+                    e['region'] = row.get('region')
+                    e['price'] = row['raw']
+                elif kind == 'resource' and not e['resource']:
+                    e['resource'] = row['raw']
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, instance_type):
+        return self.entries.get(instance_type)
+
+    def family(self, family):
+        return list(self.by_family.get(family, []))
+
+    def find(self, min_vcpu=0, min_mem_gb=0, families=None, priced=True):
+        """entries with at least min_vcpu and min_mem_gb, smallest first"""
+        return [e for e in self.by_vcpu
+                if (e['vcpu'] or 0) >= min_vcpu and (e['memory_gb'] or 0) >= min_mem_gb
+                and (not families or e['family'] in families)
+                and (not priced or e['price_hour'] is not None)]
+
+
+def format_entry(entry):
+    if entry is None:
+        return "not in the catalog\n"
+    price = f"{entry['price_hour']:.4f}/h" if entry['price_hour'] is not None else "no price"
+    lines = [f"{entry['instance_type']}  {entry['vcpu']} vcpu  {entry['memory_gb']} GiB  {price}"
+             + (f"  {entry['region']}" if entry['region'] else "")]
+    for kind in ('price', 'resource'):
+        if entry[kind]:
+            lines.append(f"  {kind}: " + ", ".join(f"{k}={v}" for k, v in entry[kind].items()))
+    return "\n".join(lines) + "\n"
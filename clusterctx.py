@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import os
+from configparser import ConfigParser
+
+
+class ClusterContext:
+    """
+    Everything that identifies one cluster run: its ini, the fastmr checkout the ini lives in
+    (<fastmr>/<dir>/<ini>) and the cluster name. All outputs go below target_dir, so
+    contexts with different cluster names never share files.
+    """
+
+    def __init__(self, conf_path):
+        self.conf_path = os.path.abspath(conf_path)
+        self.fastmr_path = os.path.abspath(f'{self.conf_path}/../..')
+        self.cluster_name = self.config()['ncluster']['clustername']
+
+    def config(self):
+        config = ConfigParser()
+        config.read(self.conf_path, encoding='UTF-8')
+        return config
+
+    @property
+    def target_dir(self):
+        return self.fastmr_path + "/target/" + self.cluster_name
+
+    def __repr__(self):
+        return f"ClusterContext({self.cluster_name}, {self.conf_path})"
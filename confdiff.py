@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import shlex
+
+HDFS_DAEMONS = ('namenode', 'datanode')
+YARN_DAEMONS = ('resourcemanager', 'nodemanager')
+HADOOP_DAEMONS = HDFS_DAEMONS + YARN_DAEMONS
+
+# (部署分组, 文件名) -> 需要重启的服务, queues 只刷新队列, history 是 spark history server
+AFFECTS = {
+    ('hadoop', 'core-site.xml'): HADOOP_DAEMONS,
+    ('hadoop', 'hadoop-env.sh'): HADOOP_DAEMONS,
+    ('hadoop', 'log4j.properties'): HADOOP_DAEMONS,
+    ('hadoop', 'hdfs-site.xml'): HDFS_DAEMONS,
+    ('hadoop', 'yarn-site.xml'): YARN_DAEMONS,
+    ('hadoop', 'yarn-env.sh'): YARN_DAEMONS,
+    ('hadoop', 'workers'): ('datanode', 'nodemanager'),
+    ('hadoop', 'slaves'): ('datanode', 'nodemanager'),
+    ('hadoop', 'capacity-scheduler.xml'): ('queues',),
+    ('hadoop', 'fair-scheduler.xml'): ('queues',),
+    # 只有扩缩容时才有内容, 由 scale_in 自己 refreshNodes
+    ('hadoop', 'excludes'): (),
+    # 作业提交时才读, 不用重启
+    ('hadoop', 'mapred-site.xml'): (),
+    ('spark', 'spark-defaults.conf'): ('history',),
+    ('hive', 'hive-site.xml'): (),
+    ('system', 'hosts'): (),
+}
+
+
+def hashes_cmd(remote_files):
+    """sha256 of the deployed files, missing files are simply not listed"""
+    return "sha256sum -- " + " ".join(shlex.quote(f) for f in remote_files) + " 2>/dev/null; true"
+
+
+def parse_sha256sum(text):
+    hashes = {}
+    for line in text.splitlines():
+        fields = line.strip().split(None, 1)
+        if len(fields) == 2 and len(fields[0]) == 64:
+            hashes[fields[1].lstrip('*')] = fields[0]
+    return hashes
+
+
+def changed(deployment, local_hashes, remote_hashes):
+    """
+    deployment: list of (group, local file, remote file)
+    Returns:
+    the entries whose remote copy is missing or differs from the local file
+    """
+    return [(group, local, remote) for group, local, remote in deployment
+            if remote_hashes.get(remote) != local_hashes[local]]
+
+
+def affected(changes):
+    """services to restart or refresh for a list of changed (group, local, remote)"""
+    services = set()
+    for group, local, _ in changes:
+        name = local.replace('\\', '/').rsplit('/', 1)[-1]
+        # 不认识的 hadoop 配置文件保守处理, 全部重启
+        services.update(AFFECTS.get((group, name), HADOOP_DAEMONS if group == 'hadoop' else ()))
+    return services
+
+
+def daemon_cmd(hadoop_version, daemon, action):
+    hadoop_home = f"/opt/hadoop-{hadoop_version}"
+    tool = 'hdfs' if daemon in HDFS_DAEMONS else 'yarn'
+    if int(hadoop_version.split('.')[0]) >= 3:
+        cmd = f"{hadoop_home}/bin/{tool} --daemon {action} {daemon}"
+    else:
+        script = 'hadoop-daemon.sh' if tool == 'hdfs' else 'yarn-daemon.sh'
+        cmd = f"{hadoop_home}/sbin/{script} {action} {daemon}"
+    # 没在运行的 daemon stop 会返回非 0
+    return cmd + " || true" if action == 'stop' else cmd
+
+
+def restart_cmd(hadoop_version, daemon):
+    return f"{daemon_cmd(hadoop_version, daemon, 'stop')}; {daemon_cmd(hadoop_version, daemon, 'start')}"
+
+
+def batches(items, size):
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import math
+
+# 只有一种数据规模或一种集群规模时无法拟合对应的指数, 用经验值
+DEFAULT_SF_EXPONENT = 1.0
+DEFAULT_CORE_EXPONENT = 0.85
+
+
+def observations(runs, catalog):
+    """
+    runs: resultstore.run_totals output
+    Returns:
+    (list of dict instance_type, machines, cores, scale_factor, seconds, notes)
+    """
+    points, notes = [], []
+    for run in runs:
+        entry = catalog.get(run['instance_type'] or '')
+        if entry is None or not entry['vcpu']:
+            notes.append(f"run {run['id']}: {run['instance_type']} not in the catalog, skipped")
+            continue
+        try:
+            scale_factor = float(run['scale_factor'])
+        except (TypeError, ValueError):
+            notes.append(f"run {run['id']}: scale factor {run['scale_factor']} is not a number, skipped")
+            continue
+        if not run['seconds'] or not run['machines'] or scale_factor <= 0:
+            continue
+        points.append({'instance_type': run['instance_type'], 'machines': run['machines'],
+                       'cores': entry['vcpu'] * run['machines'], 'scale_factor': scale_factor,
+                       'seconds': run['seconds']})
+    return points, notes
+
+
+def _solve(a, b):
+    """gaussian elimination for the small normal equations"""
+    n = len(b)
+    m = [row[:] + [v] for row, v in zip(a, b)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            raise ValueError("singular system")
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                factor = m[r][col] / m[col][col]
+                m[r] = [x - factor * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+
+def fit(points):
+    """
+    log(seconds) = alpha + beta * log(scale factor) - gamma * log(total vcpu) + offset(type)
+
+    beta and gamma are least squares fits when the runs cover more than one scale factor
+    and cluster size, otherwise DEFAULT_SF_EXPONENT / DEFAULT_CORE_EXPONENT. The per type
+    offset is the mean residual of its runs shrunk towards 0 (n / (n + 1)), so a type with
+    a single run does not fully override the cross-type fit. Types without runs get 0.
+    """
+    if not points:
+        raise ValueError("no recorded runs to fit the scaling model")
+    notes = []
+    ys = [math.log(p['seconds']) for p in points]
+    sf = [math.log(p['scale_factor']) for p in points]
+    cores = [-math.log(p['cores']) for p in points]
+    columns = {}
+    fixed = {'beta': DEFAULT_SF_EXPONENT, 'gamma': DEFAULT_CORE_EXPONENT}
+    if len(set(sf)) > 1:
+        columns['beta'] = sf
+        del fixed['beta']
+    if len(set(cores)) > 1:
+        columns['gamma'] = cores
+        del fixed['gamma']
+    y = [v - fixed.get('beta', 0) * s - fixed.get('gamma', 0) * c for v, s, c in zip(ys, sf, cores)]
+    names = ['alpha'] + list(columns)
+    x = [[1.0] + [columns[name][i] for name in columns] for i in range(len(points))]
+    distinct = len(set(zip(sf, cores)))
+    try:
+        if distinct < len(names):
+            raise ValueError(f"{distinct} distinct (scale factor, total vcpu) points for {len(names)} parameters "
+                             f"({', '.join(names)}), record runs at more scale factors or cluster sizes")
+        xtx = [[sum(row[i] * row[j] for row in x) for j in range(len(names))] for i in range(len(names))]
+        xty = [sum(row[i] * v for row, v in zip(x, y)) for i in range(len(names))]
+        params = dict(zip(names, _solve(xtx, xty)))
+    except ValueError as e:
+        # 点数不够, 或 scale factor 和核数完全相关时只拟合截距
+        notes.append(f"{e}, exponents fixed" if distinct < len(names)
+                     else "scale factor and cluster size vary together, exponents fixed")
+        fixed = {'beta': DEFAULT_SF_EXPONENT, 'gamma': DEFAULT_CORE_EXPONENT}
+        y = [v - fixed['beta'] * s - fixed['gamma'] * c for v, s, c in zip(ys, sf, cores)]
+        params = {'alpha': sum(y) / len(y)}
+        columns = {'beta': sf, 'gamma': cores}
+    params.update(fixed)
+    for name in [name for name in fixed if name not in columns]:
+        notes.append(f"{name} fixed at {fixed[name]}, the runs cover a single "
+                     + ("scale factor" if name == 'beta' else "cluster size"))
+    # 明显不合理的指数收回到合理区间
+    for name, low, high in (('beta', 0.5, 1.5), ('gamma', 0.0, 1.2)):
+        if not low <= params[name] <= high:
+            notes.append(f"{name} {params[name]:.2f} clamped to [{low}, {high}]")
+            params[name] = min(high, max(low, params[name]))
+            params['alpha'] = sum(v - params['beta'] * s - params['gamma'] * c
+                                  for v, s, c in zip(ys, sf, cores)) / len(ys)
+
+    residuals = {}
+    for p, v, s, c in zip(points, ys, sf, cores):
+        residual = v - (params['alpha'] + params['beta'] * s + params['gamma'] * c)
+        residuals.setdefault(p['instance_type'], []).append(residual)
+    offsets = {t: sum(r) / (len(r) + 1) for t, r in residuals.items()}
+    model = {'alpha': params['alpha'], 'beta': params['beta'], 'gamma': params['gamma'],
+             'offsets': offsets, 'runs': len(points), 'notes': notes}
+    model['rmse'] = math.sqrt(sum((predict_log(model, p['instance_type'], p['cores'], p['scale_factor'])
+                                   - v) ** 2 for p, v in zip(points, ys)) / len(points))
+    return model
+
+
+def predict_log(model, instance_type, cores, scale_factor):
+    return (model['alpha'] + model['beta'] * math.log(scale_factor) - model['gamma'] * math.log(cores)
+            + model['offsets'].get(instance_type, 0.0))
+
+
+def predict(model, instance_type, cores, scale_factor):
+    """predicted seconds of the benchmark"""
+    return math.exp(predict_log(model, instance_type, cores, scale_factor))
+
+
+def recommend(entries, model, scale_factor, deadline_s=None, budget=None, machines=range(2, 33), top=10):
+    """
+    Every (instance type, machine count) of the priced catalog entries. Cost is node price
+    x machines x predicted hours, throughput per cost is scale factor GB per unit of cost.
+    With a deadline the cheapest options that meet it come first, with only a budget the
+    fastest options within it, without either the best throughput per cost.
+    """
+    options = []
+    for entry in entries:
+        for n in machines:
+            seconds = predict(model, entry['instance_type'], entry['vcpu'] * n, scale_factor)
+            cost = entry['price_hour'] * n * seconds / 3600.0
+            if deadline_s is not None and seconds > deadline_s:
+                continue
+            if budget is not None and cost > budget:
+                continue
+            options.append({'instance_type': entry['instance_type'], 'machines': n, 'vcpu': entry['vcpu'],
+                            'memory_gb': entry['memory_gb'], 'price_hour': entry['price_hour'],
+                            'seconds': seconds, 'cost': cost,
+                            'gb_per_cost': scale_factor / cost if cost > 0 else float('inf'),
+                            'measured': entry['instance_type'] in model['offsets']})
+    if deadline_s is not None:
+        options.sort(key=lambda o: (o['cost'], o['seconds']))
+    elif budget is not None:
+        options.sort(key=lambda o: (o['seconds'], o['cost']))
+    else:
+        options.sort(key=lambda o: (-o['gb_per_cost'], o['seconds']))
+    return options[:top]
+
+
+def format_model(model):
+    lines = [f"log(seconds) = {model['alpha']:.3f} + {model['beta']:.3f} log(sf) - {model['gamma']:.3f} log(vcpu) "
+             f"+ type offset, {model['runs']} runs, rmse {model['rmse']:.3f} (log seconds)"]
+    for t, offset in sorted(model['offsets'].items()):
+        lines.append(f"  {t:<28}{math.exp(offset):>7.2f}x")
+    lines += [f"  {note}" for note in model['notes']]
+    return "\n".join(lines) + "\n"
+
+
+def format_recommendations(options):
+    lines = [f"{'instance type':<28}{'nodes':>6}{'vcpu':>6}{'mem GiB':>9}{'price/h':>10}{'hours':>8}{'cost':>10}"
+             f"{'GB/cost':>10}  measured"]
+    for o in options:
+        lines.append(f"{o['instance_type']:<28}{o['machines']:>6}{o['vcpu']:>6}{o['memory_gb'] or 0:>9.0f}"
+                     f"{o['price_hour']:>10.3f}{o['seconds'] / 3600:>8.2f}{o['cost']:>10.2f}{o['gb_per_cost']:>10.1f}"
+                     f"  {'yes' if o['measured'] else 'no'}")
+    return "\n".join(lines) + "\n"
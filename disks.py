@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+import json
+import re
+import shlex
+
+DISCOVER_CMD = "lsblk -J -b -o NAME,TYPE,SIZE,ROTA,MOUNTPOINT,MODEL,FSTYPE,PTTYPE"
+MOUNT_ROOT = "/mnt/disk"
+PROBE_FILE = ".fastmr_probe"
+
+# 系统盘的挂载点, 挂了这些的盘不动
+_SYSTEM_MOUNTS = ('/', '/boot', '/boot/efi', '[SWAP]')
+
+
+def _mounts(device):
+    found = [device.get('mountpoint')] if device.get('mountpoint') else []
+    for child in device.get('children') or []:
+        found += _mounts(child)
+    return found
+
+
+def _flag(value):
+    # 不同版本的 lsblk 输出 true/false 或 "1"/"0"
+    return value in (True, 1, '1', 'true')
+
+
+def parse_lsblk(text, min_size_gb=20):
+    """
+    Data disks from `lsblk -J`: whole disks that are unmounted or already mounted under
+    /mnt/disk*, never the system disk and nothing smaller than min_size_gb. An unmounted disk
+    is only taken when it is blank: no filesystem, partition table, LVM/RAID signature or
+    children, so a data disk whose mount failed after a reboot is never formatted.
+    Returns:
+    list of dict name, size_gb, rotational, model, mount (current mount point or None)
+    """
+    devices = []
+    for device in json.loads(text).get('blockdevices', []):
+        if device.get('type') != 'disk':
+            continue
+        mounts = _mounts(device)
+        if any(m in _SYSTEM_MOUNTS or m.startswith('/boot') for m in mounts):
+            continue
+        if any(not m.startswith(MOUNT_ROOT) for m in mounts):
+            print(f"skip /dev/{device['name']}, mounted at {','.join(mounts)}")
+            continue
+        size_gb = int(device.get('size') or 0) / 1024 ** 3
+        if size_gb < min_size_gb:
+            continue
+        if not mounts and (device.get('fstype') or device.get('pttype') or device.get('children')):
+            # 没挂载但已有数据, 交给人处理, 不能 mkfs
+            print(f"skip /dev/{device['name']}, not blank (fstype={device.get('fstype')}, "
+                  f"pttype={device.get('pttype')}, {len(device.get('children') or [])} children)")
+            continue
+        devices.append({'name': device['name'],
+                        'size_gb': round(size_gb, 1),
+                        'rotational': _flag(device.get('rota')),
+                        'model': (device.get('model') or '').strip(),
+                        'mount': mounts[0] if mounts else None})
+    return devices
+
+
+def assign_mounts(devices):
+    """keep /mnt/diskN of disks that are already mounted, give the others the next free N in device order"""
+    used = {d['mount'] for d in devices if d['mount']}
+    index = 1
+    for device in sorted(devices, key=lambda d: (len(d['name']), d['name'])):
+        if device['mount']:
+            device['format'] = False
+            continue
+        while f"{MOUNT_ROOT}{index}" in used:
+            index += 1
+        device['mount'] = f"{MOUNT_ROOT}{index}"
+        device['format'] = True
+        used.add(device['mount'])
+    return sorted(devices, key=lambda d: _mount_index(d['mount']))
+
+
+def _mount_index(mount):
+    digits = mount[len(MOUNT_ROOT):]
+    return int(digits) if digits.isdigit() else 0
+
+
+def mount_cmd(devices):
+    """mkfs and mount every new disk of one node in parallel, fstab entries by UUID"""
+    parts = []
+    for d in devices:
+        if not d.get('format'):
+            continue
+        dev, mount = f"/dev/{d['name']}", d['mount']
+        parts.append(f"( mkfs.ext4 -F -q -m 0 -E lazy_itable_init=1,lazy_journal_init=1 {dev} && "
+                     f"mkdir -p {mount} && mount -o noatime {dev} {mount} && "
+                     f"uuid=$(blkid -s UUID -o value {dev}) && "
+                     f"sed -i '\\# {mount} #d' /etc/fstab && "
+                     f"echo \"UUID=$uuid {mount} ext4 defaults,noatime,nofail 0 0\" >> /etc/fstab ) &")
+    check = " && ".join(f"mountpoint -q {d['mount']}" for d in devices) or "true"
+    return " ".join(parts) + f" wait; {check}"
+
+
+def probe_cmd(mounts, size_mb=1024, seconds=10):
+    """
+    One disk after another: sequential direct write and read with dd, 4k random read IOPS
+    with fio when it is installed. Prints one PROBE|mount|write|read|iops line per disk.
+    """
+    lines = []
+    for mount in mounts:
+        f = f"{mount}/{PROBE_FILE}"
+        lines.append(
+            f"w=$(LC_ALL=C dd if=/dev/zero of={f} bs=1M count={size_mb} oflag=direct conv=fsync 2>&1 | tail -n 1); "
+            f"r=$(LC_ALL=C dd if={f} of=/dev/null bs=1M iflag=direct 2>&1 | tail -n 1); "
+            f"i=$(command -v fio > /dev/null && fio --name=probe --filename={f} --rw=randread --bs=4k --direct=1 "
+            f"--ioengine=libaio --iodepth=32 --runtime={seconds} --time_based --size={size_mb}m "
+            f"--minimal 2>/dev/null | awk -F';' '{{print $8}}'); "
+            f"rm -f {f}; echo \"PROBE|{mount}|$w|$r|$i\"")
+    return "; ".join(lines) or "true"
+
+
+_DD = re.compile(r'^(\d+) bytes.*copied, ([\d.]+) s')
+
+
+def _dd_mbs(line):
+    match = _DD.match(line.strip())
+    if not match or float(match.group(2)) <= 0:
+        return None
+    return int(match.group(1)) / float(match.group(2)) / 1048576.0
+
+
+def parse_probe(text):
+    """mount -> dict seq_write_mbs, seq_read_mbs, rand_iops (None when not measured)"""
+    results = {}
+    for line in text.splitlines():
+        if not line.startswith('PROBE|'):
+            continue
+        fields = line.split('|')
+        if len(fields) != 5:
+            continue
+        _, mount, w, r, i = fields
+        results[mount] = {'seq_write_mbs': _dd_mbs(w),
+                          'seq_read_mbs': _dd_mbs(r),
+                          'rand_iops': float(i) if re.match(r'^\d+(\.\d+)?$', i.strip()) else None}
+    return results
+
+
+def aggregate(node_disks):
+    """
+    node_disks: node -> list of disks with mount and probe results
+    Per mount point the slowest node counts, a mount that is missing on a node is flagged.
+    """
+    by_mount = {}
+    for node, devices in node_disks.items():
+        for d in devices:
+            entry = by_mount.setdefault(d['mount'], {'mount': d['mount'], 'nodes': 0, 'seq_write_mbs': None,
+                                                     'seq_read_mbs': None, 'rand_iops': None,
+                                                     'rotational': False, 'size_gb': d['size_gb']})
+            entry['nodes'] += 1
+            entry['rotational'] = entry['rotational'] or d['rotational']
+            entry['size_gb'] = min(entry['size_gb'], d['size_gb'])
+            for k in ('seq_write_mbs', 'seq_read_mbs', 'rand_iops'):
+                if d.get(k) is not None:
+                    entry[k] = d[k] if entry[k] is None else min(entry[k], d[k])
+    return sorted(by_mount.values(), key=lambda e: _mount_index(e['mount']))
+
+
+def _speed(disk):
+    values = [v for v in (disk['seq_write_mbs'], disk['seq_read_mbs']) if v is not None]
+    return min(values) if values else None
+
+
+def plan_layout(disks, nodes, shuffle_fraction=0.5, max_weight=4):
+    """
+    disks: aggregate() output
+    HDFS gets every disk present on all nodes, fastest first. YARN local dirs (shuffle and
+    spill) only get disks whose sequential throughput and random IOPS reach shuffle_fraction
+    of the best disk, and a disk N times faster than the slowest shuffle disk gets N dirs
+    (capped at max_weight) because the NodeManager hands out local dirs round-robin.
+    Returns:
+    dict hdfs, yarn (lists of dirs) and notes
+    """
+    notes = []
+    usable = []
+    for d in disks:
+        if d['nodes'] != nodes:
+            notes.append(f"{d['mount']} exists on {d['nodes']}/{nodes} nodes, not used")
+        else:
+            usable.append(d)
+    ordered = sorted(usable, key=lambda d: (-(_speed(d) or 0), _mount_index(d['mount'])))
+    hdfs = [f"{d['mount']}/data/hadoop" for d in ordered]
+
+    best_speed = max([_speed(d) for d in ordered if _speed(d) is not None] or [0])
+    best_iops = max([d['rand_iops'] for d in ordered if d['rand_iops'] is not None] or [0])
+    shuffle = []
+    for d in ordered:
+        if best_speed and _speed(d) is not None and _speed(d) < shuffle_fraction * best_speed:
+            notes.append(f"{d['mount']} kept out of yarn local dirs: {_speed(d):.0f} MB/s "
+                         f"< {shuffle_fraction:.0%} of {best_speed:.0f} MB/s")
+            continue
+        if best_iops and d['rand_iops'] is not None and d['rand_iops'] < shuffle_fraction * best_iops:
+            notes.append(f"{d['mount']} kept out of yarn local dirs: {d['rand_iops']:.0f} IOPS "
+                         f"< {shuffle_fraction:.0%} of {best_iops:.0f} IOPS")
+            continue
+        shuffle.append(d)
+    if not shuffle:
+        shuffle = ordered
+
+    slowest = min([_speed(d) for d in shuffle if _speed(d)] or [0])
+    yarn = []
+    for d in shuffle:
+        weight = 1
+        if slowest and _speed(d):
+            weight = max(1, min(max_weight, int(round(_speed(d) / slowest))))
+        yarn += [f"{d['mount']}/data/nmlocaldir"] + [f"{d['mount']}/data/nmlocaldir{k}" for k in range(2, weight + 1)]
+        if weight > 1:
+            notes.append(f"{d['mount']} gets {weight} yarn local dirs")
+    return {'hdfs': hdfs, 'yarn': yarn, 'notes': notes}
+
+
+def format_disks(disks):
+    def fmt(v, spec):
+        return format(v, spec) if v is not None else "-"
+
+    lines = [f"{'mount':<14}{'nodes':>6}{'size GB':>9}{'rota':>6}{'write MB/s':>12}{'read MB/s':>11}{'rand IOPS':>11}"]
+    for d in disks:
+        lines.append(f"{d['mount']:<14}{d['nodes']:>6}{d['size_gb']:>9.0f}{'y' if d['rotational'] else 'n':>6}"
+                     f"{fmt(d['seq_write_mbs'], '.0f'):>12}{fmt(d['seq_read_mbs'], '.0f'):>11}"
+                     f"{fmt(d['rand_iops'], '.0f'):>11}")
+    return "\n".join(lines) + "\n"
+
+
+def clean_cmd(dirs):
+    return "rm -rf " + " ".join(shlex.quote(d) for d in dirs)
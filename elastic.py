@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import shlex
+
+# dfs.hosts.exclude 和 yarn.resourcemanager.nodes.exclude-path 指向的文件, 在 hadoop 配置目录下
+EXCLUDES_FILE = "excludes"
+
+
+def parse_workers(text):
+    """hostnames of a hadoop workers/slaves file, comments and blank lines skipped"""
+    hosts = []
+    for line in text.splitlines():
+        host = line.split('#', 1)[0].strip()
+        if host and host not in hosts:
+            hosts.append(host)
+    return hosts
+
+
+def plan(deployed_hosts, target_hosts):
+    """
+    deployed_hosts: workers file on the master, target_hosts: hostnames of the tasks, master first
+    Returns:
+    (hostnames to add, hostnames to decommission)
+    """
+    added = [h for h in target_hosts if h not in deployed_hosts]
+    removed = [h for h in deployed_hosts if h not in target_hosts]
+    assert target_hosts and target_hosts[0] not in added, \
+        f"master {target_hosts[0] if target_hosts else None} is not part of the deployed cluster"
+    return added, removed
+
+
+def excludes_text(hosts):
+    return "".join(f"{h}\n" for h in hosts)
+
+
+def exclude_props(hadoop_version):
+    """hdfs-site / yarn-site properties that make the NameNode and ResourceManager read the excludes file"""
+    path = f"/opt/hadoop-{hadoop_version}/etc/hadoop/{EXCLUDES_FILE}"
+    return {'hdfs-site.xml': {'dfs.hosts.exclude': path},
+            'yarn-site.xml': {'yarn.resourcemanager.nodes.exclude-path': path}}
+
+
+def refresh_cmds(hadoop_version, graceful_seconds=None):
+    """
+    Re-read the excludes file. With graceful_seconds the YARN side waits for running
+    containers on decommissioning NodeManagers (hadoop 3), hadoop 2 decommissions at once.
+    """
+    cmds = ["hdfs dfsadmin -refreshNodes"]
+    if graceful_seconds and int(hadoop_version.split('.')[0]) >= 3:
+        cmds.append(f"yarn rmadmin -refreshNodes -g {int(graceful_seconds)} -client")
+    else:
+        cmds.append("yarn rmadmin -refreshNodes")
+    return cmds
+
+
+def on_host(host, cmd):
+    """run cmd on another node from the master, the nodes already trust each other for start-dfs.sh"""
+    return f"ssh -o StrictHostKeyChecking=no -o BatchMode=yes {shlex.quote(host)} {shlex.quote(cmd)}"
+
+
+def parse_decommission(report):
+    """`hdfs dfsadmin -report` -> hostname -> decommission status (Normal, Decommission in progress, Decommissioned)"""
+    status = {}
+    host = None
+    for line in report.splitlines():
+        line = line.strip()
+        if line.startswith('Hostname:'):
+            host = line.split(':', 1)[1].strip()
+        elif line.startswith('Decommission Status') and host:
+            status[host] = line.split(':', 1)[1].strip()
+            host = None
+    return status
+
+
+def pending(status, hosts):
+    """hosts that are not yet fully decommissioned, a host the NameNode does not list any more is done"""
+    return [h for h in hosts if h in status and status[h] != 'Decommissioned']
@@ -1,31 +1,162 @@
+import json
 import os
 import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from configparser import ConfigParser
+from contextlib import redirect_stderr, redirect_stdout
 
 import mracc
+import tracing
+from clusterctx import ClusterContext
+
+
+def results_main(argv):
+    """
+    python3 fastmr.py runs config.ini [benchmark]
+    python3 fastmr.py compare config.ini <base run id> <new run id> [noise]
+    python3 fastmr.py recommend config.ini <scale factor> [deadline=<hours>] [budget=<cost>]
+    """
+    mracc.def_conf(os.path.abspath(argv[1]))
+    if argv[0] == 'runs':
+        mracc.show_runs(argv[2] if len(argv) > 2 else None)
+    elif argv[0] == 'recommend':
+        limits = dict(arg.split('=', 1) for arg in argv[3:])
+        mracc.recommend_cluster(argv[2],
+                                deadline_hours=float(limits['deadline']) if 'deadline' in limits else None,
+                                budget=float(limits['budget']) if 'budget' in limits else None)
+    else:
+        noise = float(argv[4]) if len(argv) > 4 else 0.05
+        mracc.compare_runs(int(argv[2]), int(argv[3]), noise=noise)
+
+
+def run_pipeline(conf_path):
+    """
+    Create or connect the cluster of one ini, deploy it and run its benchmarks.
+    Returns:
+    dict (benchmark, scale factor) -> (run id, seconds) of run_tpc, the sweep points of run_sweep
+    """
+    config = ConfigParser()
+    config.read(conf_path, encoding='UTF-8')
+    skip_setup = config.getboolean('cmd', 'skip_setup')
+    mracc.def_conf(conf_path)
+    # batch 模式下进程池会复用 worker, 清掉前一个集群留下的 span
+    tracing.reset()
+    try:
+        # 创建集群
+        engine = config['engine']['model']
+        if engine == 'CDT':
+            job = mracc.create_cluster()
+        if engine == 'DT':
+            job = mracc.control_cluster()
+        # 本机模拟的节点, 不需要真实机器
+        if engine == 'LOCAL':
+            job = mracc.local_cluster()
+        # 扫描多个集群规模和数据规模, 部署和扩容都由 run_sweep 负责
+        if mracc.sweep_enabled():
+            return mracc.run_sweep(job)
+        # 部署环境, reconfigure 只推送改动的配置并重启受影响的服务, 保留 hdfs 数据
+        if config.has_option('cmd', 'reconfigure') and config.getboolean('cmd', 'reconfigure'):
+            mracc.reconfigure(job)
+        # 扩缩容到 [scale] machines, 只部署新节点, 下线的节点先 decommission
+        elif config.has_option('scale', 'machines'):
+            mracc.scale_cluster(job)
+        elif not skip_setup:
+            mracc.setup_pkg(job)
+            mracc.setup_env(job)
+        # 自动调参, 结果写回 [spark]
+        if config.has_option('autotune', 'run') and config.getboolean('autotune', 'run'):
+            mracc.autotune_spark(job)
+        # 运行测试
+        return mracc.run_tpc(job)
+    finally:
+        # 失败时也导出, 方便看卡在哪一步
+        mracc.export_trace()
+
+
+def batch_worker(conf_path):
+    """one ini in its own process, its output goes to target/<cluster>.log"""
+    ctx = ClusterContext(conf_path)
+    log_file = f"{ctx.fastmr_path}/target/{ctx.cluster_name}.log"
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    start_time = time.time()
+    error, points = None, []
+    with open(log_file, 'w', encoding='utf-8') as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            results = run_pipeline(ctx.conf_path)
+            if isinstance(results, dict):
+                points = [{'benchmark': benchmark, 'scale_factor': sf, 'run_id': run_id, 'seconds': seconds}
+                          for (benchmark, sf), (run_id, seconds) in results.items()]
+            elif results:
+                points = results
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+    return {'cluster': ctx.cluster_name, 'conf': ctx.conf_path, 'log': log_file, 'error': error,
+            'seconds': time.time() - start_time, 'points': points}
+
+
+def format_batch(summaries):
+    lines = [f"{'cluster':<24}{'status':<8}{'minutes':>9}  benchmark results"]
+    for s in summaries:
+        status = "FAILED" if s['error'] else "ok"
+        lines.append(f"{s['cluster']:<24}{status:<8}{s['seconds'] / 60:>9.1f}  {s['log']}")
+        if s['error']:
+            lines.append(f"{'':<24}{s['error']}")
+        for p in s['points']:
+            seconds = f"{p['seconds']:.1f} s" if p.get('seconds') is not None else "not executed"
+            nodes = f" on {p['machines']} nodes" if 'machines' in p else ""
+            lines.append(f"{'':<24}{p['benchmark']} sf {p['scale_factor']}{nodes}: {seconds}, run {p['run_id']}")
+    return "\n".join(lines) + "\n"
+
+
+def batch_main(argv):
+    """
+    python3 fastmr.py batch a.ini b.ini ... [workers=<n>]
+    Every ini runs its whole pipeline in its own process, outputs stay in its target/<cluster>.
+    """
+    options = dict(arg.split('=', 1) for arg in argv if '=' in arg)
+    contexts = [ClusterContext(arg) for arg in argv if '=' not in arg]
+    names = [ctx.cluster_name for ctx in contexts]
+    duplicated = sorted({n for n in names if names.count(n) > 1})
+    assert not duplicated, f"clustername must differ between the batch ini files, shared: {duplicated}"
+    workers = int(options.get('workers', len(contexts)))
+
+    print(f"batch: {len(contexts)} clusters, {workers} at a time")
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(batch_worker, ctx.conf_path): ctx for ctx in contexts}
+        for future in as_completed(futures):
+            summary = future.result()
+            print(f"{summary['cluster']} {'FAILED' if summary['error'] else 'done'} "
+                  f"in {summary['seconds'] / 60:.1f} min, log {summary['log']}")
+            summaries.append(summary)
+    summaries.sort(key=lambda s: names.index(s['cluster']))
+
+    text = format_batch(summaries)
+    summary_file = f"{contexts[0].fastmr_path}/target/batch-{time.strftime('%Y%m%d-%H%M%S')}"
+    with open(summary_file + ".summary", 'w', encoding='utf-8') as f:
+        f.write(text)
+    with open(summary_file + ".json", 'w', encoding='utf-8') as f:
+        json.dump(summaries, f, indent=2)
+    print(text)
+    print(f"batch summary written to {summary_file}.summary")
+    return summaries
 
 
 def main():
+    if len(sys.argv) > 2 and sys.argv[1] in ('runs', 'compare', 'recommend'):
+        results_main(sys.argv[1:])
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
     try:
         conf_path = os.path.abspath(sys.argv[1])
     except:
         print("Please input an config, like this :  python3 fastmr.py config.example.ini")
-    config = ConfigParser()
-    config.read(conf_path, encoding='UTF-8')
-    skip_setup = config.getboolean('cmd', 'skip_setup')
-    mracc.def_conf(conf_path)
-    # 创建集群
-    engine = config['engine']['model']
-    if engine == 'CDT':
-        job = mracc.create_cluster()
-    if engine == 'DT':
-        job = mracc.control_cluster()
-    # 部署环境
-    if not skip_setup:
-        mracc.setup_pkg(job)
-        mracc.setup_env(job)
-    # 运行测试
-    mracc.run_tpc(job)
+    run_pipeline(conf_path)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
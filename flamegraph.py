@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+import html
+import zlib
+
+# 关注 shuffle 和序列化的热点, 按第一个匹配的类别归类, 没匹配上的算 other
+HOT_PATHS = [
+    ('gc', ('GCTaskThread', 'G1 ', 'ParallelGC', 'ConcurrentMark', 'VM_GC_Operation')),
+    ('compression', ('lz4', 'LZ4', 'zstd', 'Zstd', 'snappy', 'Snappy', 'Inflater', 'Deflater')),
+    ('serialization', ('esotericsoftware/kryo', 'KryoSerializ', 'JavaSerializ', 'ObjectOutputStream',
+                       'ObjectInputStream', 'UnsafeRowSerializer')),
+    ('shuffle', ('spark/shuffle', 'ShuffleBlockFetcherIterator', 'ExternalSorter', 'ShuffleExternalSorter',
+                 'UnsafeShuffleWriter', 'SortShuffleWriter', 'BypassMergeSortShuffleWriter', 'BlockStoreShuffleReader')),
+    ('network', ('io/netty', 'spark/network', 'sun/nio/ch', 'tcp_', 'sock_')),
+    ('parquet', ('apache/parquet', 'datasources/parquet')),
+    ('codegen', ('GeneratedClass', 'GeneratedIterator')),
+]
+
+
+def parse_collapsed(text):
+    """collapsed stacks 'frame;frame;frame count' -> dict stack -> samples"""
+    stacks = {}
+    for line in text.splitlines():
+        line = line.rstrip()
+        stack, _, count = line.rpartition(' ')
+        if not stack or not count.isdigit():
+            continue
+        stacks[stack] = stacks.get(stack, 0) + int(count)
+    return stacks
+
+
+def merge(*stack_dicts):
+    merged = {}
+    for stacks in stack_dicts:
+        for stack, count in stacks.items():
+            merged[stack] = merged.get(stack, 0) + count
+    return merged
+
+
+def format_collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def top_frames(stacks, n=30):
+    """
+    Returns:
+    (total samples, list of (frame, self samples, total samples)) ordered by self samples,
+    a frame that shows up twice in one stack (recursion) counts once for its total
+    """
+    self_samples = {}
+    total_samples = {}
+    total = 0
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        total += count
+        self_samples[frames[-1]] = self_samples.get(frames[-1], 0) + count
+        for frame in set(frames):
+            total_samples[frame] = total_samples.get(frame, 0) + count
+    ordered = sorted(self_samples.items(), key=lambda x: (-x[1], x[0]))[:n]
+    return total, [(frame, s, total_samples[frame]) for frame, s in ordered]
+
+
+def hot_paths(stacks):
+    """share of samples per HOT_PATHS category, a stack goes to the first category any of its frames matches"""
+    shares = {name: 0 for name, _ in HOT_PATHS}
+    shares['other'] = 0
+    total = 0
+    for stack, count in stacks.items():
+        total += count
+        for name, patterns in HOT_PATHS:
+            if any(p in stack for p in patterns):
+                shares[name] += count
+                break
+        else:
+            shares['other'] += count
+    return {name: (samples / total if total else 0.0) for name, samples in shares.items()}
+
+
+def format_top(title, stacks, n=30):
+    total, frames = top_frames(stacks, n)
+    lines = [f"{title}: {total} samples"]
+    lines.append("hot paths: " + ", ".join(f"{name} {share * 100:.1f}%"
+                                           for name, share in hot_paths(stacks).items() if share > 0))
+    lines.append(f"{'self%':>7}{'total%':>8}  frame")
+    for frame, s, t in frames:
+        lines.append(f"{s * 100.0 / total:>7.2f}{t * 100.0 / total:>8.2f}  {frame}")
+    return "\n".join(lines) + "\n"
+
+
+def _tree(stacks):
+    # node: [samples, children dict]
+    root = [0, {}]
+    for stack, count in stacks.items():
+        node = root
+        node[0] += count
+        for frame in stack.split(';'):
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += count
+    return root
+
+
+def _color(frame):
+    # 与 async-profiler 一致: java 绿色, 内核橙色, 其他 native 红色, 颜色深浅按名字散列固定下来
+    h = zlib.crc32(frame.encode('utf-8')) % 55
+    if frame.endswith('[k]'):
+        return f"rgb({200 + h % 55},{120 + h},{40})"
+    if '/' in frame or '.' in frame or frame.endswith('_[j]') or frame.endswith('_[i]'):
+        return f"rgb({50 + h},{180 + h % 75},{50 + h})"
+    return f"rgb({200 + h % 55},{60 + h},{60 + h})"
+
+
+def render_svg(stacks, title, width=1200, frame_height=16, min_width=0.1):
+    """render a flame graph (root at the bottom) as a standalone svg"""
+    root = _tree(stacks)
+    total = root[0] or 1
+    scale = (width - 20) / total
+
+    # 显式栈而不是递归, Spark/Scala 的调用栈常有上千层
+    levels = 0
+    pending = [(root, 0)]
+    while pending:
+        node, level = pending.pop()
+        levels = max(levels, level)
+        pending.extend((child, level + 1) for child in node[1].values())
+    height = (levels + 3) * frame_height
+    rects = []
+
+    def children(node, x, level):
+        """(frame, node, x, level) of the children, last one first so the stack pops them left to right"""
+        placed = []
+        for frame, child in sorted(node[1].items()):
+            placed.append((frame, child, x, level))
+            x += child[0] * scale
+        return reversed(placed)
+
+    pending = list(children(root, 10.0, 0))
+    while pending:
+        frame, node, x, level = pending.pop()
+        w = node[0] * scale
+        if w < min_width:
+            continue
+        y = height - (level + 2) * frame_height
+        tip = f"{html.escape(frame)} ({node[0]} samples, {node[0] * 100.0 / total:.2f}%)"
+        text = frame[:int(w / 7)] if w > 21 else ""
+        if text and len(text) < len(frame):
+            text = text[:-2] + ".."
+        text = html.escape(text)
+        rects.append(f'<g><title>{tip}</title><rect x="{x:.2f}" y="{y}" width="{w:.2f}" '
+                     f'height="{frame_height - 1}" fill="{_color(frame)}" rx="2"/>'
+                     + (f'<text x="{x + 3:.2f}" y="{y + frame_height - 4}">{text}</text>' if text else "")
+                     + '</g>')
+        pending.extend(children(node, x, level + 1))
+
+    return (f'<?xml version="1.0" standalone="no"?>\n'
+            f'<svg version="1.1" width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg" '
+            f'font-family="Verdana" font-size="12">\n'
+            f'<rect width="100%" height="100%" fill="#f8f8f8"/>\n'
+            f'<text x="{width / 2}" y="{frame_height + 2}" text-anchor="middle" font-size="15">'
+            f'{html.escape(title)} ({root[0]} samples)</text>\n'
+            + "\n".join(rects) + "\n</svg>\n")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import math
+import xml.etree.ElementTree as ET
+
+SITE_FILES = ('core-site.xml', 'hdfs-site.xml', 'yarn-site.xml', 'mapred-site.xml')
+SHORT_CIRCUIT_SOCKET = "/var/lib/hadoop-hdfs/dn_socket"
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, int(value)))
+
+
+def derive_profile(node_vcpu, node_mem_mb, machines, disks_per_node):
+    """
+    Performance related Hadoop properties for the given hardware and cluster size.
+    Returns:
+    (dict site file -> dict property -> value, dict property -> reason)
+    """
+    notes = {}
+    hdfs, yarn, core, mapred = {}, {}, {}, {}
+
+    # 20 * ln(节点数), 小集群不低于默认值
+    nn_handlers = _clamp(20 * math.log(max(machines, 2)), 20, 200)
+    hdfs['dfs.namenode.handler.count'] = nn_handlers
+    notes['dfs.namenode.handler.count'] = f"20 * ln({machines} nodes)"
+    hdfs['dfs.namenode.service.handler.count'] = _clamp(nn_handlers / 2, 10, 100)
+    notes['dfs.namenode.service.handler.count'] = "half of the client handlers"
+    hdfs['dfs.datanode.handler.count'] = _clamp(node_vcpu / 2, 10, 64)
+    notes['dfs.datanode.handler.count'] = f"{node_vcpu} vcpu / 2"
+    transfer_threads = 16384 if node_vcpu >= 32 or disks_per_node >= 8 else 8192
+    hdfs['dfs.datanode.max.transfer.threads'] = transfer_threads
+    notes['dfs.datanode.max.transfer.threads'] = f"{node_vcpu} vcpu, {disks_per_node} disks"
+    block_mb = 256 if node_vcpu >= 16 else 128
+    hdfs['dfs.blocksize'] = block_mb * 1048576
+    notes['dfs.blocksize'] = f"{block_mb} MB, fewer and longer scan tasks on large instances"
+    hdfs['dfs.client.read.shortcircuit'] = 'true'
+    hdfs['dfs.domain.socket.path'] = SHORT_CIRCUIT_SOCKET
+    notes['dfs.client.read.shortcircuit'] = "executors read local blocks without the DataNode"
+
+    min_alloc = 512 if node_mem_mb < 32 * 1024 else 1024
+    yarn['yarn.scheduler.minimum-allocation-mb'] = min_alloc
+    notes['yarn.scheduler.minimum-allocation-mb'] = f"{node_mem_mb} MB per node, containers round up to it"
+    yarn['yarn.scheduler.minimum-allocation-vcores'] = 1
+    yarn['yarn.nodemanager.vmem-check-enabled'] = 'false'
+    notes['yarn.nodemanager.vmem-check-enabled'] = "JVM virtual memory is not a real limit, avoids container kills"
+    yarn['yarn.nodemanager.vmem-pmem-ratio'] = 4
+    yarn['yarn.resourcemanager.client.thread-count'] = _clamp(2 * machines, 50, 200)
+    yarn['yarn.nodemanager.container-manager.thread-count'] = _clamp(node_vcpu, 20, 128)
+    notes['yarn.nodemanager.container-manager.thread-count'] = f"{node_vcpu} vcpu"
+
+    mapred['mapreduce.shuffle.max.threads'] = _clamp(2 * node_vcpu, 16, 512)
+    notes['mapreduce.shuffle.max.threads'] = f"2 * {node_vcpu} vcpu shuffle handler threads"
+    mapred['mapreduce.shuffle.transfer.buffer.size'] = 131072
+
+    core['io.file.buffer.size'] = 131072
+    notes['io.file.buffer.size'] = "128 KB stream buffers"
+
+    profile = {'core-site.xml': core, 'hdfs-site.xml': hdfs, 'yarn-site.xml': yarn, 'mapred-site.xml': mapred}
+    return {f: {k: str(v) for k, v in props.items()} for f, props in profile.items()}, notes
+
+
+def apply_overlay(site_file, props):
+    """set every property in a hadoop *-site.xml, adding the ones that are missing"""
+    tree = ET.parse(site_file)
+    root = tree.getroot()
+    missing = dict(props)
+    for iproperty in root.findall("property"):
+        name = iproperty.find("name").text
+        if name in missing:
+            iproperty.find("value").text = missing.pop(name)
+    for name, value in missing.items():
+        iproperty = ET.SubElement(root, "property")
+        ET.SubElement(iproperty, "name").text = name
+        ET.SubElement(iproperty, "value").text = value
+    ET.indent(tree)
+    tree.write(site_file)
+
+
+def format_profile(profile, notes):
+    lines = []
+    for site_file, props in profile.items():
+        for name, value in sorted(props.items()):
+            reason = notes.get(name)
+            lines.append((f"{site_file:<16}{name:<52}{value:<12}" + (f"# {reason}" if reason else "")).rstrip())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import re
+
+import benchstats
+
+_APP_ID = re.compile(r'application_\d+_\d+')
+
+
+def layout_name(data_format, compression, partitioned):
+    return f"{data_format}_{compression or 'default'}" + ("_part" if partitioned else "")
+
+
+def layouts(formats, codecs, partitioned=(False,)):
+    """every format x codec x partitioning, in the given order, the first one is the baseline"""
+    return [{'name': layout_name(f, c, p), 'format': f, 'compression': c, 'partitioned': p}
+            for p in partitioned for f in formats for c in codecs]
+
+
+def partitioning(option):
+    """[matrix] partitioned: false, true or both"""
+    return {'false': (False,), 'true': (True,), 'both': (False, True)}[option.strip().lower()]
+
+
+def app_ids(text):
+    """yarn application ids in spark-submit output, in order of appearance"""
+    ids = []
+    for app_id in _APP_ID.findall(text or ''):
+        if app_id not in ids:
+            ids.append(app_id)
+    return ids
+
+
+def stage_input_bytes(stages):
+    """history server /applications/<id>/stages -> bytes read from storage by all stages"""
+    return sum(s.get('inputBytes') or 0 for s in stages)
+
+
+def parse_du(text):
+    """`hadoop fs -du -s <path>` -> bytes of one replica"""
+    for line in reversed((text or '').strip().splitlines()):
+        fields = line.split()
+        if fields and fields[0].isdigit():
+            return int(fields[0])
+    return None
+
+
+def _gb(value):
+    return f"{value / 1073741824:.2f}" if value is not None else "-"
+
+
+def _ratio(value, base):
+    return f"{value / base:.2f}x" if value is not None and base else "-"
+
+
+def format_matrix(rows):
+    """
+    rows: dict layout, footprint_bytes, scan_bytes, convert_seconds, summary (benchstats summary)
+    Footprint, scan bytes and query time side by side, ratios against the first layout.
+    """
+    base = rows[0] if rows else None
+    lines = [f"{'layout':<24}{'disk GB':>9}{'ratio':>8}{'scan GB':>9}{'ratio':>8}{'queries s':>11}{'ratio':>8}"
+             f"{'geomean s':>11}{'failed':>8}{'convert s':>11}"]
+    base_total = base['summary']['total_median'] if base and base['summary'] else None
+    for r in rows:
+        summary = r['summary']
+        total = summary['total_median'] if summary else None
+        total_text = f"{total:.1f}" if total is not None else "-"
+        geomean_text = f"{summary['geomean']:.2f}" if summary and summary['geomean'] else "-"
+        failed = len(summary['failed_queries']) if summary else "-"
+        convert = f"{r['convert_seconds']:.0f}" if r['convert_seconds'] else "reused"
+        lines.append(f"{r['layout']['name']:<24}{_gb(r['footprint_bytes']):>9}"
+                     f"{_ratio(r['footprint_bytes'], base['footprint_bytes']):>8}"
+                     f"{_gb(r['scan_bytes']):>9}{_ratio(r['scan_bytes'], base['scan_bytes']):>8}"
+                     f"{total_text:>11}{_ratio(total, base_total):>8}{geomean_text:>11}{failed:>8}{convert:>11}")
+    # 每个查询的中位数, 各布局并排
+    measured = [r for r in rows if r['summary']]
+    names = sorted({q for r in measured for q in r['summary']['queries']}, key=benchstats.query_sort_key)
+    if names:
+        lines.append("median seconds per query:")
+        lines.append(f"{'query':<8}" + "".join(f"{r['layout']['name'][:15]:>16}" for r in measured))
+        for name in names:
+            cells = []
+            for r in measured:
+                median = r['summary']['queries'].get(name, {}).get('median')
+                cells.append(f"{median:>16.2f}" if median is not None else f"{'-':>16}")
+            lines.append(f"{name:<8}" + "".join(cells))
+    return "\n".join(lines) + "\n"
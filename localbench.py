@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Orchestration benchmarks on the local ncluster stand-in, no machines needed:
+
+    python3 localbench.py [--tasks 8] [--latency-ms 20] [--bandwidth-mbs 100] [--package-mb 64]
+
+run       per call overhead of task.run, the tracing wrapper and aioremote's polling
+fan-out   one command on every task: sequential, thread pool, aioremote
+packages  one package to every task: sequential / parallel upload, broadcast star / tree
+configs   a config directory through uploadcache, first upload and unchanged re-upload
+
+Latency and link bandwidth are emulated, CPU bound steps on the nodes (sha256 checks, tar)
+share the cores of this machine, so they weigh more than on a real cluster.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aioremote
+import broadcast
+import localcluster
+import tracing
+import uploadcache
+
+# aioremote 默认 1 s 轮询一次, 本机上用更短的间隔, 测的是调度开销而不是轮询间隔
+POLL_INTERVAL = 0.05
+
+
+def timed(fn, repeat=1):
+    """median seconds of repeat calls"""
+    times = []
+    for _ in range(repeat):
+        start_time = time.time()
+        fn()
+        times.append(time.time() - start_time)
+    return statistics.median(times)
+
+
+def bench_run(job, calls):
+    task = job.tasks[0]
+    traced = tracing.instrument(localcluster.LocalJob(job.name, [localcluster.LocalTask(
+        task.name, task.root, task.instance, task.state_file)])).tasks[0]
+    plain = localcluster.LocalTask(task.name, task.root, task.instance, task.state_file)
+    # aioremote 每次至少等一个轮询间隔, 只跑十分之一的次数
+    aio_calls = max(1, calls // 10)
+    rows = [('subprocess sh -c', calls, timed(lambda: [subprocess.run(['sh', '-c', 'true']) for _ in range(calls)])),
+            ('task.run', calls, timed(lambda: [plain.run('true') for _ in range(calls)])),
+            ('traced task.run', calls, timed(lambda: [traced.run('true') for _ in range(calls)])),
+            ('aioremote.run (poll 50 ms)', aio_calls, timed(lambda: [aioremote.run_sync(aioremote.run(
+                plain, 'true', poll_interval=POLL_INTERVAL, stream=False)) for _ in range(aio_calls)]))]
+    return [(name, seconds / n * 1000, None) for name, n, seconds in rows]
+
+
+def bench_fanout(job, threads):
+    cmd = "sleep 0.05"
+    seq = timed(lambda: job.run(cmd))
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pooled = timed(lambda: list(pool.map(lambda t: t.run(cmd), job.tasks)))
+    aio = timed(lambda: aioremote.run_sync(aioremote.run_all(job.tasks, cmd, poll_interval=POLL_INTERVAL,
+                                                             stream=False)))
+    return [('sequential job.run', seq * 1000, 1.0),
+            (f'thread pool ({threads})', pooled * 1000, seq / pooled),
+            ('aioremote.run_all (poll 50 ms)', aio * 1000, seq / aio)]
+
+
+def bench_packages(job, package, threads):
+    remote = "/root/.fastmr/pkgs/bench.tar.gz"
+
+    def clean():
+        for task in job.tasks:
+            task.run(f"rm -f {remote}")
+
+    rows = []
+    clean()
+    seq = timed(lambda: job.upload(package, remote))
+    rows.append(('sequential upload', seq, 1.0))
+    clean()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pooled = timed(lambda: list(pool.map(lambda t: t.upload(package, remote), job.tasks)))
+    rows.append((f'parallel upload ({threads})', pooled, seq / pooled))
+    for mode in ('star', 'tree'):
+        clean()
+        seconds = timed(lambda: broadcast.broadcast_file(job.tasks, package, remote, mode=mode))
+        rows.append((f'broadcast {mode}', seconds, seq / seconds))
+    # 已经有正确副本时只做 hash 校验
+    seconds = timed(lambda: broadcast.broadcast_file(job.tasks, package, remote, mode='tree'))
+    rows.append(('broadcast tree, already there', seconds, seq / seconds))
+    return [(name, seconds * 1000, speedup) for name, seconds, speedup in rows]
+
+
+def bench_configs(job, config_dir):
+    for task in job.tasks:
+        task.run("rm -rf /opt/bench-conf")
+    seq = timed(lambda: job.upload(config_dir, "/opt/bench-conf"))
+    first = timed(lambda: uploadcache.upload_changed(job.tasks, config_dir, "/opt/bench-conf"))
+    again = timed(lambda: uploadcache.upload_changed(job.tasks, config_dir, "/opt/bench-conf"))
+    return [('job.upload', seq * 1000, 1.0),
+            ('uploadcache, first', first * 1000, seq / first),
+            ('uploadcache, unchanged', again * 1000, seq / again)]
+
+
+def make_package(work_dir, size_mb):
+    src = f"{work_dir}/pkg"
+    os.makedirs(src)
+    with open(f"{src}/payload.bin", 'wb') as f:
+        f.write(os.urandom(size_mb * 1048576))
+    shutil.make_archive(f"{work_dir}/bench", 'gztar', src)
+    return f"{work_dir}/bench.tar.gz"
+
+
+def make_config_dir(work_dir, files):
+    conf = f"{work_dir}/conf"
+    os.makedirs(conf)
+    for i in range(files):
+        with open(f"{conf}/site-{i}.xml", 'w') as f:
+            f.write(f"<configuration><property><name>p{i}</name><value>{'x' * 2048}</value></property>"
+                    f"</configuration>\n")
+    return conf
+
+
+def format_rows(title, rows):
+    lines = [f"------{title}", f"{'':<34}{'ms':>10}{'speedup':>9}"]
+    for name, ms, speedup in rows:
+        lines.append(f"{name:<34}{ms:>10.1f}" + (f"{speedup:>8.2f}x" if speedup is not None else ""))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="orchestration benchmarks on the local cluster stand-in")
+    parser.add_argument('--tasks', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--bandwidth-mbs', type=float, default=100)
+    parser.add_argument('--package-mb', type=int, default=64)
+    parser.add_argument('--config-files', type=int, default=40)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--only', help="comma separated: run,fanout,packages,configs")
+    args = parser.parse_args()
+    only = set(args.only.split(',')) if args.only else {'run', 'fanout', 'packages', 'configs'}
+
+    work_dir = tempfile.mkdtemp(prefix='fastmr-localbench-')
+    try:
+        # 测单次调用开销时不加延迟
+        bare = localcluster.make_job('bench', 1, f"{work_dir}/bare")
+        job = localcluster.make_job('bench', args.tasks, f"{work_dir}/cluster", latency=args.latency_ms / 1000,
+                                    bandwidth_mbs=args.bandwidth_mbs)
+        print(f"{args.tasks} tasks, {args.latency_ms} ms latency, {args.bandwidth_mbs} MB/s per link")
+        if 'run' in only:
+            print(format_rows(f"run overhead per call ({args.calls} calls)", bench_run(bare, args.calls)))
+        if 'fanout' in only:
+            print(format_rows("fan-out: sleep 0.05 on every task", bench_fanout(job, args.threads)))
+        if 'packages' in only:
+            package = make_package(work_dir, args.package_mb)
+            print(format_rows(f"package distribution ({os.path.getsize(package) / 1048576:.0f} MB)",
+                              bench_packages(job, package, args.threads)))
+        if 'configs' in only:
+            print(format_rows(f"config upload ({args.config_files} files)",
+                              bench_configs(job, make_config_dir(work_dir, args.config_files))))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
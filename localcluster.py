@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+import fcntl
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+
+# 这些绝对路径映射到每个 task 自己的根目录, 其它路径 (/usr, /bin) 用本机的
+ISOLATED_PREFIXES = ('opt', 'root', 'tmp', r'data\d*', 'mnt', 'home', 'etc', 'var')
+# 会改动本机的命令换成只打日志的 shim, 通过 PATH 生效, 写了绝对路径 (/usr/bin/rpm) 的不拦截
+SKIPPED_COMMANDS = ('rpm', 'yum', 'apt-get', 'systemctl', 'service', 'mount', 'umount', 'mkfs', 'mkfs.ext4',
+                    'mkfs.xfs', 'parted', 'wipefs', 'swapoff', 'sysctl', 'hostnamectl', 'reboot', 'shutdown')
+STATE_FILE = "cluster.json"
+CONTROLLER = "controller"
+
+_PATH_RE = re.compile(r'(?<![\w:/.~$-])/(?:' + '|'.join(ISOLATED_PREFIXES) + r')(?![\w.-])')
+
+
+class LocalInstance:
+    def __init__(self, cpu, memory_mb, ip, hostname):
+        self._cpu = cpu
+        self._memory = memory_mb
+        self._ip = ip
+        self._hostname = hostname
+
+    def cpu(self):
+        return self._cpu
+
+    def memory(self):
+        return self._memory
+
+    def private_ip(self):
+        return self._ip
+
+    def host_name(self):
+        return self._hostname
+
+
+class Link:
+    """
+    One network link: transfers over it take bytes / bandwidth and are serialized with a
+    file lock, so concurrent senders share it across threads and across the shim processes.
+    """
+
+    def __init__(self, lock_file, bandwidth_mbs=None):
+        self.lock_file = lock_file
+        self.bandwidth_mbs = bandwidth_mbs
+
+    def transfer(self, nbytes):
+        if not self.bandwidth_mbs:
+            return
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                time.sleep(nbytes / (self.bandwidth_mbs * 1048576))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def path_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class LocalTask:
+    """
+    ncluster task stand-in: a directory standing for the node's filesystem and `sh -c`
+    subprocesses that see the isolated paths of the command rewritten into it. latency is
+    added to every run/upload, uploads also wait on the controller's link.
+    """
+
+    def __init__(self, name, root, instance, state_file, latency=0.0, uplink=None, resource_dir=None):
+        self.name = name
+        self.root = root
+        self.instance = instance
+        self.public_ip = "127.0.0.1"
+        self.state_file = state_file
+        self.latency = latency
+        self.uplink = uplink
+        self.resource_dir = resource_dir
+
+    def local_path(self, path):
+        """where an absolute node path lives on this machine, every path of an upload is isolated"""
+        return self.root + os.path.normpath('/' + path)
+
+    def rewrite(self, cmd):
+        return _PATH_RE.sub(lambda m: self.root + m.group(0), cmd)
+
+    def env(self):
+        env = dict(os.environ)
+        env.update({'HOME': self.root + '/root',
+                    'PATH': os.path.dirname(self.state_file) + '/bin:' + os.environ.get('PATH', ''),
+                    'LOCALCLUSTER_STATE': self.state_file,
+                    'LOCALCLUSTER_TASK': self.name})
+        return env
+
+    def run(self, cmd, *args, **kwargs):
+        time.sleep(self.latency)
+        proc = subprocess.run(['sh', '-c', self.rewrite(cmd)], cwd=self.root + '/root', env=self.env(),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+        stdout = proc.stdout.decode('utf-8', 'replace')
+        if proc.returncode != 0:
+            stderr = proc.stderr.decode('utf-8', 'replace').strip()
+            raise RuntimeError(f"{self.name}: '{cmd}' exited with {proc.returncode}: {stderr[-2000:]}")
+        return stdout
+
+    def exists(self, path):
+        return self.run(f"test -e {path} && echo yes || true").strip() == 'yes'
+
+    def upload(self, local_fn, remote_fn=None, dont_overwrite=False):
+        time.sleep(self.latency)
+        remote_fn = remote_fn or os.path.basename(local_fn.rstrip('/'))
+        target = self.local_path(remote_fn if remote_fn.startswith('/') else '/root/' + remote_fn)
+        if dont_overwrite and os.path.exists(target):
+            return
+        if self.uplink is not None:
+            self.uplink.transfer(path_bytes(local_fn))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.isdir(local_fn):
+            shutil.copytree(local_fn, target, dirs_exist_ok=True)
+        else:
+            shutil.copyfile(local_fn, target)
+
+    def setup(self, pkg_name, pkg_format='.tar.gz', path='/opt', **kwargs):
+        """upload resource_dir/<pkg_name><pkg_format> and unpack it under path, rpms are only copied"""
+        assert self.resource_dir, f"{self.name}: no resource_dir to set up {pkg_name} from"
+        package = f"{self.resource_dir}/{pkg_name}{pkg_format}"
+        self.upload(package, f"/tmp/{pkg_name}{pkg_format}")
+        if pkg_format in ('.tar.gz', '.tgz'):
+            os.makedirs(self.local_path(path), exist_ok=True)
+            with tarfile.open(self.local_path(f"/tmp/{pkg_name}{pkg_format}")) as tar:
+                tar.extractall(self.local_path(path))
+
+
+class LocalJob:
+    def __init__(self, name, tasks):
+        self.name = name
+        self.tasks = tasks
+
+    def run(self, cmd, *args, **kwargs):
+        for task in self.tasks:
+            task.run(cmd, *args, **kwargs)
+
+    def upload(self, *args, **kwargs):
+        for task in self.tasks:
+            task.upload(*args, **kwargs)
+
+    def setup(self, *args, **kwargs):
+        for task in self.tasks:
+            task.setup(*args, **kwargs)
+
+
+def _per_task(value, num_tasks, default):
+    """one value for every task or a list, the last entry repeats"""
+    if value is None:
+        value = default
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [value[min(i, len(value) - 1)] for i in range(num_tasks)]
+
+
+def _write_shims(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    module = os.path.abspath(__file__)
+    for name in ('ssh', 'scp') + SKIPPED_COMMANDS:
+        action = name if name in ('ssh', 'scp') else f"skip {name}"
+        with open(f"{bin_dir}/{name}", 'w', newline='\n') as f:
+            f.write(f'#!/bin/sh\nexec {shlex.quote(sys.executable)} {shlex.quote(module)} {action} "$@"\n')
+        os.chmod(f"{bin_dir}/{name}", 0o755)
+
+
+def make_job(name, num_tasks, root, cpus=None, memories=None, ips=None, hostnames=None, latency=0.0,
+             bandwidth_mbs=None, resource_dir=None):
+    """
+    Args:
+    root: directory holding one sub directory per task, kept between runs like real disks
+    cpus / memories (MB) / ips / hostnames: one value or one per task
+    latency: seconds added to every run and upload
+    bandwidth_mbs: MB/s of each sender's link, the controller for uploads, the source task for scp
+    Returns:
+    LocalJob
+    """
+    root = os.path.abspath(root)
+    state_file = f"{root}/{STATE_FILE}"
+    os.makedirs(f"{root}/links", exist_ok=True)
+    _write_shims(f"{root}/bin")
+    cpus = _per_task(cpus, num_tasks, 4)
+    memories = _per_task(memories, num_tasks, 8192)
+    ips = ips or [f"10.0.0.{i + 1}" for i in range(num_tasks)]
+    hostnames = hostnames or [f"{name}-{i}" for i in range(num_tasks)]
+    assert len(ips) >= num_tasks and len(hostnames) >= num_tasks, f"need an ip and a hostname for each of {num_tasks} tasks"
+    uplink = Link(f"{root}/links/{CONTROLLER}.lock", bandwidth_mbs)
+
+    tasks, state = [], {'latency': latency, 'bandwidth_mbs': bandwidth_mbs, 'tasks': {}}
+    for i in range(num_tasks):
+        task_name = f"task{i}.{name}"
+        task_root = f"{root}/{task_name}"
+        for d in ('root', 'tmp', 'opt', 'etc'):
+            os.makedirs(f"{task_root}/{d}", exist_ok=True)
+        instance = LocalInstance(int(cpus[i]), int(memories[i]), ips[i], hostnames[i])
+        tasks.append(LocalTask(task_name, task_root, instance, state_file, latency, uplink, resource_dir))
+        state['tasks'][task_name] = {'root': task_root, 'ip': ips[i], 'hostname': hostnames[i]}
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    return LocalJob(name, tasks)
+
+
+# ---- ssh / scp shims, run as `python3 localcluster.py <ssh|scp|skip> ...` inside a task ----
+
+def _load_state():
+    with open(os.environ['LOCALCLUSTER_STATE'], encoding='utf-8') as f:
+        state = json.load(f)
+    return state, os.environ.get('LOCALCLUSTER_TASK')
+
+
+def _find(state, host):
+    host = host.split('@', 1)[-1]
+    for task_name, task in state['tasks'].items():
+        if host in (task_name, task['ip'], task['hostname']):
+            return task_name, task
+    raise SystemExit(f"localcluster: unknown host {host}")
+
+
+def _split_opts(args, with_value):
+    """drop the leading options of ssh/scp, options in with_value take the next argument"""
+    i = 0
+    while i < len(args) and args[i].startswith('-'):
+        i += 2 if args[i] in with_value else 1
+    return args[i:]
+
+
+def _task_for(state, task_name):
+    task = state['tasks'][task_name]
+    return LocalTask(task_name, task['root'], None, os.environ['LOCALCLUSTER_STATE'])
+
+
+def ssh_main(args):
+    state, source = _load_state()
+    rest = _split_opts(args, ('-o', '-p', '-i', '-l', '-F'))
+    target_name, _ = _find(state, rest[0])
+    cmd = " ".join(rest[1:])
+    if source:
+        # 发起方的 run 已经把路径改写到了自己的根目录, 先还原
+        cmd = cmd.replace(state['tasks'][source]['root'] + '/', '/')
+    time.sleep(state['latency'])
+    task = _task_for(state, target_name)
+    return subprocess.run(['sh', '-c', task.rewrite(cmd)], cwd=task.root + '/root', env=task.env()).returncode
+
+
+def scp_main(args):
+    state, source = _load_state()
+    rest = _split_opts(args, ('-o', '-P', '-i', '-l', '-F'))
+    *sources, dest = rest
+
+    def resolve(spec):
+        if ':' in spec and not spec.startswith('/'):
+            host, path = spec.split(':', 1)
+            name, _ = _find(state, host)
+            return name, _task_for(state, name).local_path(path)
+        # 本地路径已经被发起方的 run 改写过
+        return source, spec
+
+    dest_name, dest_path = resolve(dest)
+    for spec in sources:
+        src_name, src_path = resolve(spec)
+        Link(f"{os.path.dirname(os.environ['LOCALCLUSTER_STATE'])}/links/{src_name or CONTROLLER}.lock",
+             state['bandwidth_mbs']).transfer(path_bytes(src_path))
+        target = os.path.join(dest_path, os.path.basename(src_path)) if os.path.isdir(dest_path) else dest_path
+        if os.path.isdir(src_path):
+            shutil.copytree(src_path, target, dirs_exist_ok=True)
+        else:
+            shutil.copyfile(src_path, target)
+    time.sleep(state['latency'])
+    return 0
+
+
+def main(argv):
+    if argv[0] == 'ssh':
+        return ssh_main(argv[1:])
+    if argv[0] == 'scp':
+        return scp_main(argv[1:])
+    print(f"localcluster: skipped {' '.join(argv[1:])}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
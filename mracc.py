@@ -1,35 +1,94 @@
 #!/usr/bin/env python
 
-import fileinput
-import math
+import hashlib
+import json
 import os
 import shutil
 import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from configparser import ConfigParser
 
 import ncluster
 
+import aioremote
+import autotune
+import benchscripts
+import benchstats
+import broadcast
+import catalog
+import confdiff
+import costmodel
+import disks
+import elastic
+import flamegraph
+import hadoopprofile
+import layoutmatrix
+import localcluster
+import resultstore
+import scaling
+import sparksizing
+import telemetry
+import throughput
+import tpcdsdata
+import tracing
+import uploadcache
+from clusterctx import ClusterContext
+from stepdag import StepGraph
+
+# setup_env 的断点文件, copy_conf 不会清除它
+STEP_STATE_FILE = "deploy.steps"
+# 探测到的磁盘和目录规划, init_disk 写, conf_hadoop/clean_hdfs 读
+DISK_LAYOUT_FILE = "disks.json"
+# broadcast 模式下各节点存放安装包的目录
+BROADCAST_DIR = "/root/.fastmr/pkgs"
+# 各节点上 executor 退出时 async-profiler 写 collapsed stacks 的目录
+FLAME_DIR = "/tmp/fastmr-flame"
+FLAME_ARCHIVE = "async-profiler-1.8.3-linux-x64.tar.gz"
+# shuffle 和序列化比较重的查询
+FLAME_QUERIES = "q4,q11,q14a,q23a,q64,q72,q78,q95"
+
+
+# 当前进程操作的集群, def_conf/use_context 设置; batch 模式下每个集群在自己的进程里
+CTX = None
+
 
 def def_conf(conf_path):
-    global CONF_PATH, FASTMR_PATH, CLUSTER_NAME
+    return use_context(ClusterContext(conf_path))
+
+
+def use_context(ctx):
+    """make ctx the cluster every mracc function works on, returns it"""
+    global CTX
+
+    CTX = ctx
+    return ctx
 
-    CONF_PATH = conf_path
-    FASTMR_PATH = os.path.abspath(f'{conf_path}/../..')
+
+def cluster_size():
+    """
+    the largest [sweep] machines for a scaling sweep, [scale] machines once the cluster was
+    grown or shrunk, [ncluster] machines otherwise
+    """
     config = ConfigParser()
-    config.read(CONF_PATH, encoding='UTF-8')
-    CLUSTER_NAME = config['ncluster']['clustername']
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if sweep_enabled():
+        return max(sweep_list('machines', int))
+    if config.has_option('scale', 'machines'):
+        return config.getint('scale', 'machines')
+    return config.getint('ncluster', 'machines')
 
 
+@tracing.traced()
 def control_cluster():
     ncluster.set_backend('fastmr')
 
     # config = "config.ini"
     config = ConfigParser()
 
-    config.read(CONF_PATH, encoding='UTF-8')
+    config.read(CTX.conf_path, encoding='UTF-8')
 
-    num_tasks = config.getint('ncluster', 'machines')
+    num_tasks = cluster_size()
     copy_conf()
     tasks_message = [[config['master']['public_ip'],
                       config['master']['usr'],
@@ -40,18 +99,114 @@ def control_cluster():
                               config[f'worker{i}']['usr'],
                               config[f'worker{i}']['passwd']])
 
-    job = ncluster.make_job(name=CLUSTER_NAME,
-                            num_tasks=num_tasks,
-                            tasks_message=tasks_message)
-    return job
+    with tracing.span('make_job', machines=num_tasks):
+        job = ncluster.make_job(name=CTX.cluster_name,
+                                num_tasks=num_tasks,
+                                tasks_message=tasks_message)
+    return tracing.instrument(job)
 
 
+def template_text(rel_path):
+    """trans/<rel_path>, the pristine template of a generated target file, empty when there is none"""
+    path = f"{CTX.fastmr_path}/trans/{rel_path}"
+    if not os.path.exists(path):
+        return ""
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def write_generated(rel_path, text):
+    """
+    target/<cluster>/<rel_path> rewritten as a whole, generated files are rendered from their
+    template on every run and never appended to, so repeated runs do not accumulate lines
+    """
+    with open(f"{CTX.target_dir}/{rel_path}", 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+
+
+def local_list(option, cast, default):
+    """[local] option, one value or comma separated per task"""
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if not config.has_option('local', option):
+        return default
+    return [cast(v.strip()) for v in config['local'][option].split(',') if v.strip()]
+
+
+@tracing.traced()
+def local_cluster():
+    """
+    [engine] model = LOCAL: every task is a directory under [local] root with its commands run
+    as local subprocesses (see localcluster), to exercise and time the deploy pipeline
+    without machines. [local] cpu / memory_mb / private_ip per task, latency_ms and
+    bandwidth_mbs emulate the network.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    num_tasks = cluster_size()
+    copy_conf()
+    # 不放在 target/<cluster>/ 下, copy_conf 不会清掉已经"部署"的节点
+    root = CTX.fastmr_path + "/target/local/" + CTX.cluster_name
+    if config.has_option('local', 'root'):
+        root = config['local']['root']
+    latency = 0.0
+    if config.has_option('local', 'latency_ms'):
+        latency = config.getfloat('local', 'latency_ms') / 1000
+    bandwidth_mbs = None
+    if config.has_option('local', 'bandwidth_mbs'):
+        bandwidth_mbs = config.getfloat('local', 'bandwidth_mbs')
+    pkg_dir = CTX.fastmr_path + "/resource"
+    if config.has_option('cmd', 'pkg_dir'):
+        pkg_dir = config['cmd']['pkg_dir']
+
+    with tracing.span('make_job', machines=num_tasks, backend='local'):
+        job = localcluster.make_job(name=CTX.cluster_name,
+                                    num_tasks=num_tasks,
+                                    root=root,
+                                    cpus=local_list('cpu', int, None),
+                                    memories=local_list('memory_mb', int, None),
+                                    ips=local_list('private_ip', str, None),
+                                    latency=latency,
+                                    bandwidth_mbs=bandwidth_mbs,
+                                    resource_dir=pkg_dir)
+    print(f"local cluster {CTX.cluster_name}: {num_tasks} tasks under {root}")
+    return tracing.instrument(job)
+
+
+@tracing.traced()
 def copy_conf():
-    if os.path.exists(FASTMR_PATH + "/target/" + CLUSTER_NAME):
-        shutil.rmtree(FASTMR_PATH + "/target/" + CLUSTER_NAME)
-    shutil.copytree(f"{FASTMR_PATH}/trans", FASTMR_PATH + "/target/" + CLUSTER_NAME)
+    # 断点续跑需要的状态文件不能被清掉
+    kept = {}
+    for name in (STEP_STATE_FILE, DISK_LAYOUT_FILE):
+        state_file = CTX.target_dir + "/" + name
+        if os.path.exists(state_file):
+            with open(state_file, 'rb') as f:
+                kept[state_file] = f.read()
+    if os.path.exists(CTX.target_dir):
+        shutil.rmtree(CTX.target_dir)
+    shutil.copytree(f"{CTX.fastmr_path}/trans", CTX.target_dir)
+    for state_file, state in kept.items():
+        with open(state_file, 'wb') as f:
+            f.write(state)
+
+
+def upload_dir(target, local_dir, remote_dir):
+    """
+    Upload a directory to a job or a single task. With [cmd] upload_cache = true only
+    files that differ from the copy on that node are transferred.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    if config.has_option('cmd', 'upload_cache') and config.getboolean('cmd', 'upload_cache'):
+        tasks = target.tasks if hasattr(target, 'tasks') else [target]
+        uploadcache.upload_changed(tasks, local_dir, remote_dir)
+    else:
+        target.upload(local_dir, remote_dir)
 
 
+@tracing.traced()
 def create_cluster():
     """
     Args:
@@ -65,7 +220,7 @@ def create_cluster():
     # config = "config.ini"
     config = ConfigParser()
 
-    config.read(CONF_PATH, encoding='UTF-8')
+    config.read(CTX.conf_path, encoding='UTF-8')
 
     IMAGE_NAME = config['ncluster']['image_name']
 
@@ -79,10 +234,12 @@ def create_cluster():
     if config.has_option('ncluster', 'instancename'):
         instancename = config['ncluster']['instancename']
     else:
-        instancename = CLUSTER_NAME
+        instancename = CTX.cluster_name
 
     INSTANCE_TYPE = config['ncluster']['instance_type']
-    machines = config.getint('ncluster', 'machines')
+    machines = cluster_size()
+    # 扩缩容后 run_name 不变, 已有的实例才能接上
+    run_name = CTX.cluster_name + config['ncluster']['machines']
     system_disk_size = config['ncluster']['system_disk_size']
     if config.has_option('ncluster', 'system_disk_category'):
         system_disk_category = config['ncluster']['system_disk_category']
@@ -108,72 +265,76 @@ def create_cluster():
 
     start_time = time.time()
     copy_conf()
-    cinfofile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/cluster.info"
+    cinfofile = CTX.target_dir + "/cluster.info"
     with open(cinfofile, 'w+') as f:
-        f.write("#MRACC Bigdata cluster info. cluster name: " + CLUSTER_NAME + "   " + start_time.__str__() + "\n")
+        f.write("#MRACC Bigdata cluster info. cluster name: " + CTX.cluster_name + "   " + start_time.__str__() + "\n")
         f.close()
-    os.system(f"echo ------price infos: >> {cinfofile}")
-    os.system(f"cat resource/ecsprices.csv | grep '{INSTANCE_TYPE}' >> {cinfofile}")
-    os.system(f"echo ------instance infos: >> {cinfofile}")
-    os.system(f"cat resource/ecsresource.csv | grep '{INSTANCE_TYPE}' >> {cinfofile}")
+    with open(cinfofile, 'a+') as f:
+        f.write("------instance infos:\n")
+        f.write(instance_info(INSTANCE_TYPE))
 
     # 创建集群
 
-    if cloud_data_disk_size is not None:
-        job = ncluster.make_job(cname=CLUSTER_NAME,
-                                name=instancename,
-                                run_name=CLUSTER_NAME + str(machines),
-                                num_tasks=machines,
-                                instance_type=INSTANCE_TYPE,
-                                machines=machines,
-                                vpc_name=vpc_name,
-                                image_name=IMAGE_NAME,
-                                system_disk_category=system_disk_category,
-                                skip_setup=skip_setup,
-                                threadsPerCore=threadsPerCore,
-                                cloud_data_disk_size=cloud_data_disk_size,
-                                cloud_disk_num=cloud_disk_num,
-                                DeploymentSetId=DeploymentSetId,
-                                cloud_disk_type=cloud_disk_type
-                                )
-    else:
-        job = ncluster.make_job(cname=CLUSTER_NAME,
-                                name=instancename,
-                                run_name=CLUSTER_NAME + str(machines),
-                                num_tasks=machines,
-                                instance_type=INSTANCE_TYPE,
-                                machines=machines,
-                                vpc_name=vpc_name,
-                                system_disk_category=system_disk_category,
-                                DeploymentSetId=DeploymentSetId,
-                                threadsPerCore=threadsPerCore,
-                                image_name=IMAGE_NAME
-                                )
-    print(f"{time.time()} : mrcluster {CLUSTER_NAME} have {len(job.tasks)} workers inited")
-    return job
+    with tracing.span('make_job', instance_type=INSTANCE_TYPE, machines=machines):
+        if cloud_data_disk_size is not None:
+            job = ncluster.make_job(cname=CTX.cluster_name,
+                                    name=instancename,
+                                    run_name=run_name,
+                                    num_tasks=machines,
+                                    instance_type=INSTANCE_TYPE,
+                                    machines=machines,
+                                    vpc_name=vpc_name,
+                                    image_name=IMAGE_NAME,
+                                    system_disk_category=system_disk_category,
+                                    skip_setup=skip_setup,
+                                    threadsPerCore=threadsPerCore,
+                                    cloud_data_disk_size=cloud_data_disk_size,
+                                    cloud_disk_num=cloud_disk_num,
+                                    DeploymentSetId=DeploymentSetId,
+                                    cloud_disk_type=cloud_disk_type
+                                    )
+        else:
+            job = ncluster.make_job(cname=CTX.cluster_name,
+                                    name=instancename,
+                                    run_name=run_name,
+                                    num_tasks=machines,
+                                    instance_type=INSTANCE_TYPE,
+                                    machines=machines,
+                                    vpc_name=vpc_name,
+                                    system_disk_category=system_disk_category,
+                                    DeploymentSetId=DeploymentSetId,
+                                    threadsPerCore=threadsPerCore,
+                                    image_name=IMAGE_NAME
+                                    )
+    print(f"{time.time()} : mrcluster {CTX.cluster_name} have {len(job.tasks)} workers inited")
+    return tracing.instrument(job)
 
 
 def align_guava(master):
-    # 只考虑hadoop中guava版本高于hive的情况
-    hadoop_guava = master.run('find $HADOOP_HOME/share/hadoop/common/lib/ -name "guava*"')[0:-1]
-    hive_guava = master.run('find $HIVE_HOME/lib/ -name "guava*"')[0:-1]
-    print(f"{hive_guava}")
-    print(f"mv {hive_guava} {hive_guava}.bak")
-    print(f"mv {hadoop_guava} $HIVE_HOME/lib/")
-    if hive_guava != "" and hadoop_guava != "":
-        master.run(f"mv {hive_guava} {hive_guava}.bak")
-        master.run(f"mv {hadoop_guava} $HIVE_HOME/lib/")
-    else:
+    # 只考虑hadoop中guava版本高于hive的情况, 每次部署都会执行, 已经对齐过就跳过
+    hadoop_guava = master.run('find $HADOOP_HOME/share/hadoop/common/lib/ -name "guava-*.jar" | head -n 1').strip()
+    hive_guavas = master.run('find $HIVE_HOME/lib/ -name "guava-*.jar" ! -name "*.bak"').split()
+    if hadoop_guava == "" or not hive_guavas:
         print("miss guava.jar in hadoop or hive")
+        return
+    if os.path.basename(hadoop_guava) in [os.path.basename(g) for g in hive_guavas]:
+        print(f"hive already uses {os.path.basename(hadoop_guava)}")
+        return
+    for hive_guava in hive_guavas:
+        print(f"mv {hive_guava} {hive_guava}.bak")
+        master.run(f"mv {hive_guava} {hive_guava}.bak")
+    # 复制而不是移走, hadoop 自己也要用这个 jar
+    print(f"cp {hadoop_guava} $HIVE_HOME/lib/")
+    master.run(f"cp {hadoop_guava} $HIVE_HOME/lib/")
     return
 
 
 def config_mysql(master):
     master.run("service mysqld restart")
     prefix = "mysql -uroot -D mysql -e"
-    master.run(f"""{prefix} "create user 'hive'@'localhost' identified by '123456';" """)
+    master.run(f"""{prefix} "create user if not exists 'hive'@'localhost' identified by '123456';" """)
     master.run(f"""{prefix} "grant all privileges on *.* to 'hive'@'localhost';"  """)
-    master.run(f"""{prefix} "create user 'hive'@'%' identified by '123456';" """)
+    master.run(f"""{prefix} "create user if not exists 'hive'@'%' identified by '123456';" """)
     master.run(f"""{prefix} "grant all privileges on *.* to 'hive'@'%';" """)
     master.run(f"""{prefix} "flush privileges;" """)
     master.run("service mysqld restart")
@@ -197,66 +358,210 @@ def mysql_connect_jar(master):
     return
 
 
-def setup_pkg(job):
+def run_concurrently(calls, max_workers):
+    """
+    并发执行一组互不依赖的远程操作
+    Args:
+    calls: list of (task_name, step, fn, args, kwargs)
+    max_workers: thread pool size
+    Returns:
+    list of (task_name, step, exception) for every failed call
+    """
+    failures = []
+    if not calls:
+        return failures
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls)))) as pool:
+        futures = {pool.submit(fn, *args, **kwargs): (task_name, step)
+                   for task_name, step, fn, args, kwargs in calls}
+        for future in as_completed(futures):
+            task_name, step = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures.append((task_name, step, e))
+    return failures
+
+
+def remote_run(target, cmd, timeout=None):
+    """
+    Run a long remote command on a job or a task through aioremote: output is streamed with a
+    per node prefix, and [cmd] remote_timeout / remote_retries apply unless timeout is given.
+    """
     config = ConfigParser()
-    config.read(CONF_PATH, encoding='UTF-8')
+    config.read(CTX.conf_path, encoding='UTF-8')
 
-    env_str = ""
-    # set up java
+    if timeout is None and config.has_option('cmd', 'remote_timeout'):
+        timeout = config.getfloat('cmd', 'remote_timeout')
+    retries = 0
+    if config.has_option('cmd', 'remote_retries'):
+        retries = config.getint('cmd', 'remote_retries')
 
-    job.setup('jdk-8u321-linux-x64', pkg_format='.rpm')
+    tasks = target.tasks if hasattr(target, 'tasks') else [target]
+    results = aioremote.run_sync(aioremote.run_all(tasks, cmd, timeout=timeout, retries=retries))
+    return results if hasattr(target, 'tasks') else results[0]
 
-    env_str += f"export JAVA_HOME=/usr/java/jdk1.8.0_321-amd64 \n"
 
-    # set up hadoop
-    hadoop_version = config['hadoop']['version']
+def remote_run_many(commands, timeout=None):
+    """
+    commands: list of (task, step, cmd), run concurrently
+    Returns:
+    list of (task_name, step, exception) for report_failures
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
 
-    job.setup(f'hadoop-{hadoop_version}')
+    if timeout is None and config.has_option('cmd', 'remote_timeout'):
+        timeout = config.getfloat('cmd', 'remote_timeout')
+    retries = 0
+    if config.has_option('cmd', 'remote_retries'):
+        retries = config.getint('cmd', 'remote_retries')
 
-    env_str += f"export HADOOP_HOME=/opt/hadoop-{hadoop_version} \n"
-    env_str += f"export HADOOP_CONF_DIR=/opt/hadoop-{hadoop_version}/etc/hadoop \n"
+    results = aioremote.run_sync(aioremote.run_many([(task, cmd) for task, _, cmd in commands],
+                                                    return_exceptions=True, timeout=timeout, retries=retries))
+    return [(task.name, step, result) for (task, step, _), result in zip(commands, results)
+            if isinstance(result, Exception)]
 
-    # set up spark
-    spark_version = config['spark']['version']
-    job.setup(f'spark-{spark_version}', pkg_format='.tgz')
-    env_str += f"export SPARK_HOME=/opt/spark-{spark_version} \n"
 
-    # set up hive
-    hive_version = config['hive']['version']
-    job.setup(f'apache-hive-{hive_version}')
-    env_str += f"export HIVE_HOME=/opt/apache-hive-{hive_version} \n"
+def report_failures(failures, phase):
+    if not failures:
+        return
+    print(f"------{phase} failed on {len(failures)} task(s):")
+    for task_name, step, e in sorted(failures, key=lambda x: (x[0], x[1])):
+        print(f"  {task_name:<24} {step:<32} {type(e).__name__}: {e}")
+    raise RuntimeError(f"{phase} failed: " +
+                       ", ".join(f"{task_name}/{step}" for task_name, step, _ in failures))
 
-    env_str += f"export PATH=$PATH:$HADOOP_HOME/bin:$SPARK_HOME/bin:$HIVE_HOME/bin \n"
 
-    # hive thing and mysql metastore
-    job.upload(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/config/hive/hive-site.xml",
-               f"/opt/apache-hive-{hive_version}/conf/hive-site.xml")
-    job.upload(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/config/hive/hive-site.xml",
-               f"/opt/spark-{spark_version}/conf/hive-site.xml")
+@tracing.traced()
+def broadcast_pkgs(job, packages, mode, max_workers):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    pkg_dir = CTX.fastmr_path + "/resource"
+    if config.has_option('cmd', 'pkg_dir'):
+        pkg_dir = config['cmd']['pkg_dir']
+
+    failures = []
+    installs = []
+    for pkg_name, kwargs in packages:
+        pkg_format = kwargs.get('pkg_format', '.tar.gz')
+        remote_pkg = f"{BROADCAST_DIR}/{pkg_name}{pkg_format}"
+        for task_name, e in broadcast.broadcast_file(job.tasks, f"{pkg_dir}/{pkg_name}{pkg_format}", remote_pkg,
+                                                     mode=mode).items():
+            failures.append((task_name, f"broadcast {pkg_name}", e))
+        install = broadcast.install_cmd(remote_pkg, pkg_format, kwargs.get('path', '/opt'))
+        installs += [(task.name, pkg_name, task.run, (install,), {}) for task in job.tasks]
+    report_failures(failures, 'setup_pkg')
+    report_failures(run_concurrently(installs, max_workers), 'setup_pkg')
+
+
+@tracing.traced()
+def setup_pkg(job):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
 
-    job.setup('TPC')
+    hadoop_version = config['hadoop']['version']
+    spark_version = config['spark']['version']
+    hive_version = config['hive']['version']
+
+    env_str = ""
+    env_str += f"export JAVA_HOME=/usr/java/jdk1.8.0_321-amd64 \n"
+    env_str += f"export HADOOP_HOME=/opt/hadoop-{hadoop_version} \n"
+    env_str += f"export HADOOP_CONF_DIR=/opt/hadoop-{hadoop_version}/etc/hadoop \n"
+    env_str += f"export SPARK_HOME=/opt/spark-{spark_version} \n"
+    env_str += f"export HIVE_HOME=/opt/apache-hive-{hive_version} \n"
+    env_str += f"export PATH=$PATH:$HADOOP_HOME/bin:$SPARK_HOME/bin:$HIVE_HOME/bin \n"
 
-    job.setup('tpcds-kit', path='/root')
+    # (pkg_name, setup kwargs)
+    packages = [('jdk-8u321-linux-x64', {'pkg_format': '.rpm'}),
+                (f'hadoop-{hadoop_version}', {}),
+                (f'spark-{spark_version}', {'pkg_format': '.tgz'}),
+                (f'apache-hive-{hive_version}', {}),
+                ('TPC', {}),
+                ('tpcds-kit', {'path': '/root'})]
+    # hive thing and mysql metastore, 必须在 hive/spark 解压之后上传
+    hive_site = f"{CTX.target_dir}/config/hive/hive-site.xml"
+    uploads = [(hive_site, f"/opt/apache-hive-{hive_version}/conf/hive-site.xml"),
+               (hive_site, f"/opt/spark-{spark_version}/conf/hive-site.xml")]
+
+    parallel_setup = config.has_option('cmd', 'parallel_setup') and config.getboolean('cmd', 'parallel_setup')
+    setup_threads = 16
+    if config.has_option('cmd', 'setup_threads'):
+        setup_threads = config.getint('cmd', 'setup_threads')
+    # tree / star, 大包只从本机上传一次到 master, 再在内网分发
+    broadcast_mode = None
+    if config.has_option('cmd', 'broadcast'):
+        broadcast_mode = config['cmd']['broadcast']
+
+    if parallel_setup or broadcast_mode:
+        start_time = time.time()
+        if broadcast_mode:
+            broadcast_pkgs(job, packages, broadcast_mode, setup_threads)
+        else:
+            calls = [(task.name, pkg_name, task.setup, (pkg_name,), kwargs)
+                     for pkg_name, kwargs in packages for task in job.tasks]
+            report_failures(run_concurrently(calls, setup_threads), 'setup_pkg')
+
+        calls = [(task.name, f"upload {dst}", task.upload, (src, dst), {})
+                 for src, dst in uploads for task in job.tasks]
+        report_failures(run_concurrently(calls, setup_threads), 'setup_pkg')
+        print(f"{len(packages)} packages installed on {len(job.tasks)} tasks in {time.time() - start_time:.1f} s")
+    else:
+        for pkg_name, kwargs in packages:
+            job.setup(pkg_name, **kwargs)
+        for src, dst in uploads:
+            job.upload(src, dst)
 
     conf_env(job, env_str)
 
 
+@tracing.traced()
 def setup_env(job):
-    init_disk(job)
-
-    conf_hadoop(job)
-
-    conf_spark(job)
-
-    start_cluster(job.tasks[0], job)
-
-    # start_flame(job.tasks[0])
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    step_threads = 4
+    if config.has_option('cmd', 'step_threads'):
+        step_threads = config.getint('cmd', 'step_threads')
+    resume = True
+    if config.has_option('cmd', 'resume'):
+        resume = config.getboolean('cmd', 'resume')
+
+    master = job.tasks[0]
+    # 没有依赖关系的分支并发执行, 例如 mysql/hive 元数据库与 hdfs 格式化
+    graph = StepGraph('setup_env')
+    graph.add('init_disk', lambda: init_disk(job))
+    # 自动发现磁盘时 hdfs/yarn 目录要等 init_disk 的探测结果
+    graph.add('conf_hadoop', lambda: conf_hadoop(job), deps=['init_disk'] if disk_discovery() else [])
+    graph.add('conf_spark', lambda: conf_spark(job))
+    graph.add('stop_hadoop', lambda: stop_hadoop(master), deps=['conf_hadoop'])
+    graph.add('clean_hdfs', lambda: clean_hdfs(job), deps=['init_disk', 'stop_hadoop'])
+    graph.add('format_namenode', lambda: format_namenode(master), deps=['clean_hdfs'])
+    graph.add('start_dfs', lambda: start_dfs(master), deps=['format_namenode'])
+    graph.add('start_yarn', lambda: start_yarn(master), deps=['start_dfs'])
+    graph.add('start_history', lambda: start_history(master), deps=['start_dfs', 'conf_spark'])
+    graph.add('install_mysql', lambda: install_mysql(master))
+    graph.add('mysql_connect_jar', lambda: mysql_connect_jar(master), deps=['install_mysql'])
+    graph.add('config_mysql', lambda: config_mysql(master), deps=['install_mysql'])
+    graph.add('align_guava', lambda: align_guava(master))
+    graph.add('init_hive_schema', lambda: init_hive_schema(master),
+              deps=['config_mysql', 'mysql_connect_jar', 'align_guava', 'conf_hadoop'])
+    if flame_enabled():
+        graph.add('start_flame', lambda: start_flame(master), deps=['start_dfs'])
+
+    with open(CTX.conf_path, 'rb') as f:
+        fingerprint = hashlib.sha1(f.read()).hexdigest()
+    graph.run(state_file=CTX.target_dir + "/" + STEP_STATE_FILE,
+              fingerprint=fingerprint,
+              max_workers=step_threads,
+              resume=resume)
 
-    show_info(job.tasks[0])
+    print(f"browser yarn from http://{master.public_ip}:8034")
+    show_info(master)
 
 
 def show_info(master):
-    infofile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/cluster.info"
+    infofile = CTX.target_dir + "/cluster.info"
     with open(infofile, 'a+') as f:
         # f.write("------host infos:\n")
         # f.write(hostsstr)
@@ -275,44 +580,192 @@ def show_info(master):
 
 
 def conf_env(job, env_str):
-    env_file = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/system/env.sh"
-
-    with open(env_file, 'a+') as f:
-        f.write(f"{env_str}")
-        f.close()
-        # upload and source env
-    job.upload("target/" + CLUSTER_NAME + "/config/system/env.sh", "/etc/profile.d/env.sh")
+    write_generated("config/system/env.sh", benchscripts.ShellScript(template_text("config/system/env.sh"),
+                                                                     [env_str.rstrip()]).render())
+    # upload and source env
+    job.upload(CTX.target_dir + "/config/system/env.sh", "/etc/profile.d/env.sh")
     job.run('source /etc/profile.d/env.sh')
 
 
+def disk_discovery():
+    """[cmd] disk_discovery, on by default when total_disk_num is not given"""
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if config.has_option('cmd', 'disk_discovery'):
+        return config.getboolean('cmd', 'disk_discovery')
+    return not config.has_option('cmd', 'total_disk_num')
+
+
+def disk_layout():
+    layout_file = CTX.target_dir + "/" + DISK_LAYOUT_FILE
+    if not disk_discovery() or not os.path.exists(layout_file):
+        return None
+    with open(layout_file, encoding='utf-8') as f:
+        return json.load(f)
+
+
 def init_disk(job):
     config = ConfigParser()
 
-    config.read(CONF_PATH, encoding='UTF-8')
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    if disk_discovery():
+        discover_disks(job)
+        return
 
     disk_num = config['cmd']['total_disk_num']
 
-    job.run('mkdir -p /root/' + CLUSTER_NAME + '/system')
-    job.upload(FASTMR_PATH + '/trans/config/system', "/root/" + CLUSTER_NAME + "/system")
+    job.run('mkdir -p /root/' + CTX.cluster_name + '/system')
+    upload_dir(job, CTX.fastmr_path + '/trans/config/system', "/root/" + CTX.cluster_name + "/system")
 
     # 如果是 windows 上传的 shell 需要转换下格式
     if os.name == 'nt':
-        job.run('dos2unix /root/' + CLUSTER_NAME + '/* ')
+        job.run('dos2unix /root/' + CTX.cluster_name + '/* ')
 
     if config.has_option('cmd', 'local_disk_type') and config.get('cmd', 'local_disk_type') == 'nvme':
-        job.run('sh /root/' + CLUSTER_NAME + '/system/mkfs_nvme.sh ' + disk_num)
+        remote_run(job, 'sh /root/' + CTX.cluster_name + '/system/mkfs_nvme.sh ' + disk_num)
     else:
-        job.run('sh /root/' + CLUSTER_NAME + '/system/mkfs-ad.sh ' + disk_num)
+        remote_run(job, 'sh /root/' + CTX.cluster_name + '/system/mkfs-ad.sh ' + disk_num)
+
+
+def discover_disks(job):
+    """
+    Find the data disks of every node, mkfs and mount the new ones in parallel on all nodes,
+    probe their throughput and plan the HDFS data dirs and YARN local dirs from the result.
+    The plan is saved to target/<cluster>/disks.json for conf_hadoop and clean_hdfs.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    min_size_gb = 20
+    if config.has_option('cmd', 'disk_min_size_gb'):
+        min_size_gb = config.getfloat('cmd', 'disk_min_size_gb')
+    probe = True
+    if config.has_option('cmd', 'disk_probe'):
+        probe = config.getboolean('cmd', 'disk_probe')
+    probe_mb = 1024
+    if config.has_option('cmd', 'disk_probe_mb'):
+        probe_mb = config.getint('cmd', 'disk_probe_mb')
+    probe_seconds = 10
+    if config.has_option('cmd', 'disk_probe_seconds'):
+        probe_seconds = config.getint('cmd', 'disk_probe_seconds')
+    shuffle_fraction = 0.5
+    if config.has_option('cmd', 'shuffle_disk_fraction'):
+        shuffle_fraction = config.getfloat('cmd', 'shuffle_disk_fraction')
+    max_weight = 4
+    if config.has_option('cmd', 'max_dir_weight'):
+        max_weight = config.getint('cmd', 'max_dir_weight')
+
+    node_disks = mount_disks(job.tasks, min_size_gb)
+
+    if probe:
+        def run_probe(task):
+            results = disks.parse_probe(task.run(disks.probe_cmd([d['mount'] for d in node_disks[task.name]],
+                                                                 probe_mb, probe_seconds)))
+            for d in node_disks[task.name]:
+                d.update(results.get(d['mount'], {}))
+
+        # 同一节点上逐盘测, 节点之间并发
+        report_failures(run_concurrently([(task.name, 'probe', run_probe, (task,), {}) for task in job.tasks], 16),
+                        'disk probe')
+
+    aggregated = disks.aggregate(node_disks)
+    layout = disks.plan_layout(aggregated, len(job.tasks), shuffle_fraction, max_weight)
+    assert layout['hdfs'], "no data disk found on the nodes, set [cmd] total_disk_num to use the mkfs scripts"
+    with open(CTX.target_dir + "/" + DISK_LAYOUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'nodes': node_disks, 'disks': aggregated, 'layout': layout}, f, indent=1)
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("------disk infos:\n")
+        f.write(disks.format_disks(aggregated))
+        for note in layout['notes']:
+            f.write(f"{note}\n")
+        f.write(f"dfs.datanode.data.dir {','.join(layout['hdfs'])}\n")
+        f.write(f"yarn.nodemanager.local-dirs {','.join(layout['yarn'])}\n")
+    print(disks.format_disks(aggregated))
+    return layout
+
+
+def mount_disks(tasks, min_size_gb):
+    """
+    Returns:
+    node -> data disks found by lsblk, the new ones formatted and mounted in parallel
+    """
+    node_disks = {}
+
+    def discover(task):
+        node_disks[task.name] = disks.assign_mounts(disks.parse_lsblk(task.run(disks.DISCOVER_CMD), min_size_gb))
+
+    report_failures(run_concurrently([(task.name, 'lsblk', discover, (task,), {}) for task in tasks], 16),
+                    'disk discovery')
+    report_failures(remote_run_many([(task, 'mkfs/mount', disks.mount_cmd(node_disks[task.name]))
+                                     for task in tasks]), 'mkfs')
+    return node_disks
+
+
+def attach_disks(group):
+    """
+    Data disks of nodes joining a running cluster. The HDFS/YARN directories stay as planned
+    for the existing nodes, so every planned mount point has to show up on the new nodes.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    layout = disk_layout()
+    if layout is None:
+        # 开启自动发现时由 gen_hadoop_conf 对整个集群重新发现, 只看新节点会得到错误的规划
+        if not disk_discovery():
+            init_disk(group)
+        return
+    min_size_gb = 20
+    if config.has_option('cmd', 'disk_min_size_gb'):
+        min_size_gb = config.getfloat('cmd', 'disk_min_size_gb')
+
+    node_disks = mount_disks(group.tasks, min_size_gb)
+    planned = {d.split('/data/')[0] for d in layout['layout']['hdfs'] + layout['layout']['yarn']}
+    missing = [f"{name}:{mount}" for name, devices in node_disks.items()
+               for mount in sorted(planned - {d['mount'] for d in devices})]
+    assert not missing, f"planned data disks missing on the new nodes: {', '.join(missing)}"
+    layout['nodes'].update(node_disks)
+    with open(CTX.target_dir + "/" + DISK_LAYOUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(layout, f, indent=1)
 
 
 def conf_hadoop(job):
+    gen_hadoop_conf(job)
+
     config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
+    job.upload(CTX.target_dir + "/config/system/hosts", "/etc/hosts")
+    job.run("mkdir -p /etc/clustershell/groups.d")
+    job.upload(CTX.target_dir + "/config/system/local.cfg",
+               "/etc/clustershell/groups.d/local.cfg")
 
-    config.read(CONF_PATH, encoding='UTF-8')
+    # short-circuit read 的 socket 目录, 父目录不能是全局可写的
+    job.run(f"mkdir -p {os.path.dirname(hadoopprofile.SHORT_CIRCUIT_SOCKET)} && "
+            f"chmod 755 {os.path.dirname(hadoopprofile.SHORT_CIRCUIT_SOCKET)}")
+    upload_dir(job, f"{CTX.target_dir}/config/hadoop-{hadoop_version}",
+               f"/opt/hadoop-{hadoop_version}/etc/hadoop")
+    # 每个节点的 NodeManager 资源不同, 覆盖共享的 yarn-site.xml
+    report_failures(run_concurrently([(task.name, 'upload yarn-site', task.upload,
+                                       (node_yarn_site(task.name), f"/opt/hadoop-{hadoop_version}/etc/hadoop/yarn-site.xml"),
+                                       {}) for task in job.tasks], 16), 'conf_hadoop')
+    # 如果是 windows 上传的 shell 需要转换下格式
+    if os.name == "nt":
+        job.run(f"dos2unix /opt/hadoop-{hadoop_version}/etc/hadoop/*")
+
+
+def gen_hadoop_conf(job):
+    """generate hosts, the clustershell group, workers, hdfs-site.xml and yarn-site.xml under target/<cluster>"""
+    config = ConfigParser()
+
+    config.read(CTX.conf_path, encoding='UTF-8')
 
     hadoop_version = config['hadoop']['version']
     instancename = config['ncluster']['instancename']
-    disk_num = config.getint('cmd', 'total_disk_num')
     # # system hosts file
     hostsstr = ""
     slavesstr = ""
@@ -327,44 +780,34 @@ def conf_hadoop(job):
         else:
             hostsstr += f"{ip}  {hostname} \n"
 
-    hostfile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/system/hosts"
-    with open(hostfile, 'a+') as f:
-        f.write(f"{hostsstr}")
-        f.close()
+    # reconfigure/扩缩容会再次调用, 每次从模板重新生成
+    write_generated("config/system/hosts", template_text("config/system/hosts") + hostsstr)
 
     # clushtershell cfgfile
     # all: task[0-2].mracc-d2s
-    clushfile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/system/local.cfg"
-    with open(clushfile, 'a+') as f:
-        f.write(f"all: {instancename}[0-{len(job.tasks) - 1}]")
-        f.close()
-
-    job.upload(FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/system/hosts", "/etc/hosts")
-    job.run("mkdir -p /etc/clustershell/groups.d")
-    job.upload(FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/system/local.cfg",
-               "/etc/clustershell/groups.d/local.cfg")
+    write_generated("config/system/local.cfg", template_text("config/system/local.cfg") +
+                    f"all: {instancename}[0-{len(job.tasks) - 1}]")
 
     # hdfs-site.xml
     # slaves
-    slavesfile = FASTMR_PATH + "/target/" + CLUSTER_NAME + f"/config/hadoop-{hadoop_version}/slaves"
-    if hadoop_version == '3.2.1' or hadoop_version == '3.3.1':
-        slavesfile = FASTMR_PATH + "/target/" + CLUSTER_NAME + f"/config/hadoop-{hadoop_version}/workers"
-    with open(slavesfile, 'a+') as f:
-        f.write(f"{slavesstr}")
-        f.close()
-
-    hdfsdatadir = ""
-    yarnlocaldir = ""
-
-    for i in range(disk_num - 1):
-        if i == 0:
-            hdfsdatadir += f"/mnt/disk{i + 1}/data/hadoop"
-            yarnlocaldir += f"/mnt/disk{i + 1}/data/nmlocaldir"
-        else:
-            hdfsdatadir += f",/mnt/disk{i + 1}/data/hadoop"
-            yarnlocaldir += f",/mnt/disk{i + 1}/data/nmlocaldir"
+    slaves_rel = f"config/hadoop-{hadoop_version}/{workers_file(hadoop_version)}"
+    write_generated(slaves_rel, template_text(slaves_rel) + slavesstr)
+
+    layout = disk_layout()
+    if layout is None and disk_discovery():
+        # 换了机器或 target/ 被清掉, disks.json 没了; 重新发现, 已挂载的盘保持原来的挂载点
+        print(f"no {DISK_LAYOUT_FILE} for {CTX.cluster_name}, discovering the data disks again")
+        discover_disks(job)
+        layout = disk_layout()
+    if layout is not None:
+        hdfsdatadir = ",".join(layout['layout']['hdfs'])
+        yarnlocaldir = ",".join(layout['layout']['yarn'])
+    else:
+        disk_num = config.getint('cmd', 'total_disk_num')
+        hdfsdatadir = ",".join(f"/mnt/disk{i + 1}/data/hadoop" for i in range(disk_num))
+        yarnlocaldir = ",".join(f"/mnt/disk{i + 1}/data/nmlocaldir" for i in range(disk_num))
 
-    hdfssitefile = FASTMR_PATH + "/target/" + CLUSTER_NAME + f"/config/hadoop-{hadoop_version}/hdfs-site.xml"
+    hdfssitefile = CTX.target_dir + f"/config/hadoop-{hadoop_version}/hdfs-site.xml"
     hdfstree = ET.parse(hdfssitefile)
 
     root = hdfstree.getroot()
@@ -375,287 +818,1743 @@ def conf_hadoop(job):
     hdfstree.write(hdfssitefile)
 
     # yarn-site.xml
-
-    vcpunum = job.tasks[0].instance.cpu()
-    meminfo = job.tasks[0].instance.memory()
-    yarnsitefile = FASTMR_PATH + "/target/" + CLUSTER_NAME + f"/config/hadoop-{hadoop_version}/yarn-site.xml"
+    yarnsitefile = CTX.target_dir + f"/config/hadoop-{hadoop_version}/yarn-site.xml"
     yarntree = ET.parse(yarnsitefile)
     root = yarntree.getroot()
     for iproperty in root.findall("property"):
         if iproperty.find("name").text == "yarn.nodemanager.local-dirs":
             iproperty.find("value").text = yarnlocaldir
-        if iproperty.find("name").text == "yarn.nodemanager.resource.memory-mb":
-            iproperty.find("value").text = str(meminfo)
-        if iproperty.find("name").text == "yarn.scheduler.maximum-allocation-mb":
-            iproperty.find("value").text = str(meminfo)
-        if iproperty.find("name").text == "yarn.nodemanager.resource.cpu-vcores":
-            iproperty.find("value").text = str(vcpunum)
-        if iproperty.find("name").text == "yarn.scheduler.maximum-allocation-vcores":
-            iproperty.find("value").text = str(vcpunum)
     yarntree.write(yarnsitefile)
 
-    job.upload(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/config/hadoop-{hadoop_version}",
-               f"/opt/hadoop-{hadoop_version}/etc/hadoop")
-    # 如果是 windows 上传的 shell 需要转换下格式
-    if os.name == "nt":
-        job.run(f"dos2unix /opt/hadoop-{hadoop_version}/etc/hadoop/*")
+    # 缩容时写入要下线的节点, 平时为空
+    conf_dir = CTX.target_dir + f"/config/hadoop-{hadoop_version}"
+    with open(f"{conf_dir}/{elastic.EXCLUDES_FILE}", 'w') as f:
+        f.write("")
+    for site_file, props in elastic.exclude_props(hadoop_version).items():
+        hadoopprofile.apply_overlay(f"{conf_dir}/{site_file}", props)
+
+    nodes = cluster_nodes(job.tasks)
+    # 共享的配置按最小的节点生成
+    apply_hadoop_profile(min(n[0] for n in nodes), min(n[1] for n in nodes), len(job.tasks),
+                         len(hdfsdatadir.split(',')))
+    gen_node_yarn_conf(job.tasks, nodes)
+
+
+def write_info_section(header, text):
+    """
+    Put a section into cluster.info, replacing the one with the same header line up to the
+    next ------ header, so regenerating the config (reconfigure, scale, sweep) keeps one copy.
+    """
+    infofile = CTX.target_dir + "/cluster.info"
+    lines = []
+    if os.path.exists(infofile):
+        with open(infofile, encoding='utf-8') as f:
+            lines = f.read().splitlines(keepends=True)
+    section = [header + "\n"] + text.splitlines(keepends=True)
+    if header + "\n" in lines:
+        start = lines.index(header + "\n")
+        end = next((i for i in range(start + 1, len(lines)) if lines[i].startswith("------")), len(lines))
+        lines[start:end] = section
+    else:
+        lines += section
+    with open(infofile, 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
+
+
+def cluster_nodes(tasks):
+    """(vcpu, memory MB) of every node, the master first"""
+    return [(task.instance.cpu(), task.instance.memory()) for task in tasks]
+
+
+def node_sizing_kwargs(nodes):
+    """
+    Daemon footprint and YARN allocation unit shared by the per-node yarn-site.xml and the
+    spark sizing, so that both see the same container capacity on every node.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+    site_config = ConfigParser()
+    # 属性名区分大小写
+    site_config.optionxform = str
+    site_config.read(CTX.conf_path, encoding='UTF-8')
+
+    kwargs = {}
+    if config.has_option('spark', 'reserved_cores'):
+        kwargs['reserved_cores'] = config.getint('spark', 'reserved_cores')
+    if config.has_option('spark', 'reserved_mem_mb'):
+        kwargs['reserved_mem_mb'] = config.getint('spark', 'reserved_mem_mb')
+    if config.has_option('spark', 'master_reserved_cores'):
+        kwargs['master_reserved_cores'] = config.getint('spark', 'master_reserved_cores')
+    if config.has_option('spark', 'master_reserved_mem_mb'):
+        kwargs['master_reserved_mem_mb'] = config.getint('spark', 'master_reserved_mem_mb')
+
+    # 最小分配单位和 apply_hadoop_profile 的来源一致: [yarn-site], 推导的 profile, trans/ 的模板.
+    # 不读 target 下生成的文件, skip_setup 时 copy_conf 会把它还原成模板
+    name = 'yarn.scheduler.minimum-allocation-mb'
+    use_profile = not config.has_option('hadoop', 'profile') or config.getboolean('hadoop', 'profile')
+    if site_config.has_option('yarn-site', name):
+        kwargs['yarn_min_allocation_mb'] = int(site_config['yarn-site'][name])
+    elif use_profile:
+        profile, _ = hadoopprofile.derive_profile(min(n[0] for n in nodes), min(n[1] for n in nodes), len(nodes), 1)
+        kwargs['yarn_min_allocation_mb'] = int(profile['yarn-site.xml'][name])
+    else:
+        yarnsitefile = f"{CTX.fastmr_path}/trans/config/hadoop-{hadoop_version}/yarn-site.xml"
+        if os.path.exists(yarnsitefile):
+            for iproperty in ET.parse(yarnsitefile).getroot().findall("property"):
+                if iproperty.find("name").text == name:
+                    kwargs['yarn_min_allocation_mb'] = int(iproperty.find("value").text)
+    return kwargs
+
+
+def node_yarn_site(task_name):
+    return CTX.target_dir + f"/config/nodes/{task_name}/yarn-site.xml"
+
+
+def gen_node_yarn_conf(tasks, nodes):
+    """
+    One yarn-site.xml per node under target/<cluster>/config/nodes/<task>: the NodeManager
+    offers the node's vcpu and memory minus its daemon footprint (sparksizing.node_capacity).
+    The shared yarn-site.xml keeps the smallest node, the maximum allocation is the largest
+    node everywhere. Properties set in the [yarn-site] section are left alone.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
+    kwargs = node_sizing_kwargs(nodes)
+    capacity = [sparksizing.node_capacity(vcpu, mem, i == 0, **kwargs) for i, (vcpu, mem) in enumerate(nodes)]
+    max_vcores = max(c[0] for c in capacity)
+    max_mem_mb = max(c[1] for c in capacity)
+
+    def props(vcores, mem_mb):
+        values = {'yarn.nodemanager.resource.cpu-vcores': str(vcores),
+                  'yarn.nodemanager.resource.memory-mb': str(mem_mb),
+                  'yarn.scheduler.maximum-allocation-vcores': str(max_vcores),
+                  'yarn.scheduler.maximum-allocation-mb': str(max_mem_mb)}
+        return {k: v for k, v in values.items() if not config.has_option('yarn-site', k)}
+
+    yarnsitefile = CTX.target_dir + f"/config/hadoop-{hadoop_version}/yarn-site.xml"
+    hadoopprofile.apply_overlay(yarnsitefile, props(min(c[0] for c in capacity), min(c[1] for c in capacity)))
+    for task, (vcores, mem_mb, _, _) in zip(tasks, capacity):
+        node_file = node_yarn_site(task.name)
+        os.makedirs(os.path.dirname(node_file), exist_ok=True)
+        shutil.copyfile(yarnsitefile, node_file)
+        hadoopprofile.apply_overlay(node_file, props(vcores, mem_mb))
+
+    lines = [f"{'node':<24}{'vcpu':>6}{'mem MB':>9}{'reserved':>10}{'res MB':>8}{'yarn vcores':>13}{'yarn MB':>9}\n"]
+    for task, (vcpu, mem), (vcores, mem_mb, res_cores, res_mb) in zip(tasks, nodes, capacity):
+        lines.append(f"{task.name:<24}{vcpu:>6}{mem:>9}{res_cores:>10}{res_mb:>8}{vcores:>13}{mem_mb:>9}\n")
+    write_info_section("------node capacity:", "".join(lines))
+
+
+def apply_hadoop_profile(vcpunum, meminfo, machines, disks_per_node):
+    """
+    Overlay the hardware derived hadoopprofile on the *-site.xml files, then the
+    [core-site] / [hdfs-site] / [yarn-site] / [mapred-site] sections of the config,
+    adding properties the static files do not have. [hadoop] profile = false skips the
+    derived part.
+    """
+    config = ConfigParser()
+    # 属性名区分大小写
+    config.optionxform = str
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    hadoop_version = config['hadoop']['version']
+    use_profile = True
+    if config.has_option('hadoop', 'profile'):
+        use_profile = config.getboolean('hadoop', 'profile')
+
+    profile, notes = hadoopprofile.derive_profile(vcpunum, meminfo, machines, disks_per_node)
+    if not use_profile:
+        profile, notes = {f: {} for f in hadoopprofile.SITE_FILES}, {}
+    for site_file in hadoopprofile.SITE_FILES:
+        section = site_file[:-len('.xml')]
+        if config.has_section(section):
+            for name, value in config.items(section):
+                profile[site_file][name] = value
+                notes[name] = f"[{section}] in {os.path.basename(CTX.conf_path)}"
+
+    conf_dir = CTX.target_dir + f"/config/hadoop-{hadoop_version}"
+    for site_file, props in profile.items():
+        if props and os.path.exists(f"{conf_dir}/{site_file}"):
+            hadoopprofile.apply_overlay(f"{conf_dir}/{site_file}", props)
+
+    write_info_section("------hadoop profile:", hadoopprofile.format_profile(profile, notes))
 
 
 # 将生成的spark-defaults.conf上传到opt目录下
 def conf_spark(job):
     config = ConfigParser()
-    config.read(CONF_PATH, encoding='UTF-8')
+    config.read(CTX.conf_path, encoding='UTF-8')
 
     spark_version = config['spark']['version']
 
     # 将这里的spark_conf改成我自己的文件
-    spark_conf = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/spark/spark-defaults.conf"
+    spark_conf = CTX.target_dir + "/config/spark/spark-defaults.conf"
     job.upload(spark_conf, f"/opt/spark-{spark_version}/conf")
 
 
-def start_cluster(master, job):
+def stop_hadoop(master):
     config = ConfigParser()
-
-    config.read(CONF_PATH, encoding='UTF-8')
-
+    config.read(CTX.conf_path, encoding='UTF-8')
     hadoop_version = config['hadoop']['version']
-    spark_version = config['spark']['version']
-    disk_num = config['cmd']['total_disk_num']
 
     master.run(f"/opt/hadoop-{hadoop_version}/sbin/stop-yarn.sh")
     master.run(f"/opt/hadoop-{hadoop_version}/sbin/stop-dfs.sh")
+
+
+def clean_hdfs(job):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
     # 所有节点 重新初始化集群之前先清理hdfs目录
+    layout = disk_layout()
+    if layout is not None:
+        job.run(disks.clean_cmd(layout['layout']['hdfs']))
+        return
+    disk_num = config['cmd']['total_disk_num']
     job.run("for i in {1.." + disk_num + "};do rm -rf /mnt/disk$i/data/hadoop; done")
-    master.run("hdfs namenode -format -force")
+
+
+def format_namenode(master):
+    remote_run(master, "hdfs namenode -format -force")
+
+
+def start_dfs(master):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
     master.run(f"/opt/hadoop-{hadoop_version}/sbin/start-dfs.sh")
-    master.run("hadoop fs -mkdir /sparklogs")
+    master.run("hadoop fs -mkdir -p /sparklogs")
+
+
+def start_yarn(master):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
     master.run(f"/opt/hadoop-{hadoop_version}/sbin/start-yarn.sh")
+
+
+def start_history(master):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    spark_version = config['spark']['version']
+
     # 重启 spark history
     master.run(f"/opt/spark-{spark_version}/sbin/stop-history-server.sh")
     master.run(f"/opt/spark-{spark_version}/sbin/start-history-server.sh")
 
-    print(f"browser yarn from http://{master.public_ip}:8034")
 
+def install_mysql(master):
     if not master.exists("/usr/bin/mysql"):
-
         master.run('yum install -y mysql-server.x86_64')
-        # install driver
-        mysql_connect_jar(master)
-        # 启动 meta store db mysql
-        config_mysql(master)
 
-        # 解决guava.jar版本问题
-        align_guava(master)
 
-        # hive初始化
+def init_hive_schema(master):
+    # 已经初始化过的元数据库 -info 会成功返回
+    try:
+        master.run('schematool -dbType mysql -info')
+    except Exception:
         master.run('schematool -dbType mysql -initSchema')
-    else:
-        master.run("service mysqld restart")
+
+
+def start_cluster(master, job):
+    stop_hadoop(master)
+    clean_hdfs(job)
+    format_namenode(master)
+    start_dfs(master)
+    start_yarn(master)
+    start_history(master)
+
+    print(f"browser yarn from http://{master.public_ip}:8034")
+
+    install_mysql(master)
+    # install driver
+    mysql_connect_jar(master)
+    # 启动 meta store db mysql
+    config_mysql(master)
+    # 解决guava.jar版本问题
+    align_guava(master)
+    # hive初始化
+    init_hive_schema(master)
+
+
+def deployed_files(task_name=None):
+    """
+    (group, local file, remote file) of every generated config that is pushed to the nodes,
+    with the node's own yarn-site.xml when task_name is given
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+    spark_version = config['spark']['version']
+    hive_version = config['hive']['version']
+
+    target = CTX.target_dir + "/config"
+    files = [('system', f"{target}/system/hosts", "/etc/hosts"),
+             ('system', f"{target}/system/local.cfg", "/etc/clustershell/groups.d/local.cfg"),
+             ('spark', f"{target}/spark/spark-defaults.conf", f"/opt/spark-{spark_version}/conf/spark-defaults.conf"),
+             ('hive', f"{target}/hive/hive-site.xml", f"/opt/apache-hive-{hive_version}/conf/hive-site.xml"),
+             ('hive', f"{target}/hive/hive-site.xml", f"/opt/spark-{spark_version}/conf/hive-site.xml")]
+    hadoop_dir = f"{target}/hadoop-{hadoop_version}"
+    for rel in sorted(uploadcache.dir_hashes(hadoop_dir)):
+        local = f"{hadoop_dir}/{rel}"
+        if rel == 'yarn-site.xml' and task_name is not None and os.path.exists(node_yarn_site(task_name)):
+            local = node_yarn_site(task_name)
+        files.append(('hadoop', local, f"/opt/hadoop-{hadoop_version}/etc/hadoop/{rel}"))
+    return files
+
+
+def wait_for(master, cmd, expected, what, timeout=300):
+    """poll cmd on master until it prints a number >= expected"""
+    start_time = time.time()
+    while True:
+        out = master.run(f"{cmd} 2>/dev/null || true").strip()
+        count = int(out) if out.isdigit() else 0
+        if count >= expected:
+            return
+        if time.time() - start_time > timeout:
+            raise RuntimeError(f"{what}: {count}/{expected} after {timeout} s")
+        time.sleep(5)
+
+
+@tracing.traced()
+def reconfigure(job):
+    """
+    Regenerate the Hadoop/Spark/Hive configs, push only the files whose sha256 differs from
+    what is deployed on each node and restart only the daemons they affect. DataNodes and
+    NodeManagers restart rolling in batches of [cmd] rolling_batch nodes. HDFS is formatted
+    only with [cmd] format_hdfs = true.
+    Returns:
+    dict node -> changed remote files
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    rolling_batch = 1
+    if config.has_option('cmd', 'rolling_batch'):
+        rolling_batch = config.getint('cmd', 'rolling_batch')
+    format_hdfs = config.has_option('cmd', 'format_hdfs') and config.getboolean('cmd', 'format_hdfs')
+
+    master = job.tasks[0]
+    gen_hadoop_conf(job)
+    job.run(f"mkdir -p {os.path.dirname(hadoopprofile.SHORT_CIRCUIT_SOCKET)} && "
+            f"chmod 755 {os.path.dirname(hadoopprofile.SHORT_CIRCUIT_SOCKET)}")
+    changes = push_changed_config(job.tasks)
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("-------------reconfigure---------------\n")
+        for task in job.tasks:
+            for _, _, remote in changes[task.name]:
+                f.write(f"{task.name} {remote}\n")
+    print("changed: " + (", ".join(f"{n} {len(c)} file(s)" for n, c in changes.items() if c) or "nothing"))
+
+    if format_hdfs:
+        print("[cmd] format_hdfs = true, formatting HDFS")
+        stop_hadoop(master)
+        clean_hdfs(job)
+        format_namenode(master)
+        start_dfs(master)
+        start_yarn(master)
+        start_history(master)
+        return {name: [r for _, _, r in c] for name, c in changes.items()}
+
+    restart_changed(job, changes, rolling_batch)
+    return {name: [r for _, _, r in c] for name, c in changes.items()}
+
+
+def push_changed_config(tasks):
+    """
+    Push the generated configs whose sha256 differs from what is deployed on each of tasks.
+    Returns:
+    dict node -> changed (group, local file, remote file)
+    """
+    node_files = {task.name: deployed_files(task.name) for task in tasks}
+    local_hashes = {local: uploadcache.file_hash(local) for files in node_files.values() for _, local, _ in files}
+    changes = {}
+
+    def push(task):
+        files = node_files[task.name]
+        remote_hashes = confdiff.parse_sha256sum(task.run(confdiff.hashes_cmd([r for _, _, r in files])))
+        node_changes = confdiff.changed(files, local_hashes, remote_hashes)
+        for remote_dir in sorted({os.path.dirname(r) for _, _, r in node_changes}):
+            task.run(f"mkdir -p {remote_dir}")
+        for _, local, remote in node_changes:
+            task.upload(local, remote)
+        changes[task.name] = node_changes
+
+    report_failures(run_concurrently([(task.name, 'push config', push, (task,), {}) for task in tasks], 16),
+                    'push config')
+    return changes
+
+
+def restart_changed(job, changes, rolling_batch=1):
+    """
+    Restart the daemons affected by changes (node -> changed files, nodes missing from it are
+    unchanged): NameNode / ResourceManager on the master, DataNodes and NodeManagers rolling
+    in batches of rolling_batch, each batch waits until all nodes registered again.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
+    master = job.tasks[0]
+    node_services = {task.name: confdiff.affected(changes.get(task.name, [])) for task in job.tasks}
+    master_services = node_services[master.name]
+    if 'namenode' in master_services:
+        print("restart namenode")
+        master.run(confdiff.restart_cmd(hadoop_version, 'namenode'))
+        master.run("hdfs dfsadmin -safemode wait")
+    if 'resourcemanager' in master_services:
+        print("restart resourcemanager")
+        master.run(confdiff.restart_cmd(hadoop_version, 'resourcemanager'))
+    elif any('queues' in s for s in node_services.values()):
+        master.run("yarn rmadmin -refreshQueues")
+
+    # 滚动重启, 每批等节点重新注册后再继续
+    total = len(job.tasks)
+    for daemon, live_cmd in (('datanode', "hdfs dfsadmin -report -live | grep -c '^Name:'"),
+                             ('nodemanager', "yarn node -list -states RUNNING | grep -c RUNNING")):
+        restart = [task for task in job.tasks if daemon in node_services[task.name]]
+        for batch in confdiff.batches(restart, rolling_batch):
+            print(f"restart {daemon} on {', '.join(task.name for task in batch)}")
+            report_failures(run_concurrently([(task.name, f"restart {daemon}", task.run,
+                                               (confdiff.restart_cmd(hadoop_version, daemon),), {})
+                                              for task in batch], rolling_batch), 'restart')
+            wait_for(master, live_cmd, total, f"live {daemon}s")
+
+    if 'history' in master_services:
+        start_history(master)
+
+
+class TaskGroup:
+    """job-like view over some of the tasks, the setup steps then only touch those nodes"""
+
+    def __init__(self, name, tasks):
+        self.name = name
+        self.tasks = list(tasks)
+
+    def run(self, cmd, *args, **kwargs):
+        for task in self.tasks:
+            task.run(cmd, *args, **kwargs)
+
+    def upload(self, *args, **kwargs):
+        for task in self.tasks:
+            task.upload(*args, **kwargs)
+
+    def setup(self, *args, **kwargs):
+        for task in self.tasks:
+            task.setup(*args, **kwargs)
+
+
+def workers_file(hadoop_version):
+    return 'workers' if hadoop_version == '3.2.1' or hadoop_version == '3.3.1' else 'slaves'
+
+
+@tracing.traced()
+def scale_cluster(job):
+    """
+    Grow or shrink a running cluster to the tasks of job ([scale] machines). Tasks missing
+    from the workers file on the master join HDFS/YARN, deployed workers that are no longer
+    tasks of the job are decommissioned. The other nodes keep their data and daemons.
+    Returns:
+    (added hostnames, removed hostnames)
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
+    master = job.tasks[0]
+    deployed = elastic.parse_workers(
+        master.run(f"cat /opt/hadoop-{hadoop_version}/etc/hadoop/{workers_file(hadoop_version)} 2>/dev/null || true"))
+    assert deployed, f"no deployed cluster on {master.name}, run the normal setup first"
+    hosts = [task.instance.host_name() for task in job.tasks]
+    added, removed = elastic.plan(deployed, hosts)
+    print(f"scale {len(deployed)} -> {len(hosts)} nodes, add {added or 'none'}, remove {removed or 'none'}")
+
+    if removed:
+        scale_in(job, removed)
+    if added:
+        scale_out(job, [task for task, host in zip(job.tasks, hosts) if host in added])
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("-------------scale---------------\n")
+        f.write(f"{len(deployed)} -> {len(hosts)} nodes\n")
+        for host in added:
+            f.write(f"added {host}\n")
+        for host in removed:
+            f.write(f"decommissioned {host}\n")
+    return added, removed
+
+
+def scale_out(job, new_tasks):
+    """
+    Packages, disks and configs on the new tasks, then start their DataNode/NodeManager. The
+    existing nodes get every config that changed with the cluster size, the daemons those
+    changes affect restart rolling ([cmd] rolling_batch).
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+    rolling_batch = 1
+    if config.has_option('cmd', 'rolling_batch'):
+        rolling_batch = config.getint('cmd', 'rolling_batch')
+
+    master = job.tasks[0]
+    group = TaskGroup(CTX.cluster_name + "-new", new_tasks)
+    setup_pkg(group)
+    attach_disks(group)
+
+    # hosts / workers / 每个节点的 yarn-site 按整个集群重新生成
+    gen_hadoop_conf(job)
+    target = CTX.target_dir + "/config"
+    hadoop_conf = f"/opt/hadoop-{hadoop_version}/etc/hadoop"
+    job.upload(f"{target}/system/hosts", "/etc/hosts")
+    job.run("mkdir -p /etc/clustershell/groups.d")
+    job.upload(f"{target}/system/local.cfg", "/etc/clustershell/groups.d/local.cfg")
+    group.run(f"mkdir -p {os.path.dirname(hadoopprofile.SHORT_CIRCUIT_SOCKET)} && "
+              f"chmod 755 {os.path.dirname(hadoopprofile.SHORT_CIRCUIT_SOCKET)}")
+    upload_dir(group, f"{target}/hadoop-{hadoop_version}", hadoop_conf)
+    conf_spark(group)
+    report_failures(run_concurrently([(task.name, 'upload yarn-site', task.upload,
+                                       (node_yarn_site(task.name), f"{hadoop_conf}/yarn-site.xml"), {})
+                                      for task in new_tasks], 16), 'scale out')
+    # 已有节点推送所有变了的配置: workers/excludes, 以及随集群规模变化的 profile
+    # (namenode handler 数, maximum-allocation), 后者要重启对应的服务
+    changes = push_changed_config([task for task in job.tasks if task not in new_tasks])
+
+    for cmd in elastic.refresh_cmds(hadoop_version):
+        master.run(cmd)
+    report_failures(remote_run_many([(task, 'start daemons',
+                                      f"{confdiff.daemon_cmd(hadoop_version, 'datanode', 'start')} && "
+                                      f"{confdiff.daemon_cmd(hadoop_version, 'nodemanager', 'start')}")
+                                     for task in new_tasks]), 'scale out')
+    # workers / excludes 已经由 refreshNodes 生效, 不为它们重启
+    node_list = (workers_file(hadoop_version), elastic.EXCLUDES_FILE)
+    restart_changed(job, {name: [c for c in node_changes if os.path.basename(c[2]) not in node_list]
+                          for name, node_changes in changes.items()}, rolling_batch)
+    wait_for(master, "hdfs dfsadmin -report -live | grep -c '^Name:'", len(job.tasks), "live datanodes")
+    wait_for(master, "yarn node -list -states RUNNING | grep -c RUNNING", len(job.tasks), "live nodemanagers")
+
+
+def scale_in(job, removed):
+    """
+    Graceful decommission of the removed hosts: list them in the excludes file, wait until
+    HDFS re-replicated their blocks and YARN drained their containers ([scale]
+    decommission_timeout seconds), stop their daemons and drop them from hosts/workers on
+    the remaining nodes. The instances themselves are left running.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+    timeout = 3600
+    if config.has_option('scale', 'decommission_timeout'):
+        timeout = config.getint('scale', 'decommission_timeout')
+
+    master = job.tasks[0]
+    hadoop_conf = f"/opt/hadoop-{hadoop_version}/etc/hadoop"
+    # 旧版本部署的 namenode 没有配置 excludes, 要先 reconfigure
+    if master.run(f"grep -c dfs.hosts.exclude {hadoop_conf}/hdfs-site.xml || true").strip() in ('', '0'):
+        raise RuntimeError("the NameNode does not read an excludes file, run with [cmd] reconfigure = true first")
+
+    excludes = CTX.target_dir + f"/config/hadoop-{hadoop_version}/{elastic.EXCLUDES_FILE}"
+    with open(excludes, 'w') as f:
+        f.write(elastic.excludes_text(removed))
+    master.upload(excludes, f"{hadoop_conf}/{elastic.EXCLUDES_FILE}")
+    for cmd in elastic.refresh_cmds(hadoop_version, graceful_seconds=timeout):
+        remote_run(master, cmd, timeout=timeout + 300)
+
+    start_time = time.time()
+    while True:
+        left = elastic.pending(elastic.parse_decommission(master.run("hdfs dfsadmin -report")), removed)
+        if not left:
+            break
+        if time.time() - start_time > timeout:
+            raise RuntimeError(f"decommission of {', '.join(left)} not finished after {timeout} s")
+        print(f"waiting for {', '.join(left)} to decommission")
+        time.sleep(30)
+    for host in removed:
+        master.run(elastic.on_host(host, f"{confdiff.daemon_cmd(hadoop_version, 'nodemanager', 'stop')}; "
+                                         f"{confdiff.daemon_cmd(hadoop_version, 'datanode', 'stop')}"))
+
+    gen_hadoop_conf(job)
+    # 下线的节点留在 excludes 里, 重启后也不会再加入
+    with open(excludes, 'w') as f:
+        f.write(elastic.excludes_text(removed))
+    target = CTX.target_dir + "/config"
+    job.upload(f"{target}/system/hosts", "/etc/hosts")
+    job.upload(f"{target}/system/local.cfg", "/etc/clustershell/groups.d/local.cfg")
+    job.upload(f"{target}/hadoop-{hadoop_version}/{workers_file(hadoop_version)}",
+               f"{hadoop_conf}/{workers_file(hadoop_version)}")
+    job.upload(excludes, f"{hadoop_conf}/{elastic.EXCLUDES_FILE}")
+    for cmd in elastic.refresh_cmds(hadoop_version):
+        master.run(cmd)
+    print(f"decommissioned {', '.join(removed)}, their instances are still running")
 
 
 def start_flame(master):
     # 火焰图
     master.run("hadoop fs -mkdir -p /tmp/profiler/")
     master.run("mkdir -p /root/flame/")
-    master.upload(FASTMR_PATH + "/target/" + CLUSTER_NAME + "/config/flame/async-profiler-1.8.3-linux-x64.tar.gz",
-                  "/root/flame/")
-    master.run("hadoop fs -put -f /root/flame/async-profiler-1.8.3-linux-x64.tar.gz /tmp/profiler/")
+    master.upload(CTX.target_dir + f"/config/flame/{FLAME_ARCHIVE}", "/root/flame/")
+    master.run(f"hadoop fs -put -f /root/flame/{FLAME_ARCHIVE} /tmp/profiler/")
 
-# 在fastmr上调参的关键
-def compute_spark_conf(worker):
+
+def flame_enabled():
     config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    return config.has_option('flame', 'enable') and config.getboolean('flame', 'enable')
 
-    config.read(CONF_PATH, encoding='UTF-8')
 
-    vcpunum = worker.instance.cpu()
-    meminfo = worker.instance.memory()
+def flame_spark_conf(props, tag):
+    """
+    Spark properties that ship async-profiler to every executor through the YARN distributed
+    cache and start it with the executor JVM. Each executor dumps its collapsed stacks to
+    FLAME_DIR/<tag>/<app id>_<executor id>.collapsed on its node when it exits. props are the
+    properties the flame layer goes on top of, their executor JVM options are kept.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
 
-    machines = config.getint('ncluster', 'machines')
+    event = 'cpu'
+    if config.has_option('flame', 'event'):
+        event = config['flame']['event']
+    # 采样间隔, cpu 事件单位为纳秒
+    interval = 10000000
+    if config.has_option('flame', 'interval'):
+        interval = config.getint('flame', 'interval')
 
-    if config.has_option('spark', 'executor_core'):
-        executor_core = config.getint('spark', 'executor_core')
-    else:
-        executor_core = 4
-    SPARK_EXECUTOR_INSTANCES = (math.floor(vcpunum / executor_core) - 1) * machines
+    # 保留模板和 [spark-properties] 里已有的 executor JVM 参数
+    java_opts = props.get('spark.executor.extraJavaOptions', "")
+    java_opts = " ".join(o for o in java_opts.split() if not o.startswith('-agentpath:./async-profiler/'))
+    agent = "-agentpath:./async-profiler/build/libasyncProfiler.so=start,event=" + event + \
+            ",interval=" + str(interval) + ",collapsed,file=" + FLAME_DIR + "/" + tag + \
+            "/{{APP_ID}}_{{EXECUTOR_ID}}.collapsed"
+    return {'spark.yarn.dist.archives': f"hdfs://master1:9000/tmp/profiler/{FLAME_ARCHIVE}#async-profiler",
+            'spark.executor.extraJavaOptions': (java_opts + " " + agent).strip()}
 
-    if config.has_option('spark', 'executor_mem'):
-        SPARK_EXECUTOR_MEMORY = config.getint('spark', 'executor_mem')
+
+def prepare_flame(tasks, tag):
+    report_failures(remote_run_many([(task, 'flame dir', f"rm -rf {FLAME_DIR}/{tag} && mkdir -p {FLAME_DIR}/{tag} "
+                                                         f"&& chmod 777 {FLAME_DIR} {FLAME_DIR}/{tag}")
+                                     for task in tasks]), 'flame')
+
+
+def collect_flame(tasks, tag, split_apps=False):
+    """
+    Merge the collapsed stacks that every executor on every node dumped for tag and render
+    <tag>.svg, <tag>.collapsed and <tag>.top.txt into target/<cluster>/flame/. With split_apps
+    each spark application is rendered on its own as <tag>_<n>, in submission order.
+    Returns:
+    dict name -> hot path shares
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    top = 30
+    if config.has_option('flame', 'top'):
+        top = config.getint('flame', 'top')
+
+    texts = {}
+
+    def collect(task):
+        texts[task.name] = task.run(f"cd {FLAME_DIR}/{tag} 2>/dev/null && for f in *.collapsed; do "
+                                    f"[ -f \"$f\" ] && echo \"# $f\" && cat \"$f\"; done; true")
+
+    report_failures(run_concurrently([(task.name, 'collect flame', collect, (task,), {}) for task in tasks], 16),
+                    'flame')
+
+    # application_<ts>_<seq>_<executor id>.collapsed -> application_<ts>_<seq>
+    per_app = {}
+    for text in texts.values():
+        app, lines = None, []
+        for line in text.splitlines() + ['# ']:
+            if line.startswith('# '):
+                if app is not None:
+                    per_app[app] = flamegraph.merge(per_app.get(app, {}), flamegraph.parse_collapsed("\n".join(lines)))
+                app, lines = line[2:].rsplit('_', 1)[0], []
+            else:
+                lines.append(line)
+    if split_apps:
+        groups = [(f"{tag}_{i + 1}", per_app[app]) for i, app in enumerate(sorted(per_app))]
     else:
-        SPARK_EXECUTOR_MEMORY = math.floor(meminfo / 1024 / (SPARK_EXECUTOR_INSTANCES / machines) * 0.9)
+        groups = [(tag, flamegraph.merge(*per_app.values()))]
+
+    flame_dir = CTX.target_dir + "/flame"
+    os.makedirs(flame_dir, exist_ok=True)
+    infofile = CTX.target_dir + "/cluster.info"
+    shares = {}
+    for name, stacks in groups:
+        if not stacks:
+            print(f"[flame] no samples collected for {name}")
+            continue
+        with open(f"{flame_dir}/{name}.collapsed", 'w', encoding='utf-8') as f:
+            f.write(flamegraph.format_collapsed(stacks))
+        with open(f"{flame_dir}/{name}.svg", 'w', encoding='utf-8') as f:
+            f.write(flamegraph.render_svg(stacks, name))
+        report = flamegraph.format_top(name, stacks, top)
+        with open(f"{flame_dir}/{name}.top.txt", 'w', encoding='utf-8') as f:
+            f.write(report)
+        with open(infofile, 'a+') as f:
+            f.write(f"-------------flame {name}---------------\n")
+            f.write("\n".join(report.splitlines()[:2]) + "\n")
+        shares[name] = flamegraph.hot_paths(stacks)
+        print(f"[flame] {flame_dir}/{name}.svg")
+    return shares
+
+
+@tracing.traced()
+def profile_tpcds_queries(tasks, scale_factor, spark_conf):
+    """
+    Flame mode: run every query of [flame] queries as its own application with async-profiler
+    attached to the executors. This runs after the measured iterations, the profiled runs are
+    not timed.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    queries = FLAME_QUERIES
+    if config.has_option('flame', 'queries'):
+        queries = config['flame']['queries']
+    elif config.has_option('tpcds', 'queries') and config['tpcds']['queries'] != 'all':
+        queries = config['tpcds']['queries']
+
+    master = tasks[0]
+    tpcds_dir = f"{CTX.target_dir}/tpcds"
+    flame_conf = "spark-config.flame.conf"
+    props = spark_properties("tpcds/spark-config.conf", spark_conf)
+    for query in [q.strip() for q in queries.split(',') if q.strip()]:
+        tag = f"tpcds_{scale_factor}_{query}"
+        write_generated(f"tpcds/{flame_conf}",
+                        props.with_layer("flame", flame_spark_conf(props.properties(), tag)).render())
+        master.upload(f"{tpcds_dir}/{flame_conf}", f"/opt/TPC/TPC-DS/{flame_conf}")
+        prepare_flame(tasks, tag)
+        cmd = tpcds_query_cmd(scale_factor, query, flame_conf, f"/tmp/tpcds_{scale_factor}_flame")
+        try:
+            remote_run(master, f"cd /opt/TPC/TPC-DS && {cmd}")
+        except Exception as e:
+            # 失败的查询也可能有样本
+            print(f"[flame] {query} failed: {e}")
+        collect_flame(tasks, tag)
 
-    NUM_REDUCERS = SPARK_EXECUTOR_INSTANCES * 4
-    SPARK_EXECUTOR_MEMORYOVERHEAD = math.floor(SPARK_EXECUTOR_MEMORY * 0.5)
-    if SPARK_EXECUTOR_MEMORYOVERHEAD < 1:
-        SPARK_EXECUTOR_MEMORYOVERHEAD = 1
-    SPARK_DEFAULT_PARALLELISM = NUM_REDUCERS * 3
+# 在fastmr上调参的关键
+def compute_spark_conf(tasks, scale_factor_gb=None):
+    """
+    Returns:
+    (conf, notes): spark properties sized by sparksizing.size_spark_nodes over the nodes of
+    tasks and the reason for each value
+    """
+    config = ConfigParser()
 
-    return SPARK_EXECUTOR_INSTANCES, SPARK_EXECUTOR_MEMORY, NUM_REDUCERS, SPARK_EXECUTOR_MEMORYOVERHEAD, \
-           SPARK_DEFAULT_PARALLELISM, executor_core
+    config.read(CTX.conf_path, encoding='UTF-8')
 
+    kwargs = node_sizing_kwargs(cluster_nodes(tasks))
+    if config.has_option('spark', 'executor_core'):
+        kwargs['executor_cores'] = config.getint('spark', 'executor_core')
+    if config.has_option('spark', 'executor_mem'):
+        kwargs['executor_mem_gb'] = config.getfloat('spark', 'executor_mem')
+    if config.has_option('spark', 'overhead_fraction'):
+        kwargs['overhead_fraction'] = config.getfloat('spark', 'overhead_fraction')
+    if config.has_option('spark', 'offheap_mb'):
+        kwargs['offheap_mb'] = config.getint('spark', 'offheap_mb')
+    if config.has_option('spark', 'deploy_mode'):
+        kwargs['deploy_mode'] = config['spark']['deploy_mode']
+    if config.has_option('spark', 'driver_cores'):
+        kwargs['driver_cores'] = config.getint('spark', 'driver_cores')
+    if config.has_option('spark', 'driver_mem'):
+        kwargs['driver_mem_gb'] = config.getfloat('spark', 'driver_mem')
+    if config.has_option('spark', 'target_partition_mb'):
+        kwargs['target_partition_mb'] = config.getint('spark', 'target_partition_mb')
+    if config.has_option('spark', 'tasks_per_core'):
+        kwargs['tasks_per_core'] = config.getfloat('spark', 'tasks_per_core')
+    if config.has_option('spark', 'shuffle_partitions_per_core'):
+        kwargs['shuffle_partitions_per_core'] = config.getfloat('spark', 'shuffle_partitions_per_core')
+
+    conf, notes = sparksizing.size_spark_nodes(cluster_nodes(tasks), scale_factor_gb=scale_factor_gb, **kwargs)
+    overrides = user_spark_properties()
+    if overrides:
+        notes = dict(notes, **{key: "set by [spark-properties]" for key in overrides})
+        conf = benchscripts.PropertiesFile(conf).with_layer("[spark-properties]", overrides).properties()
+    return conf, notes
+
+
+def spark_sizing_kwargs(candidate, nodes):
+    """autotune candidate -> size_spark_nodes kwargs, the memory fraction is relative to the largest heap that fits"""
+    kwargs = {'executor_cores': candidate['executor_cores'],
+              'overhead_fraction': candidate['overhead_fraction'],
+              'tasks_per_core': candidate['tasks_per_core'],
+              'shuffle_partitions_per_core': candidate['shuffle_partitions_per_core']}
+    conf, _ = sparksizing.size_spark_nodes(nodes, **node_sizing_kwargs(nodes), **kwargs)
+    heap_mb = int(conf['spark.executor.memory'][:-1])
+    kwargs['executor_mem_gb'] = max(1.0, round(heap_mb * candidate['mem_fraction'] / 1024, 1))
+    return kwargs
+
+
+def user_spark_properties():
+    """
+    [spark-properties]: any spark property (AQE, off-heap, codecs...) laid over the sized
+    configuration, an empty value removes the key from the template
+    """
+    config = ConfigParser()
+    # spark 的 key 区分大小写
+    config.optionxform = str
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if not config.has_section('spark-properties'):
+        return {}
+    return {key: value.strip() or None for key, value in config['spark-properties'].items()}
 
-def run_tpcxhs(master, tpcxhs_scaleFactor, SPARK_EXECUTOR_INSTANCES, SPARK_EXECUTOR_MEMORY,
-               SPARK_DEFAULT_PARALLELISM,
-               SPARK_EXECUTOR_CORES):
-    usedconf = "spark-config.conf.flame"
 
-    for line in fileinput.input(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcxhs/{usedconf}", inplace=True):
+def spark_properties(template_rel, spark_conf):
+    """properties model of a run: trans/<template_rel>, the sized conf, then [spark-properties]"""
+    return benchscripts.PropertiesFile(benchscripts.parse_properties(template_text(template_rel))) \
+        .with_layer("sizing", spark_conf) \
+        .with_layer("[spark-properties]", user_spark_properties())
 
-        if line.__contains__('spark.driver.cores'):
-            print(f"spark.driver.cores {SPARK_EXECUTOR_CORES}")
-            continue
-        if line.__contains__('spark.driver.memory'):
-            print(f"spark.driver.memory {SPARK_EXECUTOR_MEMORY}g")
-            continue
-        if line.__contains__('spark.executor.instances'):
-            print(f"spark.executor.instances {SPARK_EXECUTOR_INSTANCES}")
-            continue
-        if line.__contains__('spark.executor.cores'):
-            print(f"spark.executor.cores {SPARK_EXECUTOR_CORES}")
-            continue
-        if line.__contains__('spark.executor.memory '):
-            print(f"spark.executor.memory {SPARK_EXECUTOR_MEMORY}g")
-            continue
-        if line.__contains__('spark.default.parallelism'):
-            print(f"spark.default.parallelism {SPARK_DEFAULT_PARALLELISM}")
-            continue
-        else:
-            print(line, end='')
 
-    for line in fileinput.input(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcxhs/Benchmark_Parameters.sh", inplace=True):
-        if line.__contains__('SPARK_CONF'):
-            print(f'SPARK_CONF="{usedconf}"')
-            continue
-        else:
-            print(line, end='')
+def record_spark_conf(title, spark_conf, notes):
+    print(f"------{title} spark sizing:")
+    print(sparksizing.explain(spark_conf, notes))
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write(f"------{title} spark sizing:\n")
+        f.write(sparksizing.explain(spark_conf, notes))
 
-    # set the size of tpcxhs
-    tpcxhs_command = f"cd /opt/TPC/TPCx-HS/ \n" \
-                     f"chmod 755 TPCx-HS-master.sh.withconf \n" \
-                     f"./TPCx-HS-master.sh.withconf -s -g {tpcxhs_scaleFactor}"
-    tpcxhs_script = f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcxhs/runtpcxhs.sh"
 
-    with open(tpcxhs_script, encoding="utf-8", mode="a") as file:
-        file.write(tpcxhs_command)
-    master.upload(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcxhs", "/opt/TPC/TPCx-HS/")
+@tracing.traced()
+def run_tpcxhs(master, tpcxhs_scaleFactor, spark_conf, job=None):
+    usedconf = "spark-config.conf.flame"
+    tasks = job.tasks if job is not None else [master]
+    flame_tag = f"tpcxhs_{tpcxhs_scaleFactor}"
+
+    # 配置文件和脚本每次都从 trans/ 的模板重新生成, 重复运行不会累积命令
+    props = spark_properties(f"tpcxhs/{usedconf}", spark_conf)
+    if flame_enabled():
+        props = props.with_layer("flame", flame_spark_conf(props.properties(), flame_tag))
+        prepare_flame(tasks, flame_tag)
+    write_generated(f"tpcxhs/{usedconf}", props.render())
+    write_generated("tpcxhs/Benchmark_Parameters.sh",
+                    benchscripts.set_shell_var(template_text("tpcxhs/Benchmark_Parameters.sh"), 'SPARK_CONF', usedconf))
+
+    # set the size of tpcxhs
+    write_generated("tpcxhs/runtpcxhs.sh", benchscripts.ShellScript(template_text("tpcxhs/runtpcxhs.sh"), [
+        "cd /opt/TPC/TPCx-HS/",
+        "chmod 755 TPCx-HS-master.sh.withconf",
+        f"./TPCx-HS-master.sh.withconf -s -g {tpcxhs_scaleFactor}"]).render())
+    upload_dir(master, f"{CTX.target_dir}/tpcxhs", "/opt/TPC/TPCx-HS/")
 
     if os.name == "nt":
         master.run("dos2unix /opt/TPC/TPCx-HS/*")
 
     print("TPCx-HS is running")
     tpcxhs_start_time = time.time()
-    master.run("sh /opt/TPC/TPCx-HS/runtpcxhs.sh")
+    remote_run(master, "sh /opt/TPC/TPCx-HS/runtpcxhs.sh")
     eclapse_time = time.time() - tpcxhs_start_time
     # print(f'tpcxhs deploy time is: {eclapse_time} s.')
 
-    infofile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/cluster.info"
+    infofile = CTX.target_dir + "/cluster.info"
     with open(infofile, 'a+') as f:
         f.write("-------------TPCx-HS---------------\n")
         f.write(f"TPCx-HS run time : {eclapse_time} \n")
+        if flame_enabled():
+            f.write("TPCx-HS ran with async-profiler attached\n")
+    if flame_enabled():
+        # 每个阶段 (gen/sort/validate) 是一个 spark 应用
+        collect_flame(tasks, flame_tag, split_apps=True)
+    return eclapse_time
 
 # 运行tpcds的程序
-def run_tpcds(master, tpcds_scaleFactor, SPARK_EXECUTOR_INSTANCES, SPARK_EXECUTOR_MEMORY,
-              SPARK_EXECUTOR_MEMORYOVERHEAD,
-              SPARK_DEFAULT_PARALLELISM,
-              SPARK_EXECUTOR_CORES):
+def tpcds_datagen_cmd(scale_factor, properties_file="spark-config.conf"):
+    return f"spark-submit --properties-file {properties_file} --class " \
+           f"com.databricks.spark.sql.perf.tpcds.TPCDS_Bench_DataGen " \
+           f"spark-sql-perf_2.12-0.5.1-SNAPSHOT.jar hdfs://master1:9000/tmp/tpcds_{scale_factor} " \
+           f"tpcds_{scale_factor} {scale_factor} parquet"
+
+
+def tpcds_query_cmd(scale_factor, queries="all", properties_file="spark-config.conf", result_dir=None,
+                    location=None, database=None):
+    """
+    queries is 'all' or a comma separated list of query names, e.g. q3,q7
+    location / database select another layout of the dataset than tpcds_<sf>
+    """
+    if result_dir is None:
+        result_dir = f"/tmp/tpcds_{scale_factor}_result"
+    if location is None:
+        location = f"hdfs://master1:9000/tmp/tpcds_{scale_factor}"
+    if database is None:
+        database = f"tpcds_{scale_factor}"
+    return f"spark-submit --properties-file {properties_file} --class " \
+           f"com.databricks.spark.sql.perf.tpcds.TPCDS_Bench_RunAllQuery " \
+           f"spark-sql-perf_2.12-0.5.1-SNAPSHOT.jar {queries} {location}" \
+           f" {database} {result_dir} "
+
+
+@tracing.traced()
+def prepare_tpcds_data(master, scale_factor, job=None):
+    """
+    Reuse hdfs://master1:9000/tmp/tpcds_<sf> when its manifest matches, otherwise generate it
+    with TPCDS_Bench_DataGen ([tpcds] datagen = spark) or with dsdgen chunks spread over all
+    nodes ([tpcds] datagen = chunked).
+    Returns:
+    datagen seconds, 0 when the dataset was reused
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    datagen = 'spark'
+    if config.has_option('tpcds', 'datagen'):
+        datagen = config['tpcds']['datagen']
+    reuse = True
+    if config.has_option('tpcds', 'reuse_data'):
+        reuse = config.getboolean('tpcds', 'reuse_data')
+    partitioned = False
+    if config.has_option('tpcds', 'partitioned'):
+        partitioned = config.getboolean('tpcds', 'partitioned')
+
+    location = f"hdfs://master1:9000/tmp/tpcds_{scale_factor}"
+    if datagen == 'chunked':
+        wanted = tpcdsdata.make_manifest(scale_factor, 'parquet', partitioned, 'dsdgen-chunked')
+    else:
+        wanted = tpcdsdata.make_manifest(scale_factor, 'parquet', None, 'spark-sql-perf_2.12-0.5.1-SNAPSHOT')
+    if reuse and tpcdsdata.manifest_matches(tpcdsdata.read_manifest(master, location), wanted):
+        print(f"reuse TPC-DS dataset {location}, skip datagen")
+        return 0
+
+    start_time = time.time()
+    master.run(f"hadoop fs -rm -r -f -skipTrash {location}")
+    if datagen == 'chunked':
+        tables = tpcds_chunked_datagen(master, scale_factor, location, partitioned, job)
+    else:
+        remote_run(master, "sh /opt/TPC/TPC-DS/datagen_custom.sh")
+        tables = master.run(f"hadoop fs -ls -C {location} 2>/dev/null || true").split()
+    wanted['tables'] = sorted(os.path.basename(t) for t in tables if not os.path.basename(t).startswith(('_', '.')))
+    tpcdsdata.write_manifest(master, location, wanted)
+    return time.time() - start_time
+
+
+@tracing.traced()
+def tpcds_chunked_datagen(master, scale_factor, location, partitioned, job=None):
+    raw_location = f"{location}_raw"
+    tables = tpcds_raw_datagen(master, scale_factor, raw_location, job)
+    convert_tpcds(master, tables, f"tpcds_{scale_factor}", raw_location, location, partitioned=partitioned)
+    master.run(f"hadoop fs -rm -r -f -skipTrash {raw_location}")
+    return list(tables)
+
+
+def tpcds_tools_dir():
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if config.has_option('tpcds', 'tools_dir'):
+        return config['tpcds']['tools_dir']
+    return "/root/tpcds-kit/tools"
+
+
+def raw_tables(master, raw_location):
+    """table -> columns of the '|' separated dsdgen output under raw_location"""
+    generated = {os.path.basename(p) for p in master.run(f"hadoop fs -ls -C {raw_location}").split()}
+    return {t: c for t, c in tpcdsdata.parse_ddl(master.run(f"cat {tpcds_tools_dir()}/tpcds.sql")).items()
+            if t in generated}
+
+
+@tracing.traced()
+def tpcds_raw_datagen(master, scale_factor, raw_location, job=None):
+    """
+    dsdgen chunks spread over all nodes straight into raw_location/<table>/ on HDFS
+    Returns:
+    table -> columns of the generated tables
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    local_dir = "/mnt/disk1/tpcds_raw"
+    if config.has_option('tpcds', 'raw_dir'):
+        local_dir = config['tpcds']['raw_dir']
+    chunks_per_core = 1.0
+    if config.has_option('tpcds', 'chunks_per_core'):
+        chunks_per_core = config.getfloat('tpcds', 'chunks_per_core')
+
+    tasks = job.tasks if job is not None else [master]
+    master.run(f"hadoop fs -rm -r -f -skipTrash {raw_location}")
+
+    # 每个节点按核数分到一段 -CHILD, 各自生成后直接放进 hdfs
+    parallel, ranges = tpcdsdata.assign_chunks([t.instance.cpu() for t in tasks], chunks_per_core)
+    commands = [(task, f"dsdgen {children[0]}-{children[-1]}/{parallel}",
+                 tpcdsdata.dsdgen_chunk_cmd(tpcds_tools_dir(), scale_factor, parallel, children, local_dir,
+                                            raw_location))
+                for task, children in zip(tasks, ranges) if len(children)]
+    report_failures(remote_run_many(commands), 'tpcds datagen')
+    return raw_tables(master, raw_location)
+
+
+@tracing.traced()
+def convert_tpcds(master, tables, database, raw_location, location, data_format='parquet', compression=None,
+                  partitioned=False, properties_file="spark-config.conf"):
+    """raw chunks -> data_format tables of database under location, through spark-sql"""
+    sql_name = f"convert_{database}.sql"
+    sql_file = f"{CTX.target_dir}/tpcds/{sql_name}"
+    with open(sql_file, 'w', encoding='utf-8') as f:
+        f.write(tpcdsdata.conversion_sql(tables, database, raw_location, location, data_format=data_format,
+                                         compression=compression, partitioned=partitioned))
+    master.upload(sql_file, f"/opt/TPC/TPC-DS/{sql_name}")
+    remote_run(master, f"cd /opt/TPC/TPC-DS && spark-sql --properties-file {properties_file} -f {sql_name}")
+
+
+@tracing.traced()
+def run_tpcds(master, tpcds_scaleFactor, spark_conf, job=None):
     # configure tpcds spark.config
-    # 这里是在生成spark-config.conf
-    # 我的conf文件最终应该就是要替换这个文件
-    # {FASTMR_PATH}/target/{CLUSTER_NAME}/tpcds/spark-config.conf
-    for line in fileinput.input(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcds/spark-config.conf", inplace=True):
-        if line.__contains__('spark.driver.cores'):
-            print(f"spark.driver.cores {2}")
-            continue
-        if line.__contains__('spark.driver.memory'):
-            print(f"spark.driver.memory {4}g")
-            continue
-        if line.__contains__('spark.executor.instances'):
-            print(f"spark.executor.instances {5}")
-            continue
-        if line.__contains__('spark.executor.cores'):
-            print(f"spark.executor.cores {2}")
-            continue
-        if line.__contains__('spark.executor.memory '):
-            print(f"spark.executor.memory {3}g")
-            continue
-        if line.__contains__('spark.executor.memoryOverhead'):
-            print(f"spark.executor.memoryOverhead {1}g")
-            continue
-        if line.__contains__('spark.default.parallelism'):
-            print(f"spark.default.parallelism {50}")
-            continue
-        else:
-            print(line, end='')
+    # 这里是在生成spark-config.conf, 和两个脚本一样每次从 trans/ 的模板重新生成
+    write_generated("tpcds/spark-config.conf", spark_properties("tpcds/spark-config.conf", spark_conf).render())
 
     # set the size of tpcds
-    tpcds_datagen_command = f"spark-submit --properties-file spark-config.conf --class " \
-                            f"com.databricks.spark.sql.perf.tpcds.TPCDS_Bench_DataGen " \
-                            f"spark-sql-perf_2.12-0.5.1-SNAPSHOT.jar hdfs://master1:9000/tmp/tpcds_{tpcds_scaleFactor} " \
-                            f"tpcds_{tpcds_scaleFactor} {tpcds_scaleFactor} parquet"
-    tpcds_runallsql_command = f"spark-submit --properties-file spark-config.conf --class " \
-                              f"com.databricks.spark.sql.perf.tpcds.TPCDS_Bench_RunAllQuery " \
-                              f"spark-sql-perf_2.12-0.5.1-SNAPSHOT.jar all hdfs://master1:9000/tmp/tpcds_{tpcds_scaleFactor}" \
-                              f" tpcds_{tpcds_scaleFactor} /tmp/tpcds_{tpcds_scaleFactor}_result "
-
-    tpcds_datagen_script = f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcds/datagen_custom.sh"
-    tpcds_runallsql_script = f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcds/runallquery_custom.sh"
-    with open(tpcds_datagen_script, encoding="utf-8", mode="a") as file:
-        file.write("cd /opt/TPC/TPC-DS \n")
-        file.write(tpcds_datagen_command)
-    with open(tpcds_runallsql_script, encoding="utf-8", mode="a") as file:
-        file.write("cd /opt/TPC/TPC-DS \n")
-        file.write(tpcds_runallsql_command)
-    master.upload(f"{FASTMR_PATH}/target/{CLUSTER_NAME}/tpcds", "/opt/TPC/TPC-DS/")
+    for script, cmd in (("datagen_custom.sh", tpcds_datagen_cmd(tpcds_scaleFactor)),
+                        ("runallquery_custom.sh", tpcds_query_cmd(tpcds_scaleFactor))):
+        write_generated(f"tpcds/{script}", benchscripts.ShellScript(template_text(f"tpcds/{script}"),
+                                                                    ["cd /opt/TPC/TPC-DS", cmd]).render())
+    upload_dir(master, f"{CTX.target_dir}/tpcds", "/opt/TPC/TPC-DS/")
     print("完成所有配置")
-    # print("TPC-DS is running")
-    # tpcds_gen_start_time = time.time()
-    # master.run("/opt/TPC/TPC-DS/datagen_custom.sh")
-    # tpcds_gen_time = time.time() - tpcds_gen_start_time
-    # tpcds_sql_start_time = time.time()
-    # master.run("/opt/TPC/TPC-DS/runallquery_custom.sh")
-    #
-    # tpcds_sql_time = time.time() - tpcds_sql_start_time
-    #
-    # infofile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/cluster.info"
-    # with open(infofile, 'a+') as f:
-    #     f.write("-------------TPC-DS---------------\n")
-    #     f.write(f"TPC-DS-Gen run time : {tpcds_gen_time} s\n")
-    #     f.write(f"TPC-DS-SQL run time : {tpcds_sql_time} s\n")
+
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if not (config.has_option('tpcds', 'execute') and config.getboolean('tpcds', 'execute')):
+        return None
+
+    queries = "all"
+    if config.has_option('tpcds', 'queries'):
+        queries = config['tpcds']['queries']
+    iterations = 1
+    if config.has_option('tpcds', 'iterations'):
+        iterations = config.getint('tpcds', 'iterations')
+    warmup = 0
+    if config.has_option('tpcds', 'warmup'):
+        warmup = config.getint('tpcds', 'warmup')
+
+    print("TPC-DS is running")
+    tpcds_gen_start_time = time.time()
+    tpcds_gen_time = prepare_tpcds_data(master, tpcds_scaleFactor, job)
+    tpcds_sql_start_time = time.time()
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("-------------TPC-DS---------------\n")
+        f.write(f"TPC-DS-Gen run time : {tpcds_gen_time} s\n")
+
+    summary = run_tpcds_queries(master, tpcds_scaleFactor, queries, iterations, warmup)
+    summary['datagen_seconds'] = tpcds_gen_time
+    summary['phase_windows'] = {'datagen': [tpcds_gen_start_time, tpcds_sql_start_time],
+                                'queries': [tpcds_sql_start_time, time.time()]}
+    streams = 0
+    if config.has_option('tpcds', 'throughput_streams'):
+        streams = config.getint('tpcds', 'throughput_streams')
+    if streams > 0:
+        throughput_start_time = time.time()
+        summary['throughput'] = run_tpcds_throughput(master, tpcds_scaleFactor, spark_conf, queries, streams,
+                                                     power=summary)
+        summary['throughput']['window'] = [throughput_start_time, time.time()]
+    if config.has_option('matrix', 'run') and config.getboolean('matrix', 'run'):
+        summary['matrix'] = run_tpcds_matrix(master, tpcds_scaleFactor, job)
+    if flame_enabled():
+        flame_start_time = time.time()
+        profile_tpcds_queries(job.tasks if job is not None else [master], tpcds_scaleFactor, spark_conf)
+        summary['phase_windows']['flame'] = [flame_start_time, time.time()]
+    return summary
+
+
+@tracing.traced()
+def run_tpcds_queries(master, scale_factor, queries="all", iterations=1, warmup=0, layout=None):
+    """
+    Run the query set warmup + iterations times, each iteration into its own spark-sql-perf
+    result dir, and summarize the per query timings of the measured iterations.
+    The summary is written to target/<cluster>/tpcds_<sf>_result.json, or
+    tpcds_<sf>_<layout>_result.json when layout (dict name, location, database) is given.
+    """
+    name = f"tpcds_{scale_factor}" + (f"_{layout['name']}" if layout else "")
+    result_root = f"/tmp/{name}_result"
+    master.run(f"hadoop fs -rm -r -f {result_root}")
+
+    samples = []
+    wall_clock = []
+    app_ids = []
+    for i in range(warmup + iterations):
+        result_dir = f"{result_root}/iter_{i}"
+        cmd = tpcds_query_cmd(scale_factor, queries, result_dir=result_dir,
+                              location=layout['location'] if layout else None,
+                              database=layout['database'] if layout else None)
+        start_time = time.time()
+        result = remote_run(master, f"cd /opt/TPC/TPC-DS && {cmd}")
+        elapsed = time.time() - start_time
+        if i < warmup:
+            print(f"TPC-DS warm-up {i + 1}/{warmup} : {elapsed:.1f} s")
+            continue
+        wall_clock.append(elapsed)
+        app_ids += layoutmatrix.app_ids(f"{result.stdout}\n{result.stderr}")
+        print(f"TPC-DS iteration {i - warmup + 1}/{iterations} : {elapsed:.1f} s")
+        samples += benchstats.parse_sparksql_perf(master.run(f"hadoop fs -cat '{result_dir}/*/*.json' 2>/dev/null || true"))
+
+    summary = benchstats.summarize(samples)
+    summary.update({'scale_factor': scale_factor,
+                    'query_set': queries,
+                    'iterations': iterations,
+                    'warmup': warmup,
+                    'wall_clock_seconds': wall_clock,
+                    'app_ids': app_ids,
+                    'finished_at': time.time()})
+
+    result_file = CTX.target_dir + f"/{name}_result.json"
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=1)
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write(f"TPC-DS-SQL{' ' + layout['name'] if layout else ''} run time : {sum(wall_clock)} s "
+                f"({iterations} iteration(s), {warmup} warm-up)\n")
+        f.write(benchstats.format_summary(summary))
+    print(f"per query results written to {result_file}")
+    return summary
+
+
+@tracing.traced()
+def run_tpcds_throughput(master, scale_factor, spark_conf, queries="all", streams=4, power=None):
+    """
+    TPC-DS throughput test: `streams` spark applications submitted at once against the shared
+    YARN cluster, each running the query set in its own permuted order ([tpcds] throughput_seed).
+    Every stream gets 1/streams of the executors unless [tpcds] throughput_share = false.
+    The summary is written to target/<cluster>/tpcds_<sf>_throughput.json.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    seed = 0
+    if config.has_option('tpcds', 'throughput_seed'):
+        seed = config.getint('tpcds', 'throughput_seed')
+    share = True
+    if config.has_option('tpcds', 'throughput_share'):
+        share = config.getboolean('tpcds', 'throughput_share')
+
+    tpcds_dir = f"{CTX.target_dir}/tpcds"
+    stream_conf = "spark-config.throughput.conf"
+    props = spark_properties("tpcds/spark-config.conf", spark_conf)
+    if share:
+        instances = max(1, int(spark_conf['spark.executor.instances']) // streams)
+        props = props.with_layer("throughput share", {'spark.executor.instances': str(instances)})
+    write_generated(f"tpcds/{stream_conf}", props.render())
+    master.upload(f"{tpcds_dir}/{stream_conf}", f"/opt/TPC/TPC-DS/{stream_conf}")
+
+    result_root = f"/tmp/tpcds_{scale_factor}_throughput"
+    master.run(f"hadoop fs -rm -r -f {result_root}")
+    orders = throughput.stream_orders(throughput.query_list(queries), streams, seed)
+    commands = [(master, f"cd /opt/TPC/TPC-DS && "
+                         f"{tpcds_query_cmd(scale_factor, ','.join(order), stream_conf, f'{result_root}/stream_{i}')}")
+                for i, order in enumerate(orders)]
+
+    timeout = None
+    if config.has_option('cmd', 'remote_timeout'):
+        timeout = config.getfloat('cmd', 'remote_timeout')
+    print(f"TPC-DS throughput test: {streams} streams of {len(orders[0])} queries")
+    start_time = time.time()
+    results = aioremote.run_sync(aioremote.run_many(commands, return_exceptions=True, timeout=timeout))
+    elapsed = time.time() - start_time
+
+    stream_results = []
+    for i, (order, result) in enumerate(zip(orders, results)):
+        samples = benchstats.parse_sparksql_perf(
+            master.run(f"hadoop fs -cat '{result_root}/stream_{i}/*/*.json' 2>/dev/null || true"))
+        failed = isinstance(result, Exception)
+        stream_results.append({'stream': i,
+                               'seconds': elapsed if failed else result.seconds,
+                               'queries': len(order),
+                               'order': order,
+                               'error': f"{type(result).__name__}: {result}"[:200] if failed else None,
+                               'samples': samples})
+    summary = throughput.summarize(stream_results, elapsed, power)
+    summary.update({'scale_factor': scale_factor, 'seed': seed, 'finished_at': time.time()})
+
+    result_file = CTX.target_dir + f"/tpcds_{scale_factor}_throughput.json"
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=1)
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("-------------TPC-DS throughput---------------\n")
+        f.write(throughput.format_throughput(summary))
+    print(throughput.format_throughput(summary))
+    return summary
+
+
+def app_input_bytes(master, app_ids):
+    """
+    Bytes read from storage by the given applications, summed over the stage inputBytes of the
+    spark history server. None when any application is missing there, e.g. event logs are off.
+    """
+    total = 0
+    for app_id in app_ids:
+        stages = None
+        # history server 要等 event log 刷新后才能看到刚结束的应用
+        for _ in range(12):
+            for url in (f"http://localhost:18080/api/v1/applications/{app_id}/stages",
+                        f"http://localhost:18080/api/v1/applications/{app_id}/1/stages"):
+                text = master.run(f"curl -sf {url} || true").strip()
+                if text.startswith('['):
+                    stages = json.loads(text)
+                    break
+            if stages is not None:
+                break
+            time.sleep(5)
+        if stages is None:
+            print(f"{app_id} not found in the spark history server, no scan bytes")
+            return None
+        total += layoutmatrix.stage_input_bytes(stages)
+    return total
+
+
+@tracing.traced()
+def run_tpcds_matrix(master, scale_factor, job=None):
+    """
+    Storage layout matrix: the dsdgen raw data is generated once and converted into every
+    [matrix] formats x codecs x partitioned layout, each its own database tpcds_<sf>_<layout>.
+    The same query set runs on each layout, the report puts on-disk footprint, bytes scanned
+    and query time side by side. Layouts whose manifest matches are reused.
+    Written to target/<cluster>/tpcds_<sf>_matrix.json and cluster.info.
+    Returns:
+    list of dict layout, footprint_bytes, scan_bytes, convert_seconds, summary, window
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    formats = ['parquet', 'orc']
+    if config.has_option('matrix', 'formats'):
+        formats = [f.strip() for f in config['matrix']['formats'].split(',') if f.strip()]
+    codecs = ['snappy', 'zstd', 'lz4']
+    if config.has_option('matrix', 'codecs'):
+        codecs = [c.strip() for c in config['matrix']['codecs'].split(',') if c.strip()]
+    partitioned = (False,)
+    if config.has_option('matrix', 'partitioned'):
+        partitioned = layoutmatrix.partitioning(config['matrix']['partitioned'])
+    queries = "all"
+    if config.has_option('tpcds', 'queries'):
+        queries = config['tpcds']['queries']
+    if config.has_option('matrix', 'queries'):
+        queries = config['matrix']['queries']
+    iterations = 1
+    if config.has_option('matrix', 'iterations'):
+        iterations = config.getint('matrix', 'iterations')
+    keep_raw = True
+    if config.has_option('matrix', 'keep_raw'):
+        keep_raw = config.getboolean('matrix', 'keep_raw')
+
+    # 原始数据只生成一次, 所有布局都从它转换
+    raw_location = f"hdfs://master1:9000/tmp/tpcds_{scale_factor}_raw"
+    wanted_raw = tpcdsdata.make_manifest(scale_factor, 'text', None, 'dsdgen-raw')
+    if tpcdsdata.manifest_matches(tpcdsdata.read_manifest(master, raw_location), wanted_raw):
+        print(f"reuse TPC-DS raw data {raw_location}")
+        tables = raw_tables(master, raw_location)
+    else:
+        tables = tpcds_raw_datagen(master, scale_factor, raw_location, job)
+        wanted_raw['tables'] = sorted(tables)
+        tpcdsdata.write_manifest(master, raw_location, wanted_raw)
+
+    rows = []
+    for layout in layoutmatrix.layouts(formats, codecs, partitioned):
+        layout['location'] = f"hdfs://master1:9000/tmp/tpcds_{scale_factor}_{layout['name']}"
+        layout['database'] = f"tpcds_{scale_factor}_{layout['name']}"
+        wanted = tpcdsdata.make_manifest(scale_factor, layout['format'], layout['partitioned'], 'dsdgen-chunked',
+                                         tables, compression=layout['compression'])
+        start_time = time.time()
+        convert_seconds = 0
+        if not tpcdsdata.manifest_matches(tpcdsdata.read_manifest(master, layout['location']), wanted):
+            print(f"TPC-DS layout {layout['name']}: converting")
+            master.run(f"hadoop fs -rm -r -f -skipTrash {layout['location']}")
+            convert_tpcds(master, tables, layout['database'], raw_location, layout['location'],
+                          data_format=layout['format'], compression=layout['compression'],
+                          partitioned=layout['partitioned'])
+            tpcdsdata.write_manifest(master, layout['location'], wanted)
+            convert_seconds = time.time() - start_time
+        footprint = layoutmatrix.parse_du(master.run(f"hadoop fs -du -s {layout['location']}"))
+
+        print(f"TPC-DS layout {layout['name']}: running queries")
+        queries_start_time = time.time()
+        summary = run_tpcds_queries(master, scale_factor, queries, iterations, layout=layout)
+        scan = app_input_bytes(master, summary['app_ids'])
+        rows.append({'layout': layout,
+                     'footprint_bytes': footprint,
+                     # 每轮读的字节数
+                     'scan_bytes': scan / iterations if scan is not None else None,
+                     'convert_seconds': convert_seconds,
+                     'summary': summary,
+                     'window': [queries_start_time, time.time()]})
+
+        result_file = CTX.target_dir + f"/tpcds_{scale_factor}_matrix.json"
+        with open(result_file, 'w', encoding='utf-8') as f:
+            json.dump({'scale_factor': scale_factor, 'queries': queries, 'iterations': iterations, 'rows': rows},
+                      f, indent=1)
+
+    if not keep_raw:
+        master.run(f"hadoop fs -rm -r -f -skipTrash {raw_location}")
+    report = layoutmatrix.format_matrix(rows)
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("-------------TPC-DS storage layouts---------------\n")
+        f.write(report)
+    print(report)
+    return rows
+
+
+@tracing.traced()
+def autotune_spark(job):
+    """
+    Search executor cores/memory/overhead, parallelism and shuffle partitions with successive
+    halving. Each candidate runs a TPC-DS query subset at a small scale factor, the budget of a
+    rung is the number of queries. The best candidate is written back to the [spark] section.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    master = job.tasks[0]
+    nodes = cluster_nodes(job.tasks)
+    # executor 的核数受最小的 worker 限制
+    vcpunum = min(vcpu for vcpu, _ in nodes[1:] or nodes)
+
+    scale_factor = '10'
+    if config.has_option('autotune', 'scaleFactor'):
+        scale_factor = config['autotune']['scaleFactor']
+    queries = "q3,q7,q19,q27,q34,q42,q52,q55,q59,q68,q73,q98".split(',')
+    if config.has_option('autotune', 'queries'):
+        queries = [q.strip() for q in config['autotune']['queries'].split(',') if q.strip()]
+    candidates_num = 16
+    if config.has_option('autotune', 'candidates'):
+        candidates_num = config.getint('autotune', 'candidates')
+    eta = 2
+    if config.has_option('autotune', 'eta'):
+        eta = config.getint('autotune', 'eta')
+    seed = 0
+    if config.has_option('autotune', 'seed'):
+        seed = config.getint('autotune', 'seed')
+
+    space = dict(autotune.DEFAULT_SPACE)
+    space['executor_cores'] = [c for c in space['executor_cores'] if c < vcpunum] or [max(1, vcpunum - 1)]
+    candidates = autotune.sample_space(space, candidates_num, seed)
+
+    tpcds_dir = f"{CTX.target_dir}/tpcds"
+    tune_conf = "spark-config.autotune.conf"
+    base_conf, _ = compute_spark_conf(job.tasks, scale_factor_gb=float(scale_factor))
+    write_generated(f"tpcds/{tune_conf}", spark_properties("tpcds/spark-config.conf", base_conf).render())
+    upload_dir(master, tpcds_dir, "/opt/TPC/TPC-DS/")
+    # 小规模数据只生成一次
+    try:
+        master.run(f"hadoop fs -test -e hdfs://master1:9000/tmp/tpcds_{scale_factor}")
+    except Exception:
+        master.run(f"cd /opt/TPC/TPC-DS && {tpcds_datagen_cmd(scale_factor, tune_conf)}")
+
+    def evaluate(candidate, budget):
+        spark_conf, _ = sparksizing.size_spark_nodes(nodes, scale_factor_gb=float(scale_factor),
+                                                     **node_sizing_kwargs(nodes), **spark_sizing_kwargs(candidate, nodes))
+        # 候选配置盖在模板上, 不继承上一个候选的 key
+        write_generated(f"tpcds/{tune_conf}", spark_properties("tpcds/spark-config.conf", spark_conf).render())
+        master.upload(f"{tpcds_dir}/{tune_conf}", f"/opt/TPC/TPC-DS/{tune_conf}")
+        result_dir = f"/tmp/tpcds_{scale_factor}_autotune"
+        cmd = tpcds_query_cmd(scale_factor, ",".join(queries[:budget]), tune_conf, result_dir)
+        # 每个候选都从空的结果目录开始, 不能读到上一个候选的输出
+        master.run(f"hadoop fs -rm -r -f {result_dir}")
+        start_time = time.time()
+        try:
+            remote_run(master, f"cd /opt/TPC/TPC-DS && {cmd}")
+        except Exception as e:
+            print(f"[autotune] {autotune.format_candidate(candidate)} failed: {e}")
+            return float('inf')
+        return time.time() - start_time
+
+    best, history = autotune.successive_halving(candidates, evaluate, len(queries), eta)
+    kwargs = spark_sizing_kwargs(best, nodes)
+    profile = {'executor_core': kwargs['executor_cores'],
+               'executor_mem': kwargs['executor_mem_gb'],
+               'overhead_fraction': kwargs['overhead_fraction'],
+               'tasks_per_core': kwargs['tasks_per_core'],
+               'shuffle_partitions_per_core': kwargs['shuffle_partitions_per_core']}
+    shutil.copyfile(CTX.conf_path, CTX.conf_path + ".bak")
+    autotune.set_ini_options(CTX.conf_path, 'spark', profile)
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write("-------------autotune---------------\n")
+        for rung, budget, candidate, cost in history:
+            f.write(f"rung {rung} queries {budget} : {autotune.format_candidate(candidate)} : {cost:.1f} s\n")
+        f.write(f"best : {autotune.format_candidate(best)}\n")
+    print(f"autotune best {autotune.format_candidate(best)}, written to [spark] in {CTX.conf_path}")
+    return profile
+
+
+def results_db():
+    # 放在 target/ 下而不是 target/<cluster>/, copy_conf 不会清掉历史结果
+    return CTX.fastmr_path + "/target/results.db"
+
+
+def record_result(benchmark, scale_factor, spark_conf, phases, summary=None, machines=None):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    instance_type = None
+    if config.has_option('ncluster', 'instance_type'):
+        instance_type = config['ncluster']['instance_type']
+    meta = {'cluster': CTX.cluster_name,
+            'instance_type': instance_type,
+            'machines': machines or cluster_size(),
+            'hadoop_version': config['hadoop']['version'],
+            'spark_version': config['spark']['version'],
+            'hive_version': config['hive']['version'],
+            'scale_factor': scale_factor}
+    run_id = resultstore.record_run(results_db(), benchmark, meta, spark_conf, phases, summary)
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write(f"{benchmark} result stored as run {run_id} in {results_db()}\n")
+    return run_id
+
+
+def export_trace():
+    """write every recorded span to target/<cluster>/deploy.trace.json and the slowest ones to cluster.info"""
+    cluster_dir = CTX.target_dir
+    os.makedirs(cluster_dir, exist_ok=True)
+    tracing.write_chrome(cluster_dir + "/deploy.trace.json", f"fastmr {CTX.cluster_name}")
+    report = tracing.format_slowest(tracing.spans())
+    with open(cluster_dir + "/cluster.info", 'a+') as f:
+        f.write("-------------slowest spans---------------\n")
+        f.write(report)
+    print(report)
+    print(f"trace written to {cluster_dir}/deploy.trace.json, open it in chrome://tracing or ui.perfetto.dev")
+
+
+def show_runs(benchmark=None):
+    for run in resultstore.list_runs(results_db(), benchmark):
+        print(f"{run['id']:>5}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created']))}  "
+              f"{run['benchmark']:<8} {run['cluster']:<20} {run['instance_type']} x{run['machines']}  "
+              f"sf {run['scale_factor']}  hadoop {run['hadoop_version']} spark {run['spark_version']}")
+
+
+def load_catalog():
+    """price and resource catalog from resource/, [recommend] region picks one region of the price list"""
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    region = None
+    if config.has_option('recommend', 'region'):
+        region = config['recommend']['region']
+    return catalog.Catalog.load(CTX.fastmr_path + "/resource", region)
+
+
+def instance_info(instance_type):
+    """catalog entry of instance_type for cluster.info, the matching csv lines when the catalog cannot be read"""
+    try:
+        return catalog.format_entry(load_catalog().get(instance_type))
+    except Exception as e:
+        # 目录格式变了不能影响开集群
+        print(f"cannot load the instance catalog ({type(e).__name__}: {e}), falling back to grep")
+        path = f"{CTX.fastmr_path}/resource/{catalog.RESOURCES_CSV}"
+        if not os.path.exists(path):
+            return "not in the catalog\n"
+        with open(path, encoding='utf-8-sig', errors='replace') as f:
+            return "".join(line for line in f if instance_type in line) or "not in the catalog\n"
+
+
+def recommend_cluster(scale_factor, deadline_hours=None, budget=None):
+    """
+    Propose instance type and machine count for a scale factor from the catalog prices and a
+    scaling model fitted on the recorded runs of [recommend] benchmark (TPC-DS). Only the
+    [recommend] phases (queries for TPC-DS, all for other benchmarks) count, datagen time
+    depends on whether the data was reused and says nothing about the cluster. Candidate
+    types have at least [recommend] min_vcpu vcpu, [recommend] families limits the families,
+    machine counts go from 2 to [recommend] max_machines.
+    Returns:
+    list of options, best first
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    benchmark = 'TPC-DS'
+    if config.has_option('recommend', 'benchmark'):
+        benchmark = config['recommend']['benchmark']
+    min_vcpu = 4
+    if config.has_option('recommend', 'min_vcpu'):
+        min_vcpu = config.getint('recommend', 'min_vcpu')
+    min_mem_gb = 8
+    if config.has_option('recommend', 'min_mem_gb'):
+        min_mem_gb = config.getfloat('recommend', 'min_mem_gb')
+    families = None
+    if config.has_option('recommend', 'families'):
+        families = [f.strip() for f in config['recommend']['families'].split(',') if f.strip()]
+    max_machines = 32
+    if config.has_option('recommend', 'max_machines'):
+        max_machines = config.getint('recommend', 'max_machines')
+    top = 10
+    if config.has_option('recommend', 'top'):
+        top = config.getint('recommend', 'top')
+    phases = ['queries'] if benchmark == 'TPC-DS' else None
+    if config.has_option('recommend', 'phases'):
+        phases = [p.strip() for p in config['recommend']['phases'].split(',') if p.strip()]
+
+    instances = load_catalog()
+    runs = resultstore.run_totals(results_db(), benchmark, phases)
+    selected = f"{benchmark} runs" + (f" with phase {', '.join(phases)}" if phases else "")
+    if not runs:
+        print(f"no {selected} recorded in {results_db()}, nothing to fit the scaling model on")
+        return []
+    points, notes = costmodel.observations(runs, instances)
+    if not points:
+        print("\n".join(notes))
+        print(f"none of the {len(runs)} {selected} can be used, nothing to fit the scaling model on")
+        return []
+    model = costmodel.fit(points)
+    model['notes'] += notes
+    options = costmodel.recommend(instances.find(min_vcpu, min_mem_gb, families), model, float(scale_factor),
+                                  deadline_s=deadline_hours * 3600 if deadline_hours is not None else None,
+                                  budget=budget, machines=range(2, max_machines + 1), top=top)
+    print(f"------{benchmark} scaling model, {len(instances)} instance types in the catalog:")
+    print(costmodel.format_model(model))
+    print(f"------sf {scale_factor}" + (f", deadline {deadline_hours} h" if deadline_hours is not None else "")
+          + (f", budget {budget}" if budget is not None else "") + ":")
+    print(costmodel.format_recommendations(options) if options else "no option meets the deadline/budget")
+    return options
+
+
+def compare_runs(base_id, new_id, noise=0.05, min_seconds=0.5):
+    result = resultstore.compare(results_db(), base_id, new_id, noise=noise, min_seconds=min_seconds)
+    print(resultstore.format_comparison(result))
+    return result
+
+
+@tracing.traced()
+def start_telemetry(job):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    interval = 1
+    if config.has_option('telemetry', 'interval'):
+        interval = config.getfloat('telemetry', 'interval')
+    gc_every = 5
+    if config.has_option('telemetry', 'gc_every'):
+        gc_every = config.getint('telemetry', 'gc_every')
+
+    script = CTX.target_dir + "/telemetry_sampler.sh"
+    with open(script, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(telemetry.SAMPLER_SCRIPT)
+    job.run(f"mkdir -p {telemetry.REMOTE_DIR}")
+    job.upload(script, f"{telemetry.REMOTE_DIR}/sampler.sh")
+    job.run(f"pkill -f {telemetry.REMOTE_DIR}/sampler.sh; rm -f {telemetry.REMOTE_DIR}/samples.csv; "
+            f"nohup bash {telemetry.REMOTE_DIR}/sampler.sh {interval} {telemetry.REMOTE_DIR}/samples.csv {gc_every} "
+            f"> /dev/null 2>&1 &")
+    print(f"telemetry samplers started on {len(job.tasks)} tasks every {interval} s")
+
+
+@tracing.traced()
+def stop_telemetry(job):
+    """
+    Stop the samplers, collect every node's samples, align them on one timeline and store it
+    in target/<cluster>/telemetry.fmtl.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    interval = 1
+    if config.has_option('telemetry', 'interval'):
+        interval = config.getfloat('telemetry', 'interval')
+
+    job.run(f"pkill -f {telemetry.REMOTE_DIR}/sampler.sh || true")
+    series = {}
+
+    def collect(task):
+        _, rows = telemetry.parse_samples(task.run(f"cat {telemetry.REMOTE_DIR}/samples.csv 2>/dev/null || true"))
+        series[task.name] = telemetry.derive(rows)
+
+    report_failures(run_concurrently([(task.name, 'collect telemetry', collect, (task,), {}) for task in job.tasks],
+                                     16), 'telemetry')
+    timeline = telemetry.align(series, interval)
+    telemetry.write_timeline(CTX.target_dir + "/telemetry.fmtl", timeline)
+    return timeline
+
+
+def record_telemetry(timeline, run_id, title, phase_windows):
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    # 网卡带宽, 默认 10Gbit/s
+    nic_mbs = 1192.0
+    if config.has_option('telemetry', 'nic_gbps'):
+        nic_mbs = config.getfloat('telemetry', 'nic_gbps') * 1e9 / 8 / 1048576
+
+    infofile = CTX.target_dir + "/cluster.info"
+    with open(infofile, 'a+') as f:
+        f.write(f"-------------{title} telemetry---------------\n")
+        for phase, (begin, end) in phase_windows.items():
+            summary = telemetry.summarize_phase(timeline, begin, end, nic_mbs)
+            f.write(telemetry.format_phase_summary(phase, summary))
+            print(telemetry.format_phase_summary(f"{title} {phase}", summary))
+            if run_id is not None:
+                resultstore.record_telemetry(results_db(), run_id, phase, summary)
 
 
 def show_result():
-    infofile = FASTMR_PATH + "/target/" + CLUSTER_NAME + "/cluster.info"
+    infofile = CTX.target_dir + "/cluster.info"
     for line in open(infofile):
         print(line)
 
 
+def run_benchmarks(job, points):
+    """
+    points: list of (benchmark, scale factor), benchmark TPC-DS or TPCx-HS
+    Run them on the tasks of job with the spark conf sized for those tasks and record each.
+    Returns:
+    dict (benchmark, scale factor) -> (run id, seconds), seconds are the TPC-DS query time
+    without datagen and None when [tpcds] execute is off
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+
+    use_telemetry = config.has_option('telemetry', 'enable') and config.getboolean('telemetry', 'enable')
+    if use_telemetry:
+        start_telemetry(job)
+    # (title, run id, phase windows) 采样结束后按阶段汇总
+    telemetry_runs = []
+    results = {}
+
+    for benchmark, scale_factor in points:
+        if benchmark == "TPC-DS":
+            spark_conf, notes = compute_spark_conf(job.tasks, scale_factor_gb=float(scale_factor))
+            record_spark_conf("TPC-DS", spark_conf, notes)
+            summary = run_tpcds(job.tasks[0], scale_factor, spark_conf, job=job)
+            if summary is None:
+                results[(benchmark, scale_factor)] = (None, None)
+                continue
+            queries_time = sum(summary['wall_clock_seconds'])
+            run_id = record_result("TPC-DS", scale_factor, spark_conf,
+                                   {'datagen': summary['datagen_seconds'], 'queries': queries_time},
+                                   summary, machines=len(job.tasks))
+            results[(benchmark, scale_factor)] = (run_id, queries_time)
+            telemetry_runs.append(("TPC-DS", run_id, summary['phase_windows']))
+            if 'throughput' in summary:
+                # 单独记一条, 不影响 TPC-DS 单流的历史对比
+                run_id = record_result("TPC-DS throughput", scale_factor, spark_conf,
+                                       {'throughput': summary['throughput']['elapsed_seconds']},
+                                       summary['throughput'], machines=len(job.tasks))
+                telemetry_runs.append(("TPC-DS throughput", run_id,
+                                       {'throughput': summary['throughput']['window']}))
+            for row in summary.get('matrix', []):
+                title = f"TPC-DS {row['layout']['name']}"
+                run_id = record_result(title, scale_factor, spark_conf,
+                                       {'convert': row['convert_seconds'],
+                                        'queries': sum(row['summary']['wall_clock_seconds'])},
+                                       dict(row['summary'], footprint_bytes=row['footprint_bytes'],
+                                            scan_bytes=row['scan_bytes']), machines=len(job.tasks))
+                telemetry_runs.append((title, run_id, {'queries': row['window']}))
+        else:
+            spark_conf, notes = compute_spark_conf(job.tasks)
+            record_spark_conf("TPCx-HS", spark_conf, notes)
+            tpcxhs_start_time = time.time()
+            tpcxhs_time = run_tpcxhs(job.tasks[0], scale_factor, spark_conf, job=job)
+            run_id = record_result("TPCx-HS", scale_factor, spark_conf, {'total': tpcxhs_time},
+                                   machines=len(job.tasks))
+            results[(benchmark, scale_factor)] = (run_id, tpcxhs_time)
+            telemetry_runs.append(("TPCx-HS", run_id, {'total': [tpcxhs_start_time, time.time()]}))
+
+    if use_telemetry:
+        timeline = stop_telemetry(job)
+        for title, run_id, phase_windows in telemetry_runs:
+            record_telemetry(timeline, run_id, title, phase_windows)
+    return results
+
+
 # 自己重写这个方法
+@tracing.traced()
 def run_tpc(job):
     config = ConfigParser()
 
-    config.read(CONF_PATH, encoding='UTF-8')
-
-    SPARK_EXECUTOR_INSTANCES, SPARK_EXECUTOR_MEMORY, NUM_REDUCERS, SPARK_EXECUTOR_MEMORYOVERHEAD, \
-    SPARK_DEFAULT_PARALLELISM, SPARK_EXECUTOR_CORES = compute_spark_conf(job.tasks[0])
+    config.read(CTX.conf_path, encoding='UTF-8')
 
     # 运行测试
-    runTPCDS = config.getboolean('tpcds', 'run')
-    if runTPCDS:
-        tpcds_scaleFactor = config['tpcds']['scaleFactor']
-        run_tpcds(job.tasks[0],
-                  tpcds_scaleFactor,
-                  SPARK_EXECUTOR_INSTANCES=SPARK_EXECUTOR_INSTANCES,
-                  SPARK_EXECUTOR_MEMORY=SPARK_EXECUTOR_MEMORY,
-                  SPARK_EXECUTOR_MEMORYOVERHEAD=SPARK_EXECUTOR_MEMORYOVERHEAD,
-                  SPARK_DEFAULT_PARALLELISM=SPARK_DEFAULT_PARALLELISM,
-                  SPARK_EXECUTOR_CORES=SPARK_EXECUTOR_CORES)
-    runTPCxHS = config.getboolean('tpcxhs', 'run')
-    if runTPCxHS:
-        tpcxhs_scaleFactor = config['tpcxhs']['scaleFactor']
-        run_tpcxhs(job.tasks[0],
-                   tpcxhs_scaleFactor,
-                   SPARK_EXECUTOR_INSTANCES=SPARK_EXECUTOR_INSTANCES,
-                   SPARK_EXECUTOR_MEMORY=SPARK_EXECUTOR_MEMORY,
-                   SPARK_DEFAULT_PARALLELISM=SPARK_DEFAULT_PARALLELISM,
-                   SPARK_EXECUTOR_CORES=SPARK_EXECUTOR_CORES)
+    points = []
+    if config.getboolean('tpcds', 'run'):
+        points.append(("TPC-DS", config['tpcds']['scaleFactor']))
+    if config.getboolean('tpcxhs', 'run'):
+        points.append(("TPCx-HS", config['tpcxhs']['scaleFactor']))
+    results = run_benchmarks(job, points)
+    show_result()
+    print(f"complete TPC test.You can view the results in ./target/{CTX.cluster_name}/cluster.info")
+    return results
+
+
+def sweep_enabled():
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    return config.has_option('sweep', 'run') and config.getboolean('sweep', 'run')
+
+
+def sweep_list(option, cast=str):
+    """comma separated [sweep] option, empty when unset"""
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    if not config.has_option('sweep', option):
+        return []
+    return [cast(v.strip()) for v in config['sweep'][option].split(',') if v.strip()]
+
+
+@tracing.traced()
+def run_sweep(job):
+    """
+    Run every [sweep] tpcds_scale_factors / tpcxhs_scale_factors on every cluster size of
+    [sweep] machines, smallest first. The cluster is deployed once on the smallest size and
+    grown with scale_cluster between the sizes, so HDFS data (and the TPC-DS datasets) stay
+    in place; with [sweep] rebalance the balancer spreads the blocks onto the new nodes first.
+    Writes target/<cluster>/sweep.json after every size and the strong / weak scaling
+    efficiency report to cluster.info.
+    """
+    config = ConfigParser()
+    config.read(CTX.conf_path, encoding='UTF-8')
+    hadoop_version = config['hadoop']['version']
+
+    sizes = sorted(set(sweep_list('machines', int)))
+    assert sizes, "[sweep] machines is empty"
+    assert sizes[-1] <= len(job.tasks), f"[sweep] machines {sizes[-1]} > {len(job.tasks)} tasks"
+    points = [("TPC-DS", sf) for sf in sweep_list('tpcds_scale_factors')] + \
+             [("TPCx-HS", sf) for sf in sweep_list('tpcxhs_scale_factors')]
+    assert points, "[sweep] tpcds_scale_factors and tpcxhs_scale_factors are both empty"
+    rebalance = True
+    if config.has_option('sweep', 'rebalance'):
+        rebalance = config.getboolean('sweep', 'rebalance')
+    threshold = 0.7
+    if config.has_option('sweep', 'efficiency_threshold'):
+        threshold = config.getfloat('sweep', 'efficiency_threshold')
+
+    master = job.tasks[0]
+    deployed = master.run(f"cat /opt/hadoop-{hadoop_version}/etc/hadoop/{workers_file(hadoop_version)} "
+                          f"2>/dev/null || true").strip()
+    sweep_file = CTX.target_dir + "/sweep.json"
+    infofile = CTX.target_dir + "/cluster.info"
+    rows = []
+    for machines in sizes:
+        group = TaskGroup(f"{CTX.cluster_name}-{machines}", job.tasks[:machines])
+        print(f"sweep: {machines} nodes")
+        if not deployed:
+            setup_pkg(group)
+            setup_env(group)
+            deployed = True
+        else:
+            added, _ = scale_cluster(group)
+            if added and rebalance:
+                remote_run(master, "hdfs balancer -threshold 10")
+        for (benchmark, scale_factor), (run_id, seconds) in run_benchmarks(group, points).items():
+            rows.append({'benchmark': benchmark, 'machines': machines, 'scale_factor': scale_factor,
+                         'seconds': seconds, 'run_id': run_id})
+        with open(sweep_file, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+
+    # 按数值比较 scale factor, 同一规模的字符串写法不同 (100 / 100.0) 也归到一起
+    measured = [dict(r, scale_factor=float(r['scale_factor'])) for r in rows]
+    report = scaling.format_report(scaling.strong_scaling(measured, threshold),
+                                   scaling.weak_scaling(measured, threshold), threshold)
+    with open(infofile, 'a+') as f:
+        f.write("-------------scaling sweep---------------\n")
+        for r in rows:
+            seconds = f"{r['seconds']:.1f} s" if r['seconds'] is not None else "not executed"
+            f.write(f"{r['benchmark']} sf {r['scale_factor']} on {r['machines']} nodes: {seconds}, run {r['run_id']}\n")
+        f.write(report)
     show_result()
-    print(f"complete TPC test.You can view the results in ./target/{CLUSTER_NAME}/cluster.info")
+    print(f"complete scaling sweep. You can view the results in ./target/{CTX.cluster_name}/cluster.info")
+    return rows
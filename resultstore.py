@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+import json
+import os
+import sqlite3
+import time
+
+import benchstats
+
+SCHEMA = """
+create table if not exists runs (
+    id integer primary key autoincrement,
+    created real not null,
+    cluster text,
+    benchmark text not null,
+    instance_type text,
+    machines integer,
+    hadoop_version text,
+    spark_version text,
+    hive_version text,
+    scale_factor text,
+    spark_conf text
+);
+create table if not exists phases (
+    run_id integer not null references runs(id),
+    phase text not null,
+    seconds real,
+    primary key (run_id, phase)
+);
+create table if not exists query_results (
+    run_id integer not null references runs(id),
+    query text not null,
+    runs integer,
+    failures integer,
+    median real,
+    p95 real,
+    min real,
+    max real,
+    samples text,
+    primary key (run_id, query)
+);
+create table if not exists telemetry (
+    run_id integer not null references runs(id),
+    phase text not null,
+    bottleneck text,
+    metrics text,
+    primary key (run_id, phase)
+);
+create index if not exists runs_key on runs (benchmark, instance_type, machines, scale_factor);
+"""
+
+
+def connect(db_path):
+    # 新检出的目录还没有 target/
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    # batch 模式下多个进程同时写, 等锁而不是报 database is locked
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_run(db_path, benchmark, meta, spark_conf=None, phases=None, summary=None):
+    """
+    meta: cluster, instance_type, machines, hadoop_version, spark_version, hive_version, scale_factor
+    phases: phase name -> seconds
+    summary: benchstats.summarize output for per query results
+    Returns:
+    id of the new run
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            cur = conn.execute(
+                "insert into runs (created, cluster, benchmark, instance_type, machines, hadoop_version, "
+                "spark_version, hive_version, scale_factor, spark_conf) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), meta.get('cluster'), benchmark, meta.get('instance_type'), meta.get('machines'),
+                 meta.get('hadoop_version'), meta.get('spark_version'), meta.get('hive_version'),
+                 str(meta.get('scale_factor')), json.dumps(spark_conf or {}, sort_keys=True)))
+            run_id = cur.lastrowid
+            for phase, seconds in (phases or {}).items():
+                conn.execute("insert into phases (run_id, phase, seconds) values (?, ?, ?)", (run_id, phase, seconds))
+            for query, q in ((summary or {}).get('queries') or {}).items():
+                conn.execute("insert into query_results (run_id, query, runs, failures, median, p95, min, max, samples) "
+                             "values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (run_id, query, q['runs'], q['failures'], q['median'], q['p95'], q['min'], q['max'],
+                              json.dumps(q['samples'])))
+        return run_id
+    finally:
+        conn.close()
+
+
+def record_telemetry(db_path, run_id, phase, summary):
+    """summary: telemetry.summarize_phase output"""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("insert or replace into telemetry (run_id, phase, bottleneck, metrics) values (?, ?, ?, ?)",
+                         (run_id, phase, summary['bottleneck'], json.dumps(summary['metrics'], sort_keys=True)))
+    finally:
+        conn.close()
+
+
+def list_runs(db_path, benchmark=None):
+    conn = connect(db_path)
+    try:
+        sql = "select * from runs"
+        args = ()
+        if benchmark:
+            sql += " where benchmark = ?"
+            args = (benchmark,)
+        return [dict(r) for r in conn.execute(sql + " order by id", args)]
+    finally:
+        conn.close()
+
+
+def run_totals(db_path, benchmark, phases=None):
+    """runs of a benchmark with the sum of their phase seconds as seconds, only the given phases when set"""
+    where, args = "r.benchmark = ?", [benchmark]
+    if phases:
+        where += f" and p.phase in ({', '.join('?' * len(phases))})"
+        args += list(phases)
+    conn = connect(db_path)
+    try:
+        return [dict(r) for r in conn.execute(
+            "select r.*, sum(p.seconds) as seconds from runs r join phases p on p.run_id = r.id "
+            f"where {where} group by r.id order by r.id", args)]
+    finally:
+        conn.close()
+
+
+def load_run(db_path, run_id):
+    conn = connect(db_path)
+    try:
+        run = conn.execute("select * from runs where id = ?", (run_id,)).fetchone()
+        if run is None:
+            raise KeyError(f"no run {run_id} in {db_path}")
+        run = dict(run)
+        run['spark_conf'] = json.loads(run['spark_conf'] or '{}')
+        run['phases'] = {r['phase']: r['seconds'] for r in
+                         conn.execute("select phase, seconds from phases where run_id = ?", (run_id,))}
+        run['queries'] = {r['query']: dict(r) for r in
+                          conn.execute("select * from query_results where run_id = ?", (run_id,))}
+        run['telemetry'] = {r['phase']: {'bottleneck': r['bottleneck'], 'metrics': json.loads(r['metrics'])} for r in
+                            conn.execute("select * from telemetry where run_id = ?", (run_id,))}
+        return run
+    finally:
+        conn.close()
+
+
+def classify(base, new, base_spread=0.0, new_spread=0.0, noise=0.05, min_seconds=0.5):
+    """
+    speedup = base / new, a change counts only when it exceeds the relative noise threshold,
+    the absolute floor and the spread (max - min) observed in either run
+    """
+    if base is None or new is None:
+        return None, 'failed' if new is None else 'fixed'
+    speedup = base / new if new > 0 else float('inf')
+    delta = base - new
+    threshold = max(noise * base, min_seconds, base_spread, new_spread)
+    if abs(delta) <= threshold:
+        return speedup, 'same'
+    return speedup, 'faster' if delta > 0 else 'slower'
+
+
+def compare(db_path, base_id, new_id, noise=0.05, min_seconds=0.5):
+    base = load_run(db_path, base_id)
+    new = load_run(db_path, new_id)
+    rows = []
+    for phase in sorted(set(base['phases']) | set(new['phases'])):
+        b, n = base['phases'].get(phase), new['phases'].get(phase)
+        speedup, status = classify(b, n, noise=noise, min_seconds=min_seconds)
+        rows.append(('phase', phase, b, n, speedup, status))
+    for query in sorted(set(base['queries']) | set(new['queries']), key=benchstats.query_sort_key):
+        b, n = base['queries'].get(query), new['queries'].get(query)
+        if b is None or n is None:
+            rows.append(('query', query, b and b['median'], n and n['median'], None, 'missing'))
+            continue
+        speedup, status = classify(b['median'], n['median'],
+                                   (b['max'] or 0) - (b['min'] or 0) if b['median'] is not None else 0,
+                                   (n['max'] or 0) - (n['min'] or 0) if n['median'] is not None else 0,
+                                   noise=noise, min_seconds=min_seconds)
+        rows.append(('query', query, b['median'], n['median'], speedup, status))
+    changed = {k: (base['spark_conf'].get(k), new['spark_conf'].get(k))
+               for k in sorted(set(base['spark_conf']) | set(new['spark_conf']))
+               if base['spark_conf'].get(k) != new['spark_conf'].get(k)}
+    for key in ('instance_type', 'machines', 'hadoop_version', 'spark_version', 'hive_version', 'scale_factor'):
+        if base[key] != new[key]:
+            changed[key] = (base[key], new[key])
+    return {'base': base, 'new': new, 'rows': rows, 'changed': changed}
+
+
+def format_comparison(result):
+    base, new = result['base'], result['new']
+
+    def fmt(v):
+        return f"{v:.2f}" if isinstance(v, (int, float)) else "-"
+
+    lines = [f"run {base['id']} ({base['benchmark']} {base['instance_type']} x{base['machines']} sf {base['scale_factor']}) "
+             f"-> run {new['id']} ({new['benchmark']} {new['instance_type']} x{new['machines']} sf {new['scale_factor']})"]
+    for key, (b, n) in result['changed'].items():
+        lines.append(f"  changed {key}: {b} -> {n}")
+    for phase in sorted(set(base.get('telemetry', {})) | set(new.get('telemetry', {}))):
+        b = base.get('telemetry', {}).get(phase, {}).get('bottleneck', '-')
+        n = new.get('telemetry', {}).get(phase, {}).get('bottleneck', '-')
+        lines.append(f"  bottleneck {phase}: {b} -> {n}")
+    lines.append(f"{'kind':<7}{'name':<24}{'base':>10}{'new':>10}{'speedup':>10}  status")
+    counts = {}
+    for kind, name, b, n, speedup, status in result['rows']:
+        counts[status] = counts.get(status, 0) + 1
+        lines.append(f"{kind:<7}{name:<24}{fmt(b):>10}{fmt(n):>10}{fmt(speedup):>10}  {status}")
+    lines.append(", ".join(f"{v} {k}" for k, v in sorted(counts.items())))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import math
+
+
+def _interpolate(measured, scale_factor):
+    """
+    seconds at scale_factor from the (scale factor, seconds) measured on one cluster size,
+    log-log between the two neighbours, None outside the measured range
+    """
+    measured = sorted(measured)
+    for (sf0, t0), (sf1, t1) in zip(measured, measured[1:]):
+        if sf0 <= scale_factor <= sf1:
+            if sf0 == sf1:
+                return t0
+            w = (math.log(scale_factor) - math.log(sf0)) / (math.log(sf1) - math.log(sf0))
+            return math.exp(math.log(t0) + w * (math.log(t1) - math.log(t0)))
+    for sf, t in measured:
+        if sf == scale_factor:
+            return t
+    return None
+
+
+def strong_scaling(points, threshold=0.7):
+    """
+    points: list of dict benchmark, machines, scale_factor, seconds
+    Same data on more nodes: speedup T(n0) / T(n) against the smallest cluster, efficiency
+    speedup / (n / n0). The knee is the first size whose efficiency drops below threshold
+    or whose marginal efficiency over the previous size does, adding nodes stops paying off there.
+    Returns:
+    list of dict benchmark, scale_factor, rows (machines, seconds, speedup, efficiency, marginal), knee
+    """
+    curves = []
+    groups = {}
+    for p in points:
+        if p['seconds']:
+            groups.setdefault((p['benchmark'], p['scale_factor']), {})[p['machines']] = p['seconds']
+    for (benchmark, scale_factor), by_size in sorted(groups.items()):
+        sizes = sorted(by_size)
+        if len(sizes) < 2:
+            continue
+        n0, t0 = sizes[0], by_size[sizes[0]]
+        rows, knee = [], None
+        for i, n in enumerate(sizes):
+            speedup = t0 / by_size[n]
+            efficiency = speedup / (n / n0)
+            marginal = None
+            if i > 0:
+                prev = sizes[i - 1]
+                marginal = (by_size[prev] / by_size[n]) / (n / prev)
+            if knee is None and i > 0 and (efficiency < threshold or marginal < threshold):
+                knee = n
+            rows.append({'machines': n, 'seconds': by_size[n], 'speedup': speedup, 'efficiency': efficiency,
+                         'marginal': marginal})
+        curves.append({'benchmark': benchmark, 'scale_factor': scale_factor, 'rows': rows, 'knee': knee})
+    return curves
+
+
+def weak_scaling(points, threshold=0.7):
+    """
+    Data growing with the cluster: for every scale factor measured on the smallest cluster,
+    efficiency T(n0, sf0) / T(n, sf0 * n / n0). Sizes where that scale factor was not run
+    are interpolated log-log between the measured ones (marked), never extrapolated.
+    Returns:
+    list of dict benchmark, base_scale_factor, rows (machines, scale_factor, seconds, efficiency, interpolated), knee
+    """
+    curves = []
+    by_benchmark = {}
+    for p in points:
+        if p['seconds']:
+            by_benchmark.setdefault(p['benchmark'], {}).setdefault(p['machines'], []).append(
+                (float(p['scale_factor']), p['seconds']))
+    for benchmark, by_size in sorted(by_benchmark.items()):
+        sizes = sorted(by_size)
+        if len(sizes) < 2:
+            continue
+        n0 = sizes[0]
+        for sf0, t0 in sorted(by_size[n0]):
+            rows, knee = [], None
+            for n in sizes:
+                target = sf0 * n / n0
+                seconds = _interpolate(by_size[n], target)
+                if seconds is None:
+                    continue
+                exact = any(abs(sf - target) < 1e-9 for sf, _ in by_size[n])
+                efficiency = t0 / seconds
+                if knee is None and n != n0 and efficiency < threshold:
+                    knee = n
+                rows.append({'machines': n, 'scale_factor': target, 'seconds': seconds, 'efficiency': efficiency,
+                             'interpolated': not exact})
+            if len(rows) > 1:
+                curves.append({'benchmark': benchmark, 'base_scale_factor': sf0, 'rows': rows, 'knee': knee})
+    return curves
+
+
+def format_report(strong, weak, threshold=0.7):
+    lines = [f"------strong scaling (same data, more nodes), knee below {threshold:.0%} efficiency:"]
+    for curve in strong:
+        lines.append(f"{curve['benchmark']} sf {curve['scale_factor']}"
+                     + (f", stops paying off at {curve['knee']} nodes" if curve['knee'] else ""))
+        lines.append(f"{'nodes':>7}{'seconds':>11}{'speedup':>9}{'eff':>7}{'marginal':>10}")
+        for r in curve['rows']:
+            marginal = f"{r['marginal']:.2f}" if r['marginal'] is not None else "-"
+            lines.append(f"{r['machines']:>7}{r['seconds']:>11.1f}{r['speedup']:>9.2f}{r['efficiency']:>7.2f}"
+                         f"{marginal:>10}")
+    lines.append("------weak scaling (data grows with the nodes):")
+    for curve in weak:
+        lines.append(f"{curve['benchmark']} from sf {curve['base_scale_factor']:g}"
+                     + (f", below {threshold:.0%} at {curve['knee']} nodes" if curve['knee'] else ""))
+        lines.append(f"{'nodes':>7}{'sf':>9}{'seconds':>11}{'eff':>7}")
+        for r in curve['rows']:
+            lines.append(f"{r['machines']:>7}{r['scale_factor']:>9g}{r['seconds']:>11.1f}{r['efficiency']:>7.2f}"
+                         + ("  interpolated" if r['interpolated'] else ""))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+import math
+
+
+def round_up(value, unit):
+    return int(math.ceil(value / unit) * unit)
+
+
+def round_down(value, unit):
+    return int(math.floor(value / unit) * unit)
+
+
+def node_capacity(node_vcpu, node_mem_mb, master=False, reserved_cores=1, reserved_mem_mb=None,
+                  master_reserved_cores=1, master_reserved_mem_mb=4096, yarn_min_allocation_mb=1024):
+    """
+    vcores and MB a NodeManager offers to containers: the node minus the OS, DataNode and
+    NodeManager footprint, and on the master also NameNode, ResourceManager, history server
+    and the metastore database.
+    Returns:
+    (yarn vcores, yarn MB, reserved cores, reserved MB)
+    """
+    if reserved_mem_mb is None:
+        # OS + DataNode + NodeManager, plus a little page cache on big nodes
+        reserved_mem_mb = max(3072, int(node_mem_mb * 0.08))
+    cores = reserved_cores + (master_reserved_cores if master else 0)
+    mem = reserved_mem_mb + (master_reserved_mem_mb if master else 0)
+    yarn_mem_mb = max(yarn_min_allocation_mb, round_down(node_mem_mb - mem, yarn_min_allocation_mb))
+    return max(1, node_vcpu - cores), yarn_mem_mb, cores, mem
+
+
+def size_spark(node_vcpu, node_mem_mb, machines, **kwargs):
+    """identical nodes, see size_spark_nodes"""
+    return size_spark_nodes([(node_vcpu, node_mem_mb)] * machines, **kwargs)
+
+
+def size_spark_nodes(nodes,
+                     executor_cores=None,
+                     executor_mem_gb=None,
+                     yarn_min_allocation_mb=1024,
+                     overhead_fraction=0.10,
+                     offheap_mb=0,
+                     reserved_cores=1,
+                     reserved_mem_mb=None,
+                     master_reserved_cores=1,
+                     master_reserved_mem_mb=4096,
+                     deploy_mode='client',
+                     driver_cores=None,
+                     driver_mem_gb=None,
+                     scale_factor_gb=None,
+                     shuffle_fraction=0.5,
+                     target_partition_mb=128,
+                     tasks_per_core=2,
+                     shuffle_partitions_per_core=None):
+    """
+    Derive executor/driver sizing and partition counts for a YARN cluster.
+
+    nodes is a list of (vcpu, MB) per node, the master first. Every NodeManager offers its
+    node_capacity to containers. Executors have one size cluster-wide, so the cores and the
+    heap are picked on the smallest worker and the executor count is summed over the nodes.
+    An executor container is heap + max(384, overhead_fraction * heap) + offheap_mb, rounded
+    up to a multiple of yarn_min_allocation_mb the way the YARN scheduler does. In client
+    mode the driver JVM runs on the master outside YARN and takes resources away from the
+    master's executors; in cluster mode it lives in the AM container of one node.
+    Shuffle partitions are sized so that shuffle_fraction of scale_factor_gb lands in
+    partitions of about target_partition_mb, unless shuffle_partitions_per_core pins them
+    to a multiple of the executor cores.
+
+    Returns:
+    (conf, notes): spark property -> value, spark property -> explanation
+    """
+    assert deploy_mode in ('client', 'cluster'), f"unknown deploy mode {deploy_mode}"
+    assert nodes, "no nodes to size for"
+    notes = {}
+
+    capacity = [node_capacity(vcpu, mem, i == 0, reserved_cores, reserved_mem_mb, master_reserved_cores,
+                              master_reserved_mem_mb, yarn_min_allocation_mb)
+                for i, (vcpu, mem) in enumerate(nodes)]
+    # 单节点时 master 也是唯一的 worker
+    workers = capacity[1:] or capacity
+    worker_nodes = nodes[1:] or nodes
+    smallest = min(range(len(workers)), key=lambda i: (workers[i][0], workers[i][1]))
+    yarn_vcores, yarn_mem_mb = workers[smallest][0], min(w[1] for w in workers)
+    node_vcpu, node_mem_mb = worker_nodes[smallest]
+    homogeneous = len(set(worker_nodes)) == 1
+
+    if executor_cores is None:
+        # 3~5 核一个 executor, 取浪费核数最少的, 相同时取大的
+        executor_cores = max([c for c in (5, 4, 3) if c <= yarn_vcores] or [yarn_vcores],
+                             key=lambda c: ((yarn_vcores // c) * c, c))
+        cores_reason = "chosen from 3-5 to waste the fewest vcores"
+    else:
+        cores_reason = "fixed by [spark] executor_core"
+    executor_cores = max(1, min(executor_cores, yarn_vcores))
+
+    def container_mb(heap_mb):
+        return round_up(heap_mb + max(384, int(heap_mb * overhead_fraction)) + offheap_mb, yarn_min_allocation_mb)
+
+    if executor_mem_gb is not None:
+        heap_mb = int(executor_mem_gb * 1024)
+        heap_reason = "fixed by [spark] executor_mem"
+        if container_mb(heap_mb) > yarn_mem_mb:
+            # YARN 分配不出比 NodeManager 还大的 container, 缩到放得下为止
+            fixed_mb = heap_mb
+            while heap_mb > 512 and container_mb(heap_mb) > yarn_mem_mb:
+                heap_mb -= 128
+            heap_reason = (f"[spark] executor_mem {fixed_mb} MB shrunk, its {container_mb(fixed_mb)} MB container "
+                           f"exceeds the {yarn_mem_mb} MB YARN offers on the smallest worker")
+    else:
+        # 每个 worker 按核数放满 executor 时每个 executor 的内存预算, 取最小的
+        budget_mb = min(round_down(mem / max(1, vcores // executor_cores), yarn_min_allocation_mb)
+                        for vcores, mem, _, _ in workers)
+        heap_mb = int((budget_mb - offheap_mb) / (1 + overhead_fraction))
+        # 溢出的部分按 YARN 最小分配单位向上取整, 可能超出预算, 逐步收缩堆
+        while heap_mb > 512 and container_mb(heap_mb) > budget_mb:
+            heap_mb -= 128
+        heap_reason = f"largest heap whose container fits the {budget_mb} MB per-executor budget"
+    overhead_mb = max(384, int(heap_mb * overhead_fraction))
+    container = container_mb(heap_mb)
+    if container > yarn_mem_mb:
+        raise ValueError(f"an executor container of {container} MB does not fit the {yarn_mem_mb} MB YARN "
+                         f"offers on the smallest worker")
+    per_worker = [min(vcores // executor_cores, mem // container) for vcores, mem, _, _ in workers]
+    executors_per_node = min(per_worker)
+
+    reserved = workers[smallest]
+    notes['spark.executor.cores'] = (f"{executor_cores} cores ({cores_reason}), {executors_per_node} executors per "
+                                     f"node from {node_vcpu} vcpu - {reserved[2]} reserved for OS/daemons"
+                                     + ("" if homogeneous else " on the smallest worker"))
+    notes['spark.executor.memory'] = (f"{heap_mb} MB heap: {heap_reason}; "
+                                      + (f"node has {node_mem_mb} MB, {reserved[3]} MB reserved, {yarn_mem_mb} MB "
+                                         f"for YARN" if homogeneous else
+                                         f"smallest worker has {yarn_mem_mb} MB for YARN"))
+    notes['spark.executor.memoryOverhead'] = (f"max(384, {overhead_fraction:.2f} x heap) = {overhead_mb} MB"
+                                              + (f" + {offheap_mb} MB off-heap" if offheap_mb else "")
+                                              + f", container rounded up to {container} MB "
+                                              f"(yarn min allocation {yarn_min_allocation_mb} MB)")
+
+    master_vcpu, master_node_mem = nodes[0]
+    if driver_cores is None:
+        driver_cores = min(executor_cores, 2)
+    if driver_mem_gb is not None:
+        driver_mem_mb = int(driver_mem_gb * 1024)
+    else:
+        driver_mem_mb = min(heap_mb, 8192, max(2048, round_down(master_node_mem // 16, 1024)))
+    driver_container = container_mb(driver_mem_mb)
+
+    # master 上扣除 driver 占用后还能放几个 executor
+    master_vcores, master_yarn_mem = capacity[0][0], capacity[0][1]
+    master_mem = master_yarn_mem - driver_container
+    master_cores = master_vcores - (driver_cores if deploy_mode == 'client' else 1)
+    master_executors = max(0, min(master_mem // container, master_cores // executor_cores))
+    worker_executors = sum(per_worker) if len(nodes) > 1 else 0
+    instances = worker_executors + master_executors
+    if instances == 0:
+        raise ValueError(f"no {container} MB / {executor_cores} core executor fits next to the "
+                         f"{driver_container} MB driver")
+    notes['spark.driver.memory'] = (f"{driver_mem_mb} MB, {driver_cores} cores in {deploy_mode} mode on the master "
+                                    f"({driver_container} MB incl. overhead)")
+    if homogeneous:
+        notes['spark.executor.instances'] = (f"{executors_per_node} x {len(nodes) - 1} workers + {master_executors} "
+                                             f"on the master after the driver = {instances}")
+    else:
+        notes['spark.executor.instances'] = (f"{' + '.join(str(n) for n in per_worker)} on the workers + "
+                                             f"{master_executors} on the master after the driver = {instances}")
+
+    total_cores = instances * executor_cores
+    parallelism = int(total_cores * tasks_per_core)
+    notes['spark.default.parallelism'] = f"{tasks_per_core} tasks per executor core ({total_cores} cores)"
+    if shuffle_partitions_per_core:
+        shuffle_partitions = int(total_cores * shuffle_partitions_per_core)
+        notes['spark.sql.shuffle.partitions'] = f"{shuffle_partitions_per_core} partitions per executor core"
+    elif scale_factor_gb:
+        shuffle_partitions = int(math.ceil(scale_factor_gb * 1024 * shuffle_fraction / target_partition_mb))
+        shuffle_partitions = max(round_up(shuffle_partitions, total_cores), parallelism)
+        notes['spark.sql.shuffle.partitions'] = (f"{shuffle_fraction:.0%} of {scale_factor_gb} GB in "
+                                                 f"~{target_partition_mb} MB partitions, rounded up to whole waves "
+                                                 f"of {total_cores} cores")
+    else:
+        shuffle_partitions = parallelism
+        notes['spark.sql.shuffle.partitions'] = "no data scale given, same as spark.default.parallelism"
+
+    conf = {
+        'spark.driver.cores': str(driver_cores),
+        'spark.driver.memory': f"{driver_mem_mb}m",
+        'spark.executor.instances': str(instances),
+        'spark.executor.cores': str(executor_cores),
+        'spark.executor.memory': f"{heap_mb}m",
+        'spark.executor.memoryOverhead': f"{overhead_mb}m",
+        'spark.default.parallelism': str(parallelism),
+        'spark.sql.shuffle.partitions': str(shuffle_partitions),
+    }
+    if offheap_mb:
+        conf['spark.memory.offHeap.enabled'] = 'true'
+        conf['spark.memory.offHeap.size'] = f"{offheap_mb}m"
+    return conf, notes
+
+
+def explain(conf, notes):
+    lines = []
+    for key, value in conf.items():
+        lines.append(f"{key} {value}")
+        if key in notes:
+            lines.append(f"    # {notes[key]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+
+class StepFailed(RuntimeError):
+    pass
+
+
+class StepGraph:
+    """
+    A small dependency graph of deploy steps.
+    Steps whose dependencies are all done run concurrently; every finished step is
+    checkpointed to state_file so that a failed run resumes where it stopped.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.steps = {}
+
+    def add(self, name, fn, deps=()):
+        assert name not in self.steps, f"step {name} declared twice"
+        self.steps[name] = (fn, tuple(deps))
+        return self
+
+    def order(self):
+        """Topological order of the steps, raises on unknown deps or cycles."""
+        for name, (_, deps) in self.steps.items():
+            for dep in deps:
+                assert dep in self.steps, f"step {name} depends on unknown step {dep}"
+        ordered = []
+        visiting = set()
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            assert name not in visiting, f"dependency cycle through step {name}"
+            visiting.add(name)
+            for dep in self.steps[name][1]:
+                visit(dep)
+            visiting.remove(name)
+            visited.add(name)
+            ordered.append(name)
+
+        for name in self.steps:
+            visit(name)
+        return ordered
+
+    def _load(self, state_file, fingerprint):
+        if state_file is None or not os.path.exists(state_file):
+            return set()
+        with open(state_file, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('graph') != self.name or state.get('fingerprint') != fingerprint:
+            print(f"[{self.name}] checkpoint {state_file} belongs to another config, starting over")
+            return set()
+        return set(state.get('completed', [])) & set(self.steps)
+
+    def _save(self, state_file, fingerprint, done):
+        if state_file is None:
+            return
+        tmp = state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'graph': self.name,
+                       'fingerprint': fingerprint,
+                       'completed': [name for name in self.order() if name in done]}, f, indent=1)
+        os.replace(tmp, state_file)
+
+    def _traced(self, name):
+        with tracing.span(name, cat=self.name):
+            return self.steps[name][0]()
+
+    def run(self, state_file=None, fingerprint=None, max_workers=4, resume=True):
+        order = self.order()
+        done = self._load(state_file, fingerprint) if resume else set()
+        for name in order:
+            if name in done:
+                print(f"[{self.name}] skip {name}, already done")
+
+        pending = [name for name in order if name not in done]
+        running = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix=self.name) as pool:
+            while pending or running:
+                if not failed:
+                    for name in [n for n in pending if all(d in done for d in self.steps[n][1])]:
+                        pending.remove(name)
+                        print(f"[{self.name}] start {name}")
+                        running[pool.submit(self._traced, name)] = (name, time.time())
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, start_time = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"[{self.name}] {name} failed after {time.time() - start_time:.1f} s: {e}")
+                        failed.append((name, e))
+                        continue
+                    done.add(name)
+                    self._save(state_file, fingerprint, done)
+                    print(f"[{self.name}] {name} done in {time.time() - start_time:.1f} s")
+
+        if failed:
+            raise StepFailed(f"{self.name}: step(s) {', '.join(n for n, _ in failed)} failed, "
+                             f"{len(done)}/{len(order)} steps done; rerun to resume") from failed[0][1]
+        if state_file is not None and os.path.exists(state_file):
+            os.remove(state_file)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+
+REMOTE_DIR = "/root/.fastmr/telemetry"
+MAGIC = b"FMTL1\n"
+
+# 每个节点上运行的采样脚本, 只读 /proc, 每 gc_every 次采样调用一次 jstat
+SAMPLER_SCRIPT = r"""#!/bin/bash
+INTERVAL=$1
+OUT=$2
+GC_EVERY=$3
+JSTAT=${JAVA_HOME:-/usr/java/jdk1.8.0_321-amd64}/bin/jstat
+DEVS=""
+for m in /mnt/disk*; do
+  d=$(findmnt -n -o SOURCE "$m" 2>/dev/null)
+  [ -n "$d" ] && DEVS="$DEVS $(basename $d)"
+done
+hdr="ts,cpu_user,cpu_nice,cpu_system,cpu_idle,cpu_iowait,cpu_irq,cpu_softirq,cpu_steal,mem_total_kb,mem_avail_kb,net_rx,net_tx,gc_s,gc_jvms"
+for d in $DEVS; do hdr="$hdr,disk_${d}_rd_sec,disk_${d}_wr_sec,disk_${d}_io_ms"; done
+echo "$hdr" > $OUT
+tick=0
+gc=0
+jvms=0
+while true; do
+  ts=$(date +%s.%N)
+  cpu=$(awk '/^cpu /{print $2","$3","$4","$5","$6","$7","$8","$9; exit}' /proc/stat)
+  mem=$(awk '/^MemTotal:/{t=$2} /^MemAvailable:/{a=$2} END{print t","a}' /proc/meminfo)
+  net=$(awk -F'[: ]+' 'NR>2 && $2!="lo"{rx+=$3; tx+=$11} END{printf "%d,%d", rx, tx}' /proc/net/dev)
+  if [ $((tick % GC_EVERY)) -eq 0 ]; then
+    gc=0
+    jvms=0
+    for p in $(pgrep -f CoarseGrainedExecutorBackend); do
+      g=$($JSTAT -gc $p 2>/dev/null | awk 'NR==2{print $NF}')
+      if [ -n "$g" ]; then gc=$(awk -v a=$gc -v b=$g 'BEGIN{print a+b}'); jvms=$((jvms+1)); fi
+    done
+  fi
+  disks=""
+  for d in $DEVS; do disks="$disks$(awk -v d=$d '$3==d{printf ",%s,%s,%s",$6,$10,$13}' /proc/diskstats)"; done
+  echo "$ts,$cpu,$mem,$net,$gc,$jvms$disks" >> $OUT
+  tick=$((tick+1))
+  sleep $INTERVAL
+done
+"""
+
+METRICS = ['cpu_busy', 'cpu_iowait', 'mem_used', 'net_rx_mbs', 'net_tx_mbs',
+           'disk_read_mbs', 'disk_write_mbs', 'disk_util_max', 'gc_fraction']
+
+
+def parse_samples(text):
+    """raw sampler csv -> (timestamps, list of dict of raw counters)"""
+    lines = [l for l in text.splitlines() if l.strip()]
+    if not lines:
+        return [], []
+    header = lines[0].split(',')
+    rows = []
+    for line in lines[1:]:
+        fields = line.split(',')
+        if len(fields) != len(header):
+            continue
+        try:
+            rows.append(dict(zip(header, (float(f) for f in fields))))
+        except ValueError:
+            continue
+    return [r['ts'] for r in rows], rows
+
+
+def derive(rows):
+    """counter deltas between consecutive samples -> list of (ts, metric dict)"""
+    out = []
+    for prev, cur in zip(rows, rows[1:]):
+        dt = cur['ts'] - prev['ts']
+        if dt <= 0:
+            continue
+        cpu_keys = ['cpu_user', 'cpu_nice', 'cpu_system', 'cpu_idle', 'cpu_iowait', 'cpu_irq', 'cpu_softirq',
+                    'cpu_steal']
+        total = sum(cur[k] - prev[k] for k in cpu_keys) or 1.0
+        idle = cur['cpu_idle'] - prev['cpu_idle']
+        iowait = cur['cpu_iowait'] - prev['cpu_iowait']
+        disks = sorted({k[5:].rsplit('_', 2)[0] for k in cur if k.startswith('disk_')})
+        read = sum(cur[f'disk_{d}_rd_sec'] - prev[f'disk_{d}_rd_sec'] for d in disks) * 512
+        write = sum(cur[f'disk_{d}_wr_sec'] - prev[f'disk_{d}_wr_sec'] for d in disks) * 512
+        util = max([(cur[f'disk_{d}_io_ms'] - prev[f'disk_{d}_io_ms']) / (dt * 1000.0) for d in disks] or [0.0])
+        gc = max(0.0, cur['gc_s'] - prev['gc_s'])
+        out.append((cur['ts'], {
+            'cpu_busy': 1.0 - (idle + iowait) / total,
+            'cpu_iowait': iowait / total,
+            'mem_used': 1.0 - cur['mem_avail_kb'] / (cur['mem_total_kb'] or 1.0),
+            'net_rx_mbs': (cur['net_rx'] - prev['net_rx']) / dt / 1048576.0,
+            'net_tx_mbs': (cur['net_tx'] - prev['net_tx']) / dt / 1048576.0,
+            'disk_read_mbs': read / dt / 1048576.0,
+            'disk_write_mbs': write / dt / 1048576.0,
+            'disk_util_max': min(1.0, util),
+            'gc_fraction': gc / dt / max(cur['gc_jvms'], 1.0),
+        }))
+    return out
+
+
+def align(node_series, step=1.0):
+    """
+    node_series: node -> list of (ts, metric dict)
+    Put every node on one timeline of `step` second buckets starting at the earliest sample,
+    the last sample of a bucket wins and empty buckets are NaN.
+    """
+    starts = [s[0][0] for s in node_series.values() if s]
+    ends = [s[-1][0] for s in node_series.values() if s]
+    if not starts:
+        return {'start': 0.0, 'step': step, 'length': 0, 'nodes': {}}
+    start = min(starts)
+    length = int(math.floor((max(ends) - start) / step)) + 1
+    nodes = {}
+    for node, series in node_series.items():
+        columns = {m: array('f', [float('nan')]) * length for m in METRICS}
+        for ts, metrics in series:
+            i = int((ts - start) / step)
+            for m in METRICS:
+                columns[m][i] = metrics[m]
+        nodes[node] = columns
+    return {'start': start, 'step': step, 'length': length, 'nodes': nodes}
+
+
+def write_timeline(path, timeline):
+    """columnar file: magic, json header, then one zlib compressed float32 column per node and metric"""
+    header = {'start': timeline['start'], 'step': timeline['step'], 'length': timeline['length'],
+              'nodes': sorted(timeline['nodes']), 'metrics': METRICS}
+    header_bytes = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        for node in header['nodes']:
+            for m in METRICS:
+                column = timeline['nodes'][node][m]
+                data = zlib.compress(column.tobytes() if sys.byteorder == 'little'
+                                     else _byteswapped(column).tobytes(), 6)
+                f.write(struct.pack('<I', len(data)))
+                f.write(data)
+
+
+def _byteswapped(column):
+    swapped = array('f', column)
+    swapped.byteswap()
+    return swapped
+
+
+def read_timeline(path):
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, f"{path} is not a telemetry file"
+        header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]).decode('utf-8'))
+        nodes = {}
+        for node in header['nodes']:
+            nodes[node] = {}
+            for m in header['metrics']:
+                column = array('f')
+                column.frombytes(zlib.decompress(f.read(struct.unpack('<I', f.read(4))[0])))
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                nodes[node][m] = column
+    return {'start': header['start'], 'step': header['step'], 'length': header['length'], 'nodes': nodes}
+
+
+def _mean(values):
+    values = [v for v in values if not math.isnan(v)]
+    return sum(values) / len(values) if values else None
+
+
+def summarize_phase(timeline, begin, end, nic_mbs=1192.0):
+    """
+    Average every metric per node over [begin, end), then report the cluster mean, the busiest
+    node and the bottleneck: the resource closest to saturation.
+    """
+    lo = max(0, int((begin - timeline['start']) / timeline['step']))
+    hi = min(timeline['length'], int(math.ceil((end - timeline['start']) / timeline['step'])))
+    per_node = {}
+    for node, columns in timeline['nodes'].items():
+        per_node[node] = {m: _mean(columns[m][lo:hi]) for m in METRICS}
+    metrics = {}
+    for m in METRICS:
+        values = [(v[m], node) for node, v in per_node.items() if v[m] is not None]
+        if values:
+            top = max(values)
+            metrics[m] = {'mean': sum(v for v, _ in values) / len(values), 'max': top[0], 'max_node': top[1]}
+    if not metrics:
+        return {'bottleneck': 'unknown', 'metrics': {}, 'samples': 0}
+
+    def peak(m):
+        return metrics.get(m, {}).get('max') or 0.0
+
+    # 各资源的饱和度, 取最高的一个作为瓶颈
+    pressure = {
+        'cpu': peak('cpu_busy'),
+        'disk': max(peak('disk_util_max'), peak('cpu_iowait') * 2),
+        'network': max(peak('net_rx_mbs'), peak('net_tx_mbs')) / nic_mbs,
+        'memory': peak('mem_used') if peak('mem_used') > 0.9 else 0.0,
+        'gc': peak('gc_fraction') * 5,
+    }
+    bottleneck, level = max(pressure.items(), key=lambda x: x[1])
+    if level < 0.6:
+        bottleneck = 'none (latency/scheduling bound)'
+    return {'bottleneck': bottleneck, 'pressure': pressure, 'metrics': metrics, 'samples': hi - lo}
+
+
+def format_phase_summary(name, summary):
+    lines = [f"{name}: bottleneck {summary['bottleneck']} ({summary['samples']} samples)"]
+    for m, v in summary['metrics'].items():
+        lines.append(f"    {m:<16} mean {v['mean']:>9.3f}  max {v['max']:>9.3f} on {v['max_node']}")
+    return "\n".join(lines) + "\n"
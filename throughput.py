@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import random
+
+import benchstats
+
+# spark-sql-perf 的 TPC-DS v2.4 查询集, "all" 展开成这个列表后再打乱
+TPCDS_QUERIES = [f"q{i}" for i in range(1, 100) if i not in (14, 23, 24, 39)] + \
+                ['q14a', 'q14b', 'q23a', 'q23b', 'q24a', 'q24b', 'q39a', 'q39b']
+TPCDS_QUERIES.sort(key=benchstats.query_sort_key)
+
+
+def query_list(queries):
+    if queries == 'all':
+        return list(TPCDS_QUERIES)
+    return [q.strip() for q in queries.split(',') if q.strip()]
+
+
+def stream_orders(queries, streams, seed=0):
+    """
+    One permutation of the query list per stream, like the throughput test of the TPC-DS
+    spec. The orders depend only on seed and the stream number so reruns are comparable.
+    """
+    orders = []
+    for stream in range(streams):
+        order = list(queries)
+        random.Random(f"{seed}-{stream}").shuffle(order)
+        orders.append(order)
+    return orders
+
+
+def summarize(streams, elapsed, power=None):
+    """
+    streams: list of dict stream, seconds, samples (benchstats samples), error
+    elapsed: wall time from the first submit to the last stream finishing
+    power: per query summary of the single stream run, for the slowdown under concurrency
+    Returns:
+    dict with the per query summary over all streams, queries per hour and the per stream results
+    """
+    samples = [s for stream in streams for s in stream['samples']]
+    summary = benchstats.summarize(samples)
+    completed = sum(1 for _, seconds in samples if seconds is not None)
+    summary.update({'streams': [{k: v for k, v in stream.items() if k != 'samples'} for stream in streams],
+                    'elapsed_seconds': elapsed,
+                    'completed_queries': completed,
+                    'queries_per_hour': completed * 3600.0 / elapsed if elapsed > 0 else None})
+    if power:
+        slowdown = {}
+        for name, q in summary['queries'].items():
+            base = power['queries'].get(name, {}).get('median')
+            if base and q['median'] is not None:
+                slowdown[name] = q['median'] / base
+        summary['slowdown'] = slowdown
+        summary['slowdown_geomean'] = benchstats.geomean(list(slowdown.values()))
+    return summary
+
+
+def format_throughput(summary):
+    lines = [f"{len(summary['streams'])} streams, {summary['completed_queries']} queries in "
+             f"{summary['elapsed_seconds']:.1f} s"
+             + (f", {summary['queries_per_hour']:.1f} queries per hour" if summary['queries_per_hour'] else "")]
+    lines.append(f"{'stream':>6}{'seconds':>10}{'queries':>9}  status")
+    for stream in summary['streams']:
+        lines.append(f"{stream['stream']:>6}{stream['seconds']:>10.1f}{stream['queries']:>9}  "
+                     + (f"FAILED {stream['error']}" if stream.get('error') else "ok"))
+    if summary.get('slowdown_geomean'):
+        lines.append(f"median query time vs single stream: geomean {summary['slowdown_geomean']:.2f}x")
+        worst = sorted(summary['slowdown'].items(), key=lambda x: -x[1])[:10]
+        lines.append("most slowed down: " + ", ".join(f"{name} {s:.2f}x" for name, s in worst))
+    return "\n".join(lines) + "\n" + benchstats.format_summary(summary)
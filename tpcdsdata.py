@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import json
+import re
+import time
+
+MANIFEST_NAME = "_fastmr_manifest.json"
+
+# 事实表按日期列分区, 与 spark-sql-perf 的做法一致
+FACT_PARTITIONS = {
+    'store_sales': 'ss_sold_date_sk',
+    'store_returns': 'sr_returned_date_sk',
+    'catalog_sales': 'cs_sold_date_sk',
+    'catalog_returns': 'cr_returned_date_sk',
+    'web_sales': 'ws_sold_date_sk',
+    'web_returns': 'wr_returned_date_sk',
+    'inventory': 'inv_date_sk',
+}
+
+
+def make_manifest(scale_factor, data_format, partitioned, generator, tables=None, compression=None):
+    """partitioned is None when the generator decides the layout itself, compression None for the default codec"""
+    return {'scale_factor': str(scale_factor),
+            'format': data_format,
+            'compression': compression,
+            'partitioned': partitioned,
+            'generator': generator,
+            'tables': sorted(tables or []),
+            'created': time.time()}
+
+
+def manifest_matches(manifest, wanted):
+    if not manifest:
+        return False
+    return all(manifest.get(k) == wanted.get(k)
+               for k in ('scale_factor', 'format', 'compression', 'partitioned', 'generator'))
+
+
+def read_manifest(master, location):
+    out = master.run(f"hadoop fs -cat {location}/{MANIFEST_NAME} 2>/dev/null || true").strip()
+    if not out.startswith('{'):
+        return None
+    try:
+        return json.loads(out)
+    except ValueError:
+        return None
+
+
+def write_manifest(master, location, manifest):
+    text = json.dumps(manifest, sort_keys=True).replace("'", "'\\''")
+    master.run(f"echo '{text}' | hadoop fs -put -f - {location}/{MANIFEST_NAME}")
+
+
+def assign_chunks(task_cores, chunks_per_core=1):
+    """
+    Split dsdgen -PARALLEL work over the nodes in proportion to their cores.
+    Returns:
+    (parallel, list of child index ranges per node), child indexes start at 1
+    """
+    counts = [max(1, int(c * chunks_per_core)) for c in task_cores]
+    parallel = max(2, sum(counts))
+    ranges = []
+    start = 1
+    for count in counts:
+        end = min(parallel, start + count - 1)
+        ranges.append(range(start, end + 1))
+        start = end + 1
+    return parallel, ranges
+
+
+def dsdgen_chunk_cmd(tools_dir, scale_factor, parallel, children, local_dir, raw_location):
+    """
+    Generate the given children on one node in parallel, then put every chunk into
+    raw_location/<table>/ on HDFS and drop the local copy. The command fails when any
+    dsdgen child or any put fails, so a partial dataset never gets a manifest.
+    """
+    first, last = children[0], children[-1]
+    # 空的 wait 总是返回 0, 逐个 wait 每个 pid 才拿得到退出码
+    return (f"rm -rf {local_dir} && mkdir -p {local_dir} && cd {tools_dir} && pids='' && "
+            f"for k in $(seq {first} {last}); do "
+            f"./dsdgen -SCALE {scale_factor} -PARALLEL {parallel} -CHILD $k -DIR {local_dir} -FORCE Y -QUIET Y & "
+            f"pids=\"$pids $!\"; done; failed=0; for p in $pids; do wait $p || failed=1; done; "
+            f"test $failed -eq 0 && cd {local_dir} && "
+            f"for f in *.dat; do t=${{f%_*_*.dat}}; "
+            f"{{ hadoop fs -mkdir -p {raw_location}/$t && hadoop fs -put -f $f {raw_location}/$t/ && rm -f $f; }} "
+            f"|| failed=1; done; test $failed -eq 0")
+
+
+_TYPE_MAP = [
+    (re.compile(r'^(integer|int)$'), 'INT'),
+    (re.compile(r'^identifier$'), 'BIGINT'),
+    (re.compile(r'^(char|varchar)\s*\(\s*\d+\s*\)$'), 'STRING'),
+    (re.compile(r'^decimal\s*\(\s*\d+\s*,\s*\d+\s*\)$'), None),
+    (re.compile(r'^date$'), 'DATE'),
+    (re.compile(r'^time$'), 'STRING'),
+]
+
+
+def parse_ddl(ddl):
+    """
+    Parse tpcds-kit tools/tpcds.sql.
+    Returns:
+    dict table -> list of (column, spark sql type)
+    """
+    tables = {}
+    for match in re.finditer(r'create\s+table\s+(\w+)\s*\((.*?)\)\s*;', ddl, re.S | re.I):
+        table, body = match.group(1).lower(), match.group(2)
+        columns = []
+        for line in body.splitlines():
+            line = line.strip().rstrip(',')
+            if not line or line.lower().startswith('primary key'):
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                continue
+            column = parts[0].lower()
+            raw_type = re.sub(r'\s+not\s+null.*$|\s+null.*$', '', parts[1].strip(), flags=re.I).lower()
+            spark_type = raw_type.upper()
+            for pattern, mapped in _TYPE_MAP:
+                if pattern.match(raw_type):
+                    spark_type = mapped or raw_type.upper().replace(' ', '')
+                    break
+            columns.append((column, spark_type))
+        tables[table] = columns
+    return tables
+
+
+def conversion_sql(tables, database, raw_location, location, data_format='parquet', compression=None,
+                   partitioned=False):
+    """spark-sql script that turns the '|' separated raw chunks into format tables under location"""
+    lines = [f"CREATE DATABASE IF NOT EXISTS {database};", f"USE {database};"]
+    if compression:
+        lines.append(f"SET spark.sql.{data_format}.compression.codec={compression};")
+    for table, columns in sorted(tables.items()):
+        schema = ", ".join(f"{c} {t}" for c, t in columns)
+        names = [c for c, _ in columns]
+        partition = FACT_PARTITIONS.get(table) if partitioned else None
+        if partition:
+            # 分区列放到最后
+            names = [c for c in names if c != partition] + [partition]
+        lines.append(f"CREATE OR REPLACE TEMPORARY VIEW {table}_raw ({schema}) USING csv "
+                     f"OPTIONS (path '{raw_location}/{table}', sep '|', mode 'PERMISSIVE');")
+        lines.append(f"DROP TABLE IF EXISTS {table};")
+        lines.append(f"CREATE TABLE {table} USING {data_format} "
+                     + (f"PARTITIONED BY ({partition}) " if partition else "")
+                     + f"LOCATION '{location}/{table}' AS SELECT {', '.join(names)} FROM {table}_raw;")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 所有 span 都记在进程内, 结束时导出一次
+_lock = threading.Lock()
+_spans = []
+
+
+@contextmanager
+def span(name, cat='mracc', lane=None, **args):
+    """
+    Record the wall time of the enclosed block. lane is the row the span is drawn on, the
+    current thread by default; remote operations use the task name.
+    """
+    record = {'name': name, 'cat': cat, 'lane': lane or threading.current_thread().name,
+              'start': time.time(), 'args': args}
+    try:
+        yield record['args']
+    except BaseException as e:
+        record['args']['error'] = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        record['end'] = time.time()
+        with _lock:
+            _spans.append(record)
+
+
+def traced(cat='phase'):
+    """decorator: one span per call of a mracc phase"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(fn.__name__, cat):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def raw(method):
+    """the uninstrumented method, for callers that poll and trace the whole operation themselves"""
+    return getattr(method, '__wrapped__', method)
+
+
+def local_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _short(text, width=80):
+    text = " ".join(str(text).split())
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def _wrap(obj, lane):
+    for method in ('run', 'upload', 'setup'):
+        fn = getattr(obj, method, None)
+        if fn is None or hasattr(fn, '__wrapped__'):
+            continue
+
+        def make(fn, method):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if method == 'run':
+                    cmd = args[0] if args else kwargs.get('cmd', '')
+                    tags = {'task': lane, 'cmd': str(cmd)[:500]}
+                    name = f"run {_short(cmd)}"
+                elif method == 'upload':
+                    local = args[0] if args else kwargs.get('local_fn', '')
+                    remote = args[1] if len(args) > 1 else kwargs.get('remote_fn', '')
+                    tags = {'task': lane, 'local': str(local), 'remote': str(remote),
+                            'bytes': local_bytes(local) if os.path.exists(str(local)) else None}
+                    name = f"upload {os.path.basename(str(local).rstrip('/'))}"
+                else:
+                    tags = {'task': lane, 'args': str(args)[:300], 'kwargs': str(kwargs)[:300]}
+                    name = f"setup {args[0] if args else ''}"
+                with span(name, cat=method, lane=lane, **tags):
+                    return fn(*args, **kwargs)
+            return wrapper
+
+        setattr(obj, method, make(fn, method))
+
+
+def instrument(job):
+    """trace run/upload/setup of the job and of every task, one lane per task"""
+    _wrap(job, 'job')
+    for task in job.tasks:
+        _wrap(task, task.name)
+    return job
+
+
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+def _pack(records):
+    """
+    Spans of one lane that overlap without nesting (concurrent calls on the same task) go to
+    extra rows, chrome/perfetto only draws properly nested spans on one row.
+    Returns:
+    list of (row index, span)
+    """
+    rows = []  # 每行是一个正在打开的 span 的结束时间栈
+    placed = []
+    for s in sorted(records, key=lambda s: (s['start'], -s['end'])):
+        for i, stack in enumerate(rows):
+            while stack and stack[-1] <= s['start']:
+                stack.pop()
+            if not stack or s['end'] <= stack[-1]:
+                stack.append(s['end'])
+                placed.append((i, s))
+                break
+        else:
+            rows.append([s['end']])
+            placed.append((len(rows) - 1, s))
+    return placed
+
+
+def to_chrome(records, process_name='fastmr'):
+    """chrome trace event format, loads in chrome://tracing and ui.perfetto.dev"""
+    if not records:
+        return {'traceEvents': [], 'displayTimeUnit': 'ms'}
+    origin = min(s['start'] for s in records)
+    by_lane = {}
+    for s in records:
+        by_lane.setdefault(s['lane'], []).append(s)
+    # 主线程和 job 在最上面, 然后是各个节点
+    lanes = sorted(by_lane, key=lambda l: (l != 'MainThread', l != 'job', l))
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': process_name}}]
+    tid = 0
+    for lane in lanes:
+        named = set()
+        base = tid
+        for row, s in _pack(by_lane[lane]):
+            if row not in named:
+                named.add(row)
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': base + row,
+                               'args': {'name': lane if row == 0 else f"{lane} #{row + 1}"}})
+                events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': base + row,
+                               'args': {'sort_index': base + row}})
+            tid = max(tid, base + row + 1)
+            events.append({'name': s['name'], 'cat': s['cat'], 'ph': 'X', 'pid': 1, 'tid': base + row,
+                           'ts': round((s['start'] - origin) * 1e6), 'dur': round((s['end'] - s['start']) * 1e6),
+                           'args': {k: v for k, v in s['args'].items() if v is not None}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome(path, process_name='fastmr'):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(to_chrome(spans(), process_name), f)
+
+
+def format_slowest(records, n=25):
+    """slowest spans and the total time, count and bytes per category"""
+    lines = [f"{'seconds':>9}  {'cat':<8}{'lane':<22}name"]
+    for s in sorted(records, key=lambda s: s['start'] - s['end'])[:n]:
+        flag = "  FAILED" if 'error' in s['args'] else ""
+        lines.append(f"{s['end'] - s['start']:>9.1f}  {s['cat']:<8}{_short(s['lane'], 20):<22}{s['name']}{flag}")
+    totals = {}
+    for s in records:
+        count, seconds, transferred = totals.get(s['cat'], (0, 0.0, 0))
+        totals[s['cat']] = (count + 1, seconds + s['end'] - s['start'], transferred + (s['args'].get('bytes') or 0))
+    lines.append(f"{'cat':<10}{'spans':>7}{'seconds':>11}{'MB':>10}")
+    for cat, (count, seconds, transferred) in sorted(totals.items(), key=lambda x: -x[1][1]):
+        lines.append(f"{cat:<10}{count:>7}{seconds:>11.1f}{transferred / 1048576.0:>10.1f}")
+    return "\n".join(lines) + "\n"
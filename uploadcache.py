@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import hashlib
+import os
+import shlex
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# 批量上传时 tar 包在节点上的暂存目录
+STAGING_DIR = "/root/.fastmr"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_hashes(local_dir):
+    """relative path -> sha256 of every regular file below local_dir"""
+    hashes = {}
+    for root, _, files in os.walk(local_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                hashes[os.path.relpath(path, local_dir).replace(os.sep, '/')] = file_hash(path)
+    return hashes
+
+
+def remote_hashes(task, remote_dir, relpaths):
+    """
+    relative path -> sha256 of the files as they are on the node right now, missing files are
+    left out. Package installs overwrite deployed files, so only the node itself can tell.
+    """
+    if not relpaths:
+        return {}
+    quoted = " ".join(shlex.quote(rel) for rel in relpaths)
+    out = task.run(f"cd {shlex.quote(remote_dir)} 2>/dev/null && sha256sum -- {quoted} 2>/dev/null; true")
+    hashes = {}
+    for line in out.splitlines():
+        fields = line.strip().split(None, 1)
+        if len(fields) == 2 and len(fields[0]) == 64:
+            hashes[fields[1].lstrip('*')] = fields[0]
+    return hashes
+
+
+def make_archive(local_dir, relpaths):
+    fd, archive = tempfile.mkstemp(suffix='.tar.gz', prefix='fastmr-upload-')
+    os.close(fd)
+    with tarfile.open(archive, 'w:gz') as tar:
+        for rel in relpaths:
+            tar.add(os.path.join(local_dir, rel), arcname=rel, recursive=False)
+    return archive
+
+
+def upload_changed(tasks, local_dir, remote_dir, max_workers=16, batch_threshold=2):
+    """
+    Upload local_dir to remote_dir on every task, skipping files whose sha256sum on the node
+    already matches the local file. Changed files are shipped as one tar.gz per distinct
+    change set when there are at least batch_threshold of them.
+    Returns:
+    dict task name -> number of files transferred
+    """
+    if not os.path.isdir(local_dir):
+        raise ValueError(f"upload_changed expects a directory, got {local_dir}")
+    remote_dir = remote_dir.rstrip('/') or '/'
+    local_hashes = dir_hashes(local_dir)
+    max_workers = max(1, min(max_workers, len(tasks)))
+
+    def diff(task):
+        deployed = remote_hashes(task, remote_dir, sorted(local_hashes))
+        return tuple(sorted(rel for rel, h in local_hashes.items() if deployed.get(rel) != h))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        changes = dict(zip([t.name for t in tasks], pool.map(diff, tasks)))
+
+    archives = {}
+    for changed in set(changes.values()):
+        if len(changed) >= batch_threshold:
+            archives[changed] = make_archive(local_dir, changed)
+
+    def push(task):
+        changed = changes[task.name]
+        if not changed:
+            return 0
+        if changed in archives:
+            remote_archive = f"{STAGING_DIR}/{os.path.basename(archives[changed])}"
+            task.run(f"mkdir -p {STAGING_DIR}")
+            task.upload(archives[changed], remote_archive)
+            task.run(f"mkdir -p {remote_dir} && tar -xzf {remote_archive} -C {remote_dir} && rm -f {remote_archive}")
+        else:
+            for rel in changed:
+                remote = f"{remote_dir}/{rel}"
+                task.run(f"mkdir -p {os.path.dirname(remote)}")
+                task.upload(os.path.join(local_dir, rel), remote)
+        return len(changed)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            transferred = dict(zip([t.name for t in tasks], pool.map(push, tasks)))
+    finally:
+        for archive in archives.values():
+            os.remove(archive)
+
+    print(f"upload {local_dir} -> {remote_dir}: {sum(transferred.values())} file(s) sent, "
+          f"{len(local_hashes) * len(tasks) - sum(transferred.values())} unchanged")
+    return transferred